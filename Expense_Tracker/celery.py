@@ -0,0 +1,15 @@
+"""
+Celery app for background work (ledger/tasks.py).
+
+Only needed when EXPORT_JOB_BACKEND = "celery"; start a worker with
+`celery -A Expense_Tracker worker`.
+"""
+import os
+
+from celery import Celery
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'Expense_Tracker.settings')
+
+app = Celery('Expense_Tracker')
+app.config_from_object('django.conf:settings', namespace='CELERY')
+app.autodiscover_tasks()
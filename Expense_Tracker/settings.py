@@ -74,6 +74,7 @@ INSTALLED_APPS = [
     'django.contrib.staticfiles',
     'django.contrib.humanize',
     'ledger',
+    'rest_framework',
     'django_extensions',
     "django.contrib.sites",  # required by allauth
     "allauth",
@@ -85,8 +86,10 @@ INSTALLED_APPS = [
 SITE_ID = 1
 
 MIDDLEWARE = [
+    'ledger.middleware.ProbeMiddleware',  # answers health probes before anything below runs
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',  # WhiteNoise for static files
+    'ledger.middleware.RequestTimingMiddleware',  # Server-Timing header and per-URL stats
     # 'django.contrib.sessions.middleware.SessionMiddleware',
     'ledger.middleware.SeparateSessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -98,11 +101,26 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Health probes answered by ledger.middleware.ProbeMiddleware: "live" never touches
+# the DB, "ready" checks it (result reused for PROBE_READY_TTL seconds)
+PROBE_PATHS = {"/healthz": "live", "/health/": "live", "/readyz": "ready"}
+PROBE_READY_TTL = 5  # seconds
+
+# Per-request DB/view/template timings (ledger/instrumentation.py), sent as a
+# Server-Timing header and summarised per URL name at /perf/ (staff only, per process)
+PERF_INSTRUMENTATION = os.getenv("PERF_INSTRUMENTATION", "True").lower() == "true"
+PERF_STATS_SAMPLES = 500  # most recent requests kept per URL name
+
 ROOT_URLCONF = 'Expense_Tracker.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # Same engine, with render times reported to RequestTimingMiddleware
+        'BACKEND': (
+            'ledger.instrumentation.TimedDjangoTemplates' if PERF_INSTRUMENTATION
+            else 'django.template.backends.django.DjangoTemplates'
+        ),
+        'NAME': 'django',
         'DIRS': [BASE_DIR / 'templates'],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -112,6 +130,7 @@ TEMPLATES = [
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
                 "ledger.context_processors.google_settings",
+                "ledger.context_processors.session_timeout",
             ],
         },
     },
@@ -187,11 +206,79 @@ STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 WHITENOISE_USE_FINDERS = False
 WHITENOISE_AUTOREFRESH = False
 
-# Session lifetime (e.g., 60 minutes) Also change this in middleware.py and base.html
-SESSION_COOKIE_AGE = 60 * 60  # seconds
-SESSION_SAVE_EVERY_REQUEST = True  # extend session on each request
+# The session (and its expiry) is extended whenever IdleSessionTimeoutMiddleware
+# records activity, at most once per SESSION_ACTIVITY_GRANULARITY seconds,
+# rather than rewritten on every request
+SESSION_SAVE_EVERY_REQUEST = False
+SESSION_ACTIVITY_GRANULARITY = 60  # seconds
+SESSION_IDLE_TIMEOUT = 60 * 60  # seconds without activity before IdleSessionTimeoutMiddleware logs out
+# Session lifetime: the idle timeout plus one granularity step, so a session
+# last written up to SESSION_ACTIVITY_GRANULARITY seconds before the latest
+# request outlives the idle deadline; the middleware enforces the timeout
+SESSION_COOKIE_AGE = SESSION_IDLE_TIMEOUT + SESSION_ACTIVITY_GRANULARITY  # seconds
+# Signed record of each request's time and the session's last activity, read
+# by the idle check and the heartbeat endpoint (see ledger/activity.py)
+ACTIVITY_COOKIE_NAME = "ledger_activity"
 SESSION_EXPIRE_AT_BROWSER_CLOSE = False  # optional; keep session until age
 
+# Session storage (see ledger/sessions.py), for both sessionid and admin_sessionid:
+#   "db"        - django_session table only (Django's default engine)
+#   "cached_db" - per-process LRU + shared cache, written through to the DB
+#   "cache"     - per-process LRU + shared cache only
+# Defaults to "cached_db" when REDIS_URL is set. Without Redis the shared cache
+# is per-process locmem, which is only safe with a single process (runserver, tests).
+REDIS_URL = os.getenv("REDIS_URL", "")
+SESSION_CACHE_MODE = os.getenv("SESSION_CACHE_MODE", "cached_db" if REDIS_URL else "db")
+SESSION_ENGINE = (
+    "django.contrib.sessions.backends.db" if SESSION_CACHE_MODE == "db" else "ledger.sessions"
+)
+SESSION_DB_WRITE_THROUGH = SESSION_CACHE_MODE != "cache"
+SESSION_CACHE_ALIAS = "sessions"
+SESSION_LOCAL_CACHE_SIZE = 1000  # sessions kept decoded per process
+SESSION_LOCAL_CACHE_TTL = 2  # seconds a process trusts its copy; bounds cross-process staleness
+
+CACHES = {
+    "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+    "sessions": (
+        {
+            "BACKEND": "django_redis.cache.RedisCache",
+            "LOCATION": REDIS_URL,
+            "OPTIONS": {"CLIENT_CLASS": "django_redis.client.DefaultClient"},
+            "KEY_PREFIX": "et",
+        }
+        if REDIS_URL
+        else {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "sessions"}
+    ),
+}
+
+# Global category/subcategory cache (see ledger/taxonomy.py)
+TAXONOMY_CACHE_ALIAS = "default"  # shared cache layer; None keeps it process-local only
+TAXONOMY_CACHE_TIMEOUT = 300  # seconds a serialized taxonomy is kept in the shared cache
+TAXONOMY_LOCAL_TTL = 5  # seconds a process trusts its copy without re-checking the version (in the DB)
+
+# Background exports (see ledger/jobs.py)
+EXPORT_JOB_BACKEND = os.getenv("EXPORT_JOB_BACKEND", "thread")  # "thread" (in-process pool, no broker) or "celery"
+EXPORT_JOB_WORKERS = 2  # threads in the in-process pool, per web process
+EXPORT_JOB_MAX_ACTIVE = 3  # pending/running jobs allowed per user
+EXPORT_JOB_STALE_MINUTES = 15  # a job with no progress for this long is marked failed
+EXPORT_JOB_RETENTION_HOURS = 24  # prune_export_jobs deletes finished jobs and files after this
+EXPORT_ROOT = Path(os.getenv("EXPORT_ROOT", BASE_DIR / "exports"))  # where finished artifacts are written
+CELERY_BROKER_URL = os.getenv("CELERY_BROKER_URL", "")
+CELERY_TASK_IGNORE_RESULT = True
+
+# REST API (ledger/api.py): session auth for the browser, basic auth for scripts
+REST_FRAMEWORK = {
+    "DEFAULT_AUTHENTICATION_CLASSES": [
+        "rest_framework.authentication.SessionAuthentication",
+        "rest_framework.authentication.BasicAuthentication",
+    ],
+    "DEFAULT_PERMISSION_CLASSES": ["rest_framework.permissions.IsAuthenticated"],
+    "DEFAULT_VERSIONING_CLASS": "rest_framework.versioning.URLPathVersioning",
+    "ALLOWED_VERSIONS": ["v1"],
+    "DEFAULT_VERSION": "v1",
+}
+SYNC_TOMBSTONE_RETENTION_DAYS = 90  # prune_sync_tombstones drops older deletion records
+
 GOOGLE_CLIENT_ID = os.getenv("GOOGLE_CLIENT_ID", default="")
 GOOGLE_CLIENT_SECRET = os.getenv("GOOGLE_CLIENT_SECRET", default="")
 
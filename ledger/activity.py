@@ -0,0 +1,101 @@
+"""
+Signed activity tokens for the idle-timeout heartbeat.
+
+IdleSessionTimeoutMiddleware stores `last_activity` in the session, but only
+once per SESSION_ACTIVITY_GRANULARITY seconds. On every request it also sets
+the ACTIVITY_COOKIE_NAME cookie to a signed token of (user id, session key
+digest, the time of that request, the value stored in the session), which
+costs no session write. The middleware's idle check uses the later of the
+two times, so the coarse session value never ends a session early. The
+heartbeat view reads the cookie instead of the session, so checking how
+much idle time is left costs no session read and no auth_user query. The
+cookie is shared by all of a browser's tabs, so activity in one tab is seen
+by the others.
+
+A token is only good for the session it was issued with and for
+idle_timeout() seconds after it was signed, and it only records requests
+this server answered for that session. It is never trusted to extend the
+stored session on its own: that loads the session and checks its user.
+"""
+import time
+from collections import namedtuple
+
+from django.conf import settings
+from django.core import signing
+from django.utils.crypto import salted_hmac
+
+SALT = 'ledger.activity'
+
+# last_activity: the latest request; stored: the session's last_activity then
+State = namedtuple('State', 'user_id last_activity stored')
+
+
+def idle_timeout():
+    """Seconds without activity after which IdleSessionTimeoutMiddleware logs the user out."""
+    return getattr(settings, 'SESSION_IDLE_TIMEOUT', 60 * 60)
+
+
+def cookie_name():
+    return getattr(settings, 'ACTIVITY_COOKIE_NAME', 'ledger_activity')
+
+
+def _session_digest(session_key):
+    return salted_hmac(SALT, session_key or '').hexdigest()[:16]
+
+
+def granularity():
+    """Seconds between writes of `last_activity` to the session."""
+    return getattr(settings, 'SESSION_ACTIVITY_GRANULARITY', 60)
+
+
+def issue(user_id, session_key, last_activity, stored=None):
+    """
+    A signed token recording `last_activity` (epoch seconds) for this user and
+    session, and `stored`, the session's value (defaults to last_activity).
+    """
+    payload = {
+        'u': str(user_id), 's': _session_digest(session_key), 'a': int(last_activity),
+        'w': int(last_activity if stored is None else stored),
+    }
+    return signing.dumps(payload, salt=SALT, compress=False)
+
+
+def read(token, session_key):
+    """State(user id, last_activity, stored) from a valid token for `session_key`, else None."""
+    if not token or not session_key:
+        return None
+    try:
+        payload = signing.loads(token, salt=SALT, max_age=idle_timeout())
+        if payload['s'] != _session_digest(session_key):
+            return None
+        return State(payload['u'], int(payload['a']), int(payload.get('w', payload['a'])))
+    except (signing.BadSignature, KeyError, TypeError, ValueError):
+        return None
+
+
+def remaining(last_activity, now=None):
+    """Whole seconds of idle time left after `last_activity` (never negative)."""
+    now = time.time() if now is None else now
+    return max(0, int(last_activity + idle_timeout() - now))
+
+
+def set_cookie(response, token):
+    response.set_cookie(
+        cookie_name(),
+        token,
+        max_age=idle_timeout(),
+        domain=settings.SESSION_COOKIE_DOMAIN,
+        path=settings.SESSION_COOKIE_PATH,
+        secure=settings.SESSION_COOKIE_SECURE or None,
+        httponly=True,
+        samesite=settings.SESSION_COOKIE_SAMESITE,
+    )
+
+
+def delete_cookie(response):
+    response.delete_cookie(
+        cookie_name(),
+        path=settings.SESSION_COOKIE_PATH,
+        domain=settings.SESSION_COOKIE_DOMAIN,
+        samesite=settings.SESSION_COOKIE_SAMESITE,
+    )
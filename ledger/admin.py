@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Category, Subcategory, Expense
+from .models import Category, Subcategory, Expense, ExpenseDailyTotal, ExpenseMonthlyTotal, ExportJob
 
 # Register your models here.
 
@@ -20,3 +20,21 @@ class ExpenseAdmin(admin.ModelAdmin):
     list_filter = ('user', 'category', 'subcategory', 'date')
     search_fields = ('description',)
     date_hierarchy = 'date'
+
+@admin.register(ExpenseDailyTotal)
+class ExpenseDailyTotalAdmin(admin.ModelAdmin):
+    list_display = ('date', 'user', 'category', 'subcategory', 'total', 'count')
+    list_filter = ('user', 'category')
+    date_hierarchy = 'date'
+
+@admin.register(ExpenseMonthlyTotal)
+class ExpenseMonthlyTotalAdmin(admin.ModelAdmin):
+    list_display = ('month', 'user', 'category', 'subcategory', 'total', 'count')
+    list_filter = ('user', 'category')
+    date_hierarchy = 'month'
+
+@admin.register(ExportJob)
+class ExportJobAdmin(admin.ModelAdmin):
+    list_display = ('created_at', 'user', 'format', 'status', 'rows_written', 'rows_total', 'size')
+    list_filter = ('status', 'format')
+    readonly_fields = ('created_at', 'started_at', 'finished_at')
@@ -0,0 +1,151 @@
+"""
+Versioned REST API (/api/v1/).
+
+Expenses are the signed-in user's own, with full CRUD; writes go through
+Expense.save()/delete(), so the rollups stay in step as they do for the
+HTML views. Categories and subcategories are global and read-only here.
+List filters: `start` / `end` (inclusive, YYYY-MM-DD), `category` and
+`subcategory` (ids).
+
+POST /api/v1/expenses/bulk/ applies up to bulk.MAX_OPERATIONS creates,
+updates and deletes in one transaction (see ledger.bulk).
+
+GET /api/v1/sync/?since=<token> returns what changed since a previous sync
+(see ledger.sync).
+"""
+from datetime import date
+
+from django.db import IntegrityError
+from rest_framework import status, viewsets
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+from rest_framework.views import APIView
+
+from . import bulk, sync
+from .models import Category, Expense, Subcategory
+from .pagination import KeysetPagination
+from .serializers import CategorySerializer, ExpenseSerializer, SubcategorySerializer
+
+
+def _date_param(params, name):
+    value = params.get(name)
+    if not value:
+        return None
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise ValidationError({name: "Expected a date as YYYY-MM-DD."})
+
+
+def _id_param(params, name):
+    value = params.get(name)
+    if not value:
+        return None
+    if not value.isdigit():
+        raise ValidationError({name: "Expected an integer id."})
+    return int(value)
+
+
+class ExpenseViewSet(viewsets.ModelViewSet):
+    serializer_class = ExpenseSerializer
+    pagination_class = KeysetPagination
+
+    def get_queryset(self):
+        queryset = (
+            Expense.objects
+            .filter(user=self.request.user)
+            .select_related('category', 'subcategory')
+        )
+        if self.action != 'list':
+            return queryset
+
+        params = self.request.query_params
+        start = _date_param(params, 'start')
+        end = _date_param(params, 'end')
+        if start and end and start > end:
+            raise ValidationError({'end': "End date is before start date."})
+        if start:
+            queryset = queryset.filter(date__gte=start)
+        if end:
+            queryset = queryset.filter(date__lte=end)
+        category_id = _id_param(params, 'category')
+        if category_id is not None:
+            queryset = queryset.filter(category_id=category_id)
+        subcategory_id = _id_param(params, 'subcategory')
+        if subcategory_id is not None:
+            queryset = queryset.filter(subcategory_id=subcategory_id)
+        return queryset
+
+    def perform_create(self, serializer):
+        serializer.save(user=self.request.user)
+
+    @action(detail=False, methods=['post'])
+    def bulk(self, request, version=None):
+        """
+        Body: {"operations": [{"op": "create"|"update"|"delete", "id": ..., "data": {...}}, ...]}.
+        All-or-nothing: 200 with per-item results when applied, 400 with
+        per-item errors (and nothing written) otherwise.
+        """
+        operations = request.data.get('operations') if isinstance(request.data, dict) else None
+        if not isinstance(operations, list) or not operations:
+            raise ValidationError({'operations': "Expected a non-empty list."})
+        if len(operations) > bulk.MAX_OPERATIONS:
+            raise ValidationError({'operations': f"At most {bulk.MAX_OPERATIONS} operations per request."})
+        try:
+            result = bulk.apply(request.user, operations)
+        except IntegrityError as e:
+            # e.g. a category deleted between validation and the write
+            return Response({'applied': False, 'detail': f"Rejected by the database: {e}"},
+                            status=status.HTTP_409_CONFLICT)
+        return Response(result.as_dict(), status=status.HTTP_200_OK if result.applied else status.HTTP_400_BAD_REQUEST)
+
+
+class CategoryViewSet(viewsets.ReadOnlyModelViewSet):
+    queryset = Category.objects.all()
+    serializer_class = CategorySerializer
+    pagination_class = None
+
+
+class SubcategoryViewSet(viewsets.ReadOnlyModelViewSet):
+    serializer_class = SubcategorySerializer
+    pagination_class = None
+
+    def get_queryset(self):
+        queryset = Subcategory.objects.select_related('category')
+        category_id = _id_param(self.request.query_params, 'category')
+        if category_id is not None:
+            queryset = queryset.filter(category_id=category_id)
+        return queryset
+
+
+class SyncView(APIView):
+    """
+    Changed and deleted expenses since `since` (a token from an earlier
+    response; omit it for a full sync). Keep requesting `next` while `more`
+    is true, then store `token` for the next sync.
+    """
+
+    def get(self, request, version=None):
+        try:
+            page_size = min(max(int(request.query_params.get('page_size', sync.PAGE_SIZE)), 1), sync.MAX_PAGE_SIZE)
+        except ValueError:
+            raise ValidationError({'page_size': "Expected an integer."})
+        try:
+            page = sync.changes(request.user, request.query_params.get('since') or None, page_size)
+        except ValueError as e:
+            raise ValidationError({'since': str(e)})
+        except sync.TokenExpired as e:
+            return Response({'detail': str(e)}, status=status.HTTP_410_GONE)
+
+        next_url = None
+        if page.more:
+            next_url = replace_query_param(request.build_absolute_uri(), 'since', page.token)
+        return Response({
+            'changed': ExpenseSerializer(page.changed, many=True).data,
+            'deleted': page.deleted,
+            'more': page.more,
+            'token': page.token,
+            'next': next_url,
+        })
@@ -0,0 +1,320 @@
+"""
+Full-account backup and restore as gzip-compressed NDJSON.
+
+A backup is a series of gzip members (a valid .gz file when concatenated),
+each holding whole lines:
+
+    {"type": "header", "format": FORMAT, "version": 1, "user": ..., "created_at": ...}
+    {"type": "category", "id": 3, "name": "Food & Dining"}
+    {"type": "subcategory", "id": 12, "name": "Groceries", "category_id": 3}
+    {"type": "expense", "id": 981, "date": "2025-01-31", "created_at": ..., "amount": "12.50", ...}
+    {"type": "cursor", "after": "<date>|<created_at>|<id>"}
+    ...
+    {"type": "end"}
+
+Expenses are read in pages with a keyset cursor on (date, created_at, id),
+so each page is one indexed range query and nothing is held across pages.
+Every page is its own member and ends with a cursor line: an interrupted
+backup is resumed from the last complete member (`resume_point()`), and an
+HTTP client can continue with `?after=<cursor>`. Categories and
+subcategories are written the first time a page references them.
+
+Restore remaps category/subcategory ids by name (creating any that are
+missing), inserts expenses with bulk_create in one transaction per batch
+together with their rollup deltas, and can skip everything up to a cursor to
+continue an interrupted restore. Restored rows get a new created_at.
+"""
+import gzip
+import json
+import zlib
+from datetime import date, datetime
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import rollups, versions
+from .models import Category, Expense, Subcategory
+from .taxonomy import get_taxonomy
+
+FORMAT = 'expense-tracker-backup'
+VERSION = 1
+
+PAGE_SIZE = 5000
+RESTORE_BATCH_SIZE = 1000
+
+_READ_SIZE = 64 * 1024
+
+
+def cursor_token(day, created_at, pk):
+    return f"{day.isoformat()}|{created_at.isoformat()}|{pk}"
+
+
+def parse_cursor(token):
+    """(date, created_at, id) from a cursor token; raises ValueError if malformed."""
+    try:
+        day, created_at, pk = token.split('|')
+        return date.fromisoformat(day), datetime.fromisoformat(created_at), int(pk)
+    except (AttributeError, ValueError):
+        raise ValueError("invalid cursor.")
+
+
+def _line(obj):
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':')) + '\n'
+
+
+def _member(lines):
+    return gzip.compress(''.join(lines).encode('utf-8'), mtime=0)
+
+
+def _after(qs, cursor):
+    day, created_at, pk = cursor
+    return qs.filter(
+        Q(date__gt=day)
+        | Q(date=day, created_at__gt=created_at)
+        | Q(date=day, created_at=created_at, id__gt=pk)
+    )
+
+
+def backup_stream(user, after=None, page_size=PAGE_SIZE):
+    """
+    Yield the backup of `user`'s expenses as gzip members. A fresh backup
+    starts with a header; with `after` (a parsed cursor) it continues a
+    previous stream instead.
+    """
+    taxonomy = get_taxonomy()
+    written_categories, written_subcategories = set(), set()
+
+    if after is None:
+        yield _member([_line({
+            'type': 'header',
+            'format': FORMAT,
+            'version': VERSION,
+            'user': user.get_username(),
+            'created_at': timezone.now().isoformat(),
+        })])
+
+    base = (
+        Expense.objects.filter(user=user)
+        .order_by('date', 'created_at', 'id')
+        .values_list('id', 'date', 'created_at', 'category_id', 'subcategory_id',
+                     'amount', 'description', 'fingerprint')
+    )
+    cursor = after
+    while True:
+        page = list((base if cursor is None else _after(base, cursor))[:page_size])
+        if not page:
+            break
+        lines = []
+        for pk, day, created_at, category_id, subcategory_id, amount, description, fingerprint in page:
+            if category_id is not None and category_id not in written_categories:
+                written_categories.add(category_id)
+                lines.append(_line({
+                    'type': 'category', 'id': category_id,
+                    'name': taxonomy.category_names.get(category_id)
+                    or Category.objects.get(pk=category_id).name,
+                }))
+            if subcategory_id is not None and subcategory_id not in written_subcategories:
+                written_subcategories.add(subcategory_id)
+                name = taxonomy.subcategory_names.get(subcategory_id)
+                parent = taxonomy.subcategory_category_map.get(subcategory_id)
+                if name is None:  # created after the taxonomy snapshot was taken
+                    sub = Subcategory.objects.get(pk=subcategory_id)
+                    name, parent = sub.name, sub.category_id
+                lines.append(_line({
+                    'type': 'subcategory', 'id': subcategory_id, 'name': name, 'category_id': parent,
+                }))
+            lines.append(_line({
+                'type': 'expense',
+                'id': pk,
+                'date': day.isoformat(),
+                'created_at': created_at.isoformat(),
+                'category_id': category_id,
+                'subcategory_id': subcategory_id,
+                'amount': str(amount),
+                'description': description,
+                'fingerprint': fingerprint,
+            }))
+        last = page[-1]
+        cursor = (last[1], last[2], last[0])
+        lines.append(_line({'type': 'cursor', 'after': cursor_token(*cursor)}))
+        yield _member(lines)
+        if len(page) < page_size:
+            break
+
+    yield _member([_line({'type': 'end'})])
+
+
+def resume_point(fileobj):
+    """
+    Inspect a possibly truncated backup file.
+
+    Returns (offset, cursor_token, finished): the byte offset just past the
+    last complete member (truncate there and append), the cursor that member
+    ended with (None if only the header made it) and whether the end marker
+    was written. A file without a complete header returns (0, None, False).
+    """
+    offset = consumed = 0
+    cursor, finished, seen_header = None, False, False
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    tail = b''
+    try:
+        while True:
+            data = fileobj.read(_READ_SIZE)
+            if not data:
+                break
+            while data:
+                tail = (tail + decompressor.decompress(data))[-4096:]
+                if not decompressor.eof:
+                    consumed += len(data)
+                    break
+                consumed += len(data) - len(decompressor.unused_data)
+                data = decompressor.unused_data
+                # A member always ends with a complete line
+                last = json.loads(tail.rstrip(b'\n').rsplit(b'\n', 1)[-1])
+                if last.get('type') == 'header':
+                    seen_header = True
+                elif last.get('type') == 'cursor':
+                    cursor = last['after']
+                elif last.get('type') == 'end':
+                    finished = True
+                offset = consumed
+                decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+                tail = b''
+    except (zlib.error, ValueError):
+        pass  # corrupt or partial tail; everything up to `offset` is good
+    if not seen_header:
+        return 0, None, False
+    return offset, cursor, finished
+
+
+class RestoreResult:
+    def __init__(self):
+        self.expenses = 0
+        self.skipped = 0
+        self.categories_created = 0
+        self.subcategories_created = 0
+        self.cursor = None  # token of the last committed expense
+
+    def summary(self):
+        text = f"{self.expenses} expenses restored"
+        if self.skipped:
+            text += f", {self.skipped} skipped before the resume cursor"
+        if self.categories_created or self.subcategories_created:
+            text += (
+                f", created {self.categories_created} categories and "
+                f"{self.subcategories_created} subcategories"
+            )
+        return text
+
+
+class _TaxonomyMap:
+    """Backup category/subcategory ids -> local ids, matched by name and created if missing."""
+
+    def __init__(self, result):
+        taxonomy = get_taxonomy()
+        self.result = result
+        self.local_categories = {name: cid for cid, name in taxonomy.categories}
+        self.local_subcategories = {(cid, name): sid for sid, name, cid in taxonomy.subcategories}
+        self.categories = {}
+        self.subcategories = {}
+
+    def add_category(self, backup_id, name):
+        local_id = self.local_categories.get(name)
+        if local_id is None:
+            category, created = Category.objects.get_or_create(name=name)
+            local_id = self.local_categories[name] = category.pk
+            self.result.categories_created += created
+        self.categories[backup_id] = local_id
+
+    def add_subcategory(self, backup_id, name, backup_category_id):
+        category_id = self.categories.get(backup_category_id)
+        if category_id is None:
+            raise ValueError(f"subcategory {name!r} refers to an unknown category.")
+        local_id = self.local_subcategories.get((category_id, name))
+        if local_id is None:
+            subcategory, created = Subcategory.objects.get_or_create(category_id=category_id, name=name)
+            local_id = self.local_subcategories[(category_id, name)] = subcategory.pk
+            self.result.subcategories_created += created
+        self.subcategories[backup_id] = local_id
+
+
+def _flush(batch, result):
+    if not batch:
+        return
+    expenses = [expense for expense, _ in batch]
+    with transaction.atomic():
+        version = versions.bump([expenses[0].user_id])[expenses[0].user_id]
+        for expense in expenses:
+            expense.sync_version = version
+        Expense.objects.bulk_create(expenses, batch_size=len(expenses))
+        rollups.apply_deltas(rollups.additions(expenses))
+    result.expenses += len(expenses)
+    result.cursor = batch[-1][1]
+
+
+def restore_stream(user, fileobj, after=None, batch_size=RESTORE_BATCH_SIZE, progress=None):
+    """
+    Restore a backup (binary, gzip-compressed) into `user`'s account.
+
+    Expense lines at or before `after` (a parsed cursor, for resuming) are
+    skipped. `progress(result)` is called after each committed batch.
+    Raises ValueError on a malformed file; batches committed before the
+    error stay, and result.cursor tells where to resume.
+    """
+    result = RestoreResult()
+    mapping = _TaxonomyMap(result)
+    batch = []
+    with gzip.open(fileobj, 'rt', encoding='utf-8') as lines:
+        try:
+            for number, line in enumerate(lines, start=1):
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                kind = record.get('type')
+                if kind == 'header':
+                    if record.get('format') != FORMAT or record.get('version') != VERSION:
+                        raise ValueError("not a supported backup file.")
+                elif kind == 'category':
+                    mapping.add_category(record['id'], record['name'])
+                elif kind == 'subcategory':
+                    mapping.add_subcategory(record['id'], record['name'], record['category_id'])
+                elif kind == 'expense':
+                    day = date.fromisoformat(record['date'])
+                    created_at = datetime.fromisoformat(record['created_at'])
+                    if after is not None and (day, created_at, record['id']) <= after:
+                        result.skipped += 1
+                        continue
+                    category_id = record.get('category_id')
+                    subcategory_id = record.get('subcategory_id')
+                    expense = Expense(
+                        user=user,
+                        date=day,
+                        amount=record['amount'],
+                        description=record.get('description', ''),
+                        fingerprint=record.get('fingerprint', ''),
+                        category_id=None if category_id is None else mapping.categories[category_id],
+                        subcategory_id=None if subcategory_id is None else mapping.subcategories[subcategory_id],
+                    )
+                    batch.append((expense, cursor_token(day, created_at, record['id'])))
+                    if len(batch) >= batch_size:
+                        _flush(batch, result)
+                        batch = []
+                        if progress:
+                            progress(result)
+                elif kind == 'end':
+                    break
+        except (KeyError, TypeError, json.JSONDecodeError) as e:
+            raise ValueError(f"malformed backup at line {number}: {e!r}")
+        except (EOFError, OSError) as e:
+            # Truncated download: keep what was read in full, and report it
+            # so the caller can resume after it
+            if batch:
+                _flush(batch, result)
+                if progress:
+                    progress(result)
+            raise ValueError(f"backup file ends early: {e}")
+    _flush(batch, result)
+    if progress:
+        progress(result)
+    return result
@@ -0,0 +1,180 @@
+"""
+Batched expense writes for the bulk API.
+
+`apply(user, operations)` takes a list of
+
+    {"op": "create", "data": {...}}
+    {"op": "update", "id": 12, "data": {...}}    # partial: only the given fields
+    {"op": "delete", "id": 13}
+
+validates all of them first, and only if every item is valid applies them.
+Everything runs in one transaction: one SELECT ... FOR UPDATE locks and
+loads every referenced expense (categories are checked against the cached
+taxonomy), so the deltas are computed from rows no concurrent writer can
+change before commit. Then come one bulk_create, one bulk_update
+and one filtered DELETE (plus one INSERT of sync tombstones), all stamped
+with one data version bump. Per-row signals are suspended and the whole
+batch's rollup/pivot/metadata changes go through a single apply_deltas().
+"""
+from django.db import transaction
+from django.utils import timezone
+
+from . import rollups, versions
+from .models import Expense, ExpenseTombstone
+from .serializers import BulkExpenseSerializer
+from .taxonomy import get_taxonomy
+
+MAX_OPERATIONS = 1000
+
+OPS = ('create', 'update', 'delete')
+
+# Serializer field name -> Expense attribute
+_FIELDS = {
+    'date': 'date',
+    'amount': 'amount',
+    'category': 'category_id',
+    'subcategory': 'subcategory_id',
+    'description': 'description',
+}
+
+
+class BulkResult:
+    def __init__(self, count):
+        self.results = [None] * count
+        self.applied = False
+
+    @property
+    def has_errors(self):
+        return any(item is not None and 'errors' in item for item in self.results)
+
+    def set(self, index, op, **fields):
+        self.results[index] = {'index': index, 'op': op, **fields}
+
+    def as_dict(self):
+        return {'applied': self.applied, 'results': self.results}
+
+
+def _parse(index, item, result, seen_ids):
+    """(op, id, data) for a well-formed item, or None after recording the error."""
+    if not isinstance(item, dict):
+        result.set(index, None, errors={'non_field_errors': ["Expected an object."]})
+        return None
+    op = item.get('op')
+    if op not in OPS:
+        result.set(index, op, errors={'op': [f"Must be one of: {', '.join(OPS)}."]})
+        return None
+    pk = item.get('id')
+    if op != 'create':
+        if not isinstance(pk, int) or isinstance(pk, bool):
+            result.set(index, op, errors={'id': ["An integer id is required."]})
+            return None
+        if pk in seen_ids:
+            result.set(index, op, id=pk, errors={'id': ["This expense appears more than once in the batch."]})
+            return None
+        seen_ids.add(pk)
+    data = item.get('data', {})
+    if op != 'delete' and not isinstance(data, dict):
+        result.set(index, op, id=pk, errors={'data': ["Expected an object."]})
+        return None
+    return op, pk, data
+
+
+def _apply_locked(user, parsed, existing, result):
+    """Validate the parsed items against the locked rows and write them; False if any item is invalid."""
+    context = {'taxonomy': get_taxonomy()}
+
+    to_create, to_update, to_delete = [], [], []
+    deltas = []
+    update_fields = set()
+    for index, entry in enumerate(parsed):
+        if entry is None:
+            continue
+        op, pk, data = entry
+        if op != 'create' and pk not in existing:
+            result.set(index, op, id=pk, errors={'id': ["Not found."]})
+            continue
+        if op == 'delete':
+            to_delete.append((index, existing[pk]))
+            continue
+
+        instance = existing.get(pk) if op == 'update' else None
+        serializer = BulkExpenseSerializer(
+            instance=instance, data=data, partial=op == 'update', context=context,
+        )
+        if not serializer.is_valid():
+            result.set(index, op, id=pk, errors=serializer.errors)
+            continue
+        if op == 'create':
+            expense = Expense(user=user, **{_FIELDS[k]: v for k, v in serializer.validated_data.items()})
+            to_create.append((index, expense))
+        else:
+            old = rollups.snapshot(instance)
+            for key, value in serializer.validated_data.items():
+                setattr(instance, _FIELDS[key], value)
+                update_fields.add(key)
+            deltas.append(rollups.diff(old=old, new=rollups.snapshot(instance)))
+            to_update.append((index, instance))
+
+    if result.has_errors:
+        return False
+
+    created = [expense for _, expense in to_create]
+    deltas.append(rollups.additions(created))
+    deltas.extend(rollups.diff(old=rollups.snapshot(expense)) for _, expense in to_delete)
+
+    version = versions.bump([user.pk])[user.pk]
+    with rollups.suspended():
+        if created:
+            for expense in created:
+                expense.sync_version = version
+            Expense.objects.bulk_create(created)
+        if update_fields:
+            # bulk_update skips auto_now, so updated_at is set here
+            now = timezone.now()
+            for _, expense in to_update:
+                expense.updated_at = now
+                expense.sync_version = version
+            Expense.objects.bulk_update(
+                [expense for _, expense in to_update], sorted(update_fields) + ['updated_at', 'sync_version'],
+            )
+        if to_delete:
+            deleted_ids = [expense.pk for _, expense in to_delete]
+            Expense.objects.filter(user=user, pk__in=deleted_ids).delete()
+            ExpenseTombstone.objects.bulk_create(
+                ExpenseTombstone(user=user, expense_id=pk, sync_version=version) for pk in deleted_ids
+            )
+        rollups.apply_deltas(rollups.merge(*deltas))
+
+    for index, expense in to_create:
+        result.set(index, 'create', id=expense.pk, status='created')
+    for index, expense in to_update:
+        result.set(index, 'update', id=expense.pk, status='updated')
+    for index, expense in to_delete:
+        result.set(index, 'delete', id=expense.pk, status='deleted')
+    return True
+
+
+def apply(user, operations):
+    """Validate and apply a batch for `user`; returns a BulkResult (applied only if all items are valid)."""
+    result = BulkResult(len(operations))
+    seen_ids = set()
+    parsed = [_parse(index, item, result, seen_ids) for index, item in enumerate(operations)]
+
+    with transaction.atomic():
+        # Take the user's version lock first, as single-row saves do, then lock
+        # the referenced rows (in id order) before reading them, so the deltas
+        # and tombstones below come from rows no one else can change or delete
+        # until this batch commits; ids already gone are "Not found"
+        versions.lock([user.pk])
+        existing = {
+            expense.pk: expense
+            for expense in Expense.objects.select_for_update().filter(user=user, pk__in=seen_ids).order_by('pk')
+        } if seen_ids else {}
+        if not _apply_locked(user, parsed, existing, result):
+            for index, entry in enumerate(parsed):
+                if result.results[index] is None:
+                    result.set(index, entry[0], id=entry[1], status='not applied')
+            return result
+
+    result.applied = True
+    return result
@@ -0,0 +1,63 @@
+"""
+Chart data for the Visualize page.
+
+Both breakdowns (by subcategory for the bar chart, by category for the pie)
+come from one grouped query over (category, subcategory); the category
+rollup, the category filter and the list of categories present in the period
+are all derived from those rows in Python.
+"""
+from collections import defaultdict
+
+from django.db.models import Sum
+
+from . import periods
+from .models import Expense
+from .pivots import from_paise, to_paise
+
+
+def chart_data(user_id, taxonomy, start, end, category_id=None):
+    """
+    Breakdowns for expenses with start <= date < end, optionally limited to
+    one category. `categories` always lists every category with expenses in
+    the period so the filter stays usable.
+    """
+    grouped = (
+        Expense.objects
+        .filter(user_id=user_id, **periods.date_filter((start, end)))
+        .values('category_id', 'subcategory_id')
+        .annotate(total=Sum('amount'))
+        .order_by()
+    )
+
+    present = set()
+    by_subcategory = defaultdict(int)
+    by_category = defaultdict(int)
+    for row in grouped:
+        cat_id, sub_id = row['category_id'], row['subcategory_id']
+        if cat_id is not None:
+            present.add(cat_id)
+        if category_id is not None and cat_id != category_id:
+            continue
+        paise = to_paise(row['total'])
+        if not paise:
+            continue
+        by_subcategory[taxonomy.subcategory_names.get(sub_id, 'No Subcategory')] += paise
+        by_category[taxonomy.category_names.get(cat_id, 'Uncategorized')] += paise
+
+    subcategories = sorted(by_subcategory.items())
+    categories = sorted(by_category.items(), key=lambda item: -item[1])
+    return {
+        'categories': sorted(
+            ({'id': cat_id, 'name': taxonomy.category_names.get(cat_id, 'Uncategorized')} for cat_id in present),
+            key=lambda c: c['name'],
+        ),
+        'subcategories': {
+            'labels': [name for name, _ in subcategories],
+            'values': [float(from_paise(p)) for _, p in subcategories],
+        },
+        'by_category': {
+            'labels': [name for name, _ in categories],
+            'values': [float(from_paise(p)) for _, p in categories],
+        },
+        'total': float(from_paise(sum(by_category.values()))),
+    }
@@ -1,5 +1,15 @@
 from django.conf import settings
 
+from . import activity
+
 def google_settings(request):
     # Expose the Google Client ID to templates
-    return {"GOOGLE_CLIENT_ID": settings.GOOGLE_CLIENT_ID}
\ No newline at end of file
+    return {"GOOGLE_CLIENT_ID": settings.GOOGLE_CLIENT_ID}
+
+def session_timeout(request):
+    # For the idle countdown in base.html; the page render recorded activity,
+    # though the session may carry it up to the granularity late
+    return {
+        "SESSION_IDLE_TIMEOUT": activity.idle_timeout(),
+        "SESSION_ACTIVITY_GRANULARITY": getattr(settings, "SESSION_ACTIVITY_GRANULARITY", 60),
+    }
@@ -0,0 +1,67 @@
+"""
+Dashboard data service.
+
+Everything the dashboard shows is fetched in two round trips:
+one conditional aggregate over the daily rollups for all period totals, and
+one list query whose rows are split into "recent this month" and "today" in
+Python.
+"""
+from django.db.models import Q, Sum
+
+from . import periods
+from .models import Expense, ExpenseDailyTotal
+
+RECENT_LIMIT = 10
+
+
+def period_totals(user, today, year, month):
+    """
+    Today/month/year totals plus the row counts needed to size the list fetch,
+    in a single query over ExpenseDailyTotal.
+    """
+    month_start, month_end = periods.month_bounds(year, month)
+    return (
+        ExpenseDailyTotal.objects
+        .filter(user=user, **periods.year_filter(year))
+        .aggregate(
+            total_year=Sum('total'),
+            total_month=Sum('total', filter=Q(date__gte=month_start, date__lt=month_end)),
+            total_today=Sum('total', filter=Q(date=today)),
+            count_today=Sum('count', filter=Q(date=today)),
+            count_after_today=Sum('count', filter=Q(date__gt=today, date__lt=month_end)),
+        )
+    )
+
+
+def dashboard_data(user, today, year, month, recent_limit=RECENT_LIMIT):
+    """
+    Return the dashboard's totals and expense lists:
+    total_today, total_month, total_year, today_expenses, month_expenses.
+    """
+    is_current_month = (year, month) == (today.year, today.month)
+    totals = period_totals(user, today, year, month)
+
+    # Today's rows sit right after any future-dated rows of the month in
+    # (-date, -created_at) order, so one LIMITed fetch covers both lists.
+    limit = recent_limit
+    if is_current_month:
+        limit = max(limit, (totals['count_after_today'] or 0) + (totals['count_today'] or 0))
+
+    rows = list(
+        Expense.objects
+        .filter(user=user, **periods.month_filter(year, month))
+        .select_related('category', 'subcategory__category')
+        .only('id', 'amount', 'description', 'date', 'created_at',
+              'category__id', 'category__name',
+              'subcategory__id', 'subcategory__name',
+              'subcategory__category__id', 'subcategory__category__name')
+        .order_by('-date', '-created_at')[:limit]
+    )
+
+    return {
+        'total_today': (totals['total_today'] or 0) if is_current_month else 0,
+        'total_month': totals['total_month'] or 0,
+        'total_year': totals['total_year'] or 0,
+        'today_expenses': [e for e in rows if e.date == today] if is_current_month else [],
+        'month_expenses': rows[:recent_limit],
+    }
@@ -0,0 +1,207 @@
+"""
+Expense export helpers.
+
+Rows are read with a single joined `values_list(...).iterator()` query (no
+per-row category/subcategory lookups) and written incrementally, so memory
+stays constant however many rows are exported.
+
+Formats: CSV, NDJSON, XLSX (ledger.xlsx, streamed) and Parquet (record
+batches of PARQUET_BATCH_ROWS rows; needs the optional pyarrow package).
+"""
+import csv
+import json
+from datetime import date
+
+from . import periods
+from .models import Expense
+from .xlsx import StreamSink, stream_xlsx
+
+COLUMNS = ['date', 'category', 'subcategory', 'amount', 'description']
+
+CHUNK_SIZE = 2000
+
+# Rows per Parquet row group; bounds memory while keeping groups large enough to scan well
+PARQUET_BATCH_ROWS = 50000
+
+# format -> (content type, file suffix)
+FORMATS = {
+    'csv': ('text/csv', '.csv'),
+    'ndjson': ('application/x-ndjson', '.ndjson'),
+    'xlsx': ('application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', '.xlsx'),
+    'parquet': ('application/vnd.apache.parquet', '.parquet'),
+}
+
+
+def parse_export_params(params, today):
+    """
+    Resolve export filters from a QueryDict.
+
+    Either `start` and `end` (inclusive ISO dates, any span) or `year` with an
+    optional `month` (1-12, or 'all' for the whole year). `category` is an id
+    or 'all'. Returns (start, end_exclusive, category_id, label); raises
+    ValueError with a user-facing message on bad input.
+    """
+    if params.get('start') or params.get('end'):
+        try:
+            start = date.fromisoformat(params.get('start', ''))
+            end = date.fromisoformat(params.get('end', ''))
+        except ValueError:
+            raise ValueError("start and end must be dates in YYYY-MM-DD format.")
+        if end < start:
+            raise ValueError("end must not be before start.")
+        if end >= date.max:
+            raise ValueError("end is out of range.")
+        bounds = periods.range_bounds(start, end)
+        label = f"{start.isoformat()}_{end.isoformat()}"
+    else:
+        try:
+            year = int(params.get('year', today.year))
+        except (TypeError, ValueError):
+            year = today.year
+        if not date.min.year < year < date.max.year:
+            year = today.year
+        month = params.get('month', today.month)
+        if month == 'all':
+            bounds = periods.year_bounds(year)
+            label = f"{year}"
+        else:
+            try:
+                month = int(month)
+            except (TypeError, ValueError):
+                month = today.month
+            if not 1 <= month <= 12:
+                month = today.month
+            bounds = periods.month_bounds(year, month)
+            label = f"{year}_{month}"
+
+    category = params.get('category', 'all')
+    category_id = int(category) if category and category != 'all' and category.isdigit() else None
+    return bounds[0], bounds[1], category_id, label
+
+
+def export_queryset(user_id, start, end, category_id=None):
+    """A user's expenses with start <= date < end, optionally in one category."""
+    qs = Expense.objects.filter(user_id=user_id, **periods.date_filter((start, end)))
+    if category_id is not None:
+        qs = qs.filter(category_id=category_id)
+    return qs
+
+
+def export_rows(user_id, start, end, category_id=None, chunk_size=CHUNK_SIZE):
+    """Yield (date, category, subcategory, amount, description) tuples ordered by date."""
+    return (
+        export_queryset(user_id, start, end, category_id)
+        .order_by('date', 'created_at', 'id')
+        .values_list('date', 'category__name', 'subcategory__name', 'amount', 'description')
+        .iterator(chunk_size=chunk_size)
+    )
+
+
+class _Echo:
+    """File-like object whose write() returns the value, for csv.writer streaming."""
+
+    def write(self, value):
+        return value
+
+
+def csv_stream(rows):
+    """Yield CSV lines (header first) for export_rows() output."""
+    writer = csv.writer(_Echo())
+    yield writer.writerow(COLUMNS)
+    for day, category, subcategory, amount, description in rows:
+        yield writer.writerow([
+            day.isoformat(),
+            category or '',
+            subcategory or '',
+            str(amount),
+            description or '',
+        ])
+
+
+def ndjson_stream(rows):
+    """Yield one JSON object per line for export_rows() output; amounts stay exact strings."""
+    for day, category, subcategory, amount, description in rows:
+        yield json.dumps({
+            'date': day.isoformat(),
+            'category': category,
+            'subcategory': subcategory,
+            'amount': str(amount),
+            'description': description or '',
+        }, ensure_ascii=False, separators=(',', ':')) + '\n'
+
+
+
+def xlsx_stream(rows):
+    """Yield .xlsx bytes for export_rows() output."""
+    return stream_xlsx(COLUMNS, rows, sheet_name='Expenses')
+
+
+def parquet_available():
+    try:
+        import pyarrow.parquet  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def available_formats():
+    return [fmt for fmt in FORMATS if fmt != 'parquet' or parquet_available()]
+
+
+def parquet_stream(rows, batch_rows=PARQUET_BATCH_ROWS):
+    """
+    Yield Parquet bytes for export_rows() output, one row group per
+    `batch_rows` rows. Category and subcategory are dictionary-encoded and
+    amounts are exact decimal(10, 2).
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    labels = pa.dictionary(pa.int32(), pa.string())
+    schema = pa.schema([
+        ('date', pa.date32()),
+        ('category', labels),
+        ('subcategory', labels),
+        ('amount', pa.decimal128(10, 2)),
+        ('description', pa.string()),
+    ])
+
+    def batch(columns):
+        days, categories, subcategories, amounts, descriptions = columns
+        return pa.record_batch([
+            pa.array(days, pa.date32()),
+            pa.array(categories, pa.string()).dictionary_encode(),
+            pa.array(subcategories, pa.string()).dictionary_encode(),
+            pa.array(amounts, pa.decimal128(10, 2)),
+            pa.array(descriptions, pa.string()),
+        ], schema=schema)
+
+    sink = StreamSink()
+    writer = pq.ParquetWriter(sink, schema, compression='zstd')
+    try:
+        columns = ([], [], [], [], [])
+        for row in rows:
+            for column, value in zip(columns, row):
+                column.append(value)
+            if len(columns[0]) >= batch_rows:
+                writer.write_batch(batch(columns), row_group_size=batch_rows)
+                columns = ([], [], [], [], [])
+                yield sink.drain()
+        if columns[0]:
+            writer.write_batch(batch(columns), row_group_size=batch_rows)
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+def stream(fmt, rows):
+    """Yield the export of `rows` in `fmt` as bytes."""
+    if fmt == 'csv':
+        return (line.encode('utf-8') for line in csv_stream(rows))
+    if fmt == 'ndjson':
+        return (line.encode('utf-8') for line in ndjson_stream(rows))
+    if fmt == 'xlsx':
+        return xlsx_stream(rows)
+    if fmt == 'parquet':
+        return parquet_stream(rows)
+    raise ValueError(f"Unknown export format: {fmt!r}")
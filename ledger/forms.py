@@ -1,6 +1,7 @@
 
 from django import forms
 from .models import Expense, Category, Subcategory
+from .taxonomy import get_taxonomy
 
 class ExpenseForm(forms.ModelForm):
     class Meta:
@@ -18,25 +19,26 @@ class ExpenseForm(forms.ModelForm):
         self.user = kwargs.pop('user', None)
         super().__init__(*args, **kwargs)
         if self.user:
-            # Show all global categories
+            # Choices come from the cached global taxonomy (no queries on render);
+            # the querysets are only evaluated to validate submitted values.
+            taxonomy = get_taxonomy()
             self.fields['category'].queryset = Category.objects.all()
-            # Subcategory will be filtered based on selected category via JavaScript or initial value
-            all_subcategories = Subcategory.objects.all().select_related('category')
-            self.fields['subcategory'].queryset = all_subcategories
-            
-            # Create choices with just subcategory names (not full names with >)
-            choices = [('', '---------')]
-            self.subcategory_category_map = {}
-            for subcategory in all_subcategories:
-                choices.append((subcategory.id, subcategory.name))
-                self.subcategory_category_map[subcategory.id] = subcategory.category_id
-            self.fields['subcategory'].choices = choices
-            
-            # If editing an existing expense, filter subcategory by its category
-            if self.instance and self.instance.pk and self.instance.category:
-                self.fields['subcategory'].queryset = Subcategory.objects.filter(
-                    category=self.instance.category
-                )
+            self.fields['category'].choices = taxonomy.category_choices()
+            # Only the selected category's subcategories are rendered; the page JS
+            # fills the rest in from the browser-cached /api/taxonomy/
+            self.fields['subcategory'].queryset = Subcategory.objects.all()
+            # Choices with just subcategory names (not full names with >)
+            self.fields['subcategory'].choices = taxonomy.category_subcategory_choices(
+                self._selected_category_id()
+            )
+            self.subcategory_category_map = taxonomy.subcategory_category_map
+
+    def _selected_category_id(self):
+        """The category id the form will render as selected, or None."""
+        try:
+            return int(self['category'].value())
+        except (TypeError, ValueError):
+            return None
     
     def clean_category(self):
         category = self.cleaned_data.get('category')
@@ -44,6 +46,14 @@ class ExpenseForm(forms.ModelForm):
             raise forms.ValidationError("Category is required.")
         return category
 
+    def clean(self):
+        cleaned_data = super().clean()
+        category = cleaned_data.get('category')
+        subcategory = cleaned_data.get('subcategory')
+        if category and subcategory and subcategory.category_id != category.pk:
+            self.add_error('subcategory', "Subcategory does not belong to the selected category.")
+        return cleaned_data
+
 class CategoryForm(forms.ModelForm):
     class Meta:
         model = Category
@@ -63,4 +73,33 @@ class SubcategoryForm(forms.ModelForm):
     
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.fields['category'].queryset = Category.objects.all()
\ No newline at end of file
+        self.fields['category'].queryset = Category.objects.all()
+        self.fields['category'].choices = get_taxonomy().category_choices()
+
+class ExpenseImportForm(forms.Form):
+    file = forms.FileField(
+        label='CSV or bank statement',
+        widget=forms.ClearableFileInput(attrs={'class': 'form-control-custom', 'accept': '.csv,.gz,.ofx,.qfx,.qif'}),
+    )
+    category = forms.TypedChoiceField(
+        required=False,
+        coerce=int,
+        empty_value=None,
+        label='Category for statement rows',
+        widget=forms.Select(attrs={'class': 'form-select-custom'}),
+    )
+    day_first = forms.BooleanField(
+        required=False,
+        label='QIF dates are day first (DD/MM/YYYY)',
+        widget=forms.CheckboxInput(attrs={'class': 'form-check-input'}),
+    )
+    dry_run = forms.BooleanField(
+        required=False,
+        initial=True,
+        label='Dry run (validate only, import nothing)',
+        widget=forms.CheckboxInput(attrs={'class': 'form-check-input'}),
+    )
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['category'].choices = get_taxonomy().category_choices(blank_label='Uncategorized')
@@ -0,0 +1,353 @@
+"""
+Bulk expense import.
+
+Reads CSV in the export layout (ledger.exports.COLUMNS: date, category,
+subcategory, amount, description) as a stream. Category and subcategory
+names are resolved through one in-memory map built from the cached taxonomy,
+rows are validated in chunks of `chunk_size` and each chunk is inserted with
+bulk_create(batch_size=...) in its own transaction. bulk_create skips the
+Expense signals, so every chunk applies its coalesced rollup deltas itself.
+
+Rows that fail validation are reported by line number and skipped; the valid
+rows around them are still imported. With dry_run=True every row is
+validated and counted but nothing is written.
+
+Bank statements (OFX/QFX/QIF, parsed by ledger.statements) go through
+`import_statement()`: debits become expenses carrying a `fingerprint`, and each
+chunk is checked against existing fingerprints with one query, so
+re-importing an overlapping statement skips what is already there. A partial
+unique constraint on (user, fingerprint) catches rows a concurrent import of
+the same statement stored in between: the chunk is checked again and those
+rows are counted as skipped too.
+"""
+import csv
+import gzip
+import hashlib
+import io
+import time
+from datetime import date
+from decimal import Decimal, InvalidOperation
+
+from django.db import IntegrityError, transaction
+
+from . import rollups, statements, versions
+from .models import Expense
+from .taxonomy import get_taxonomy
+
+# Rows per transaction, and per INSERT statement within it
+CHUNK_SIZE = 5000
+BATCH_SIZE = 1000
+
+# Errors kept for the report; any beyond this are only counted
+MAX_ERRORS = 1000
+
+REQUIRED_COLUMNS = {'date', 'amount'}
+
+_MAX_AMOUNT = Decimal('99999999.99')  # Expense.amount is max_digits=10, decimal_places=2
+_CENT = Decimal('0.01')
+
+
+class ImportResult:
+    """Counts, per-row errors and timing for one import run."""
+
+    def __init__(self, dry_run=False, max_errors=MAX_ERRORS):
+        self.dry_run = dry_run
+        self.max_errors = max_errors
+        self.rows = 0
+        self.valid = 0
+        self.inserted = 0
+        self.skipped = 0  # duplicates of already imported statement rows
+        self.ignored = 0  # statement credits, which are not expenses
+        self.error_count = 0
+        self.errors = []  # [(line, message)], at most max_errors (None: all)
+        self.fatal = None  # message if the file could not be read to the end
+        self.elapsed = 0.0
+
+    def add_error(self, line, message):
+        self.error_count += 1
+        if self.max_errors is None or len(self.errors) < self.max_errors:
+            self.errors.append((line, message))
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.elapsed if self.elapsed else 0.0
+
+    def summary(self):
+        action = "validated (dry run)" if self.dry_run else f"{self.inserted} inserted"
+        text = f"{self.rows} rows read, {self.valid} valid, {action}, "
+        if self.skipped:
+            text += f"{self.skipped} duplicates skipped, "
+        if self.ignored:
+            text += f"{self.ignored} credits ignored, "
+        text += (
+            f"{self.error_count} errors in {self.elapsed:.2f}s "
+            f"({self.rows_per_second:,.0f} rows/s)"
+        )
+        if self.fatal:
+            text += f"; stopped early: {self.fatal}"
+        return text
+
+
+class NameLookup:
+    """Case-insensitive category/subcategory name -> id map from one taxonomy snapshot."""
+
+    def __init__(self, taxonomy):
+        self.categories = {name.casefold(): cid for cid, name in taxonomy.categories}
+        self.subcategories = {
+            (cid, name.casefold()): sid for sid, name, cid in taxonomy.subcategories
+        }
+
+    def resolve(self, category, subcategory):
+        """(category_id, subcategory_id) for the given names; blank names resolve to None."""
+        category = (category or '').strip()
+        subcategory = (subcategory or '').strip()
+        if not category:
+            if subcategory:
+                raise ValueError("subcategory given without a category.")
+            return None, None
+        category_id = self.categories.get(category.casefold())
+        if category_id is None:
+            raise ValueError(f"unknown category {category!r}.")
+        if not subcategory:
+            return category_id, None
+        subcategory_id = self.subcategories.get((category_id, subcategory.casefold()))
+        if subcategory_id is None:
+            raise ValueError(f"unknown subcategory {subcategory!r} for category {category!r}.")
+        return category_id, subcategory_id
+
+
+def open_text(fileobj, name=''):
+    """Wrap a binary file (optionally gzipped, by `name`) for csv reading."""
+    if name.endswith('.gz'):
+        fileobj = gzip.GzipFile(fileobj=fileobj)
+    return io.TextIOWrapper(fileobj, encoding='utf-8-sig', newline='')
+
+
+def read_csv(textfile):
+    """
+    Yield (line_number, {column: value}) for each data row of an export-layout
+    CSV. Column order does not matter and unknown columns are ignored.
+    Raises ValueError if the file is unreadable or misses required columns.
+    """
+    reader = csv.reader(textfile)
+    try:
+        header = [h.strip().lower() for h in next(reader, [])]
+        missing = REQUIRED_COLUMNS - set(header)
+        if missing:
+            raise ValueError(f"missing required column(s): {', '.join(sorted(missing))}.")
+        for values in reader:
+            if not any(v.strip() for v in values):
+                continue
+            yield reader.line_num, dict(zip(header, values))
+    except (csv.Error, UnicodeDecodeError, EOFError, OSError) as e:
+        raise ValueError(f"could not read file: {e}")
+
+
+def parse_amount(value):
+    try:
+        amount = Decimal((value or '').strip().replace(',', ''))
+    except InvalidOperation:
+        raise ValueError(f"invalid amount {value!r}.")
+    if not amount.is_finite() or amount < _CENT:
+        raise ValueError(f"amount must be at least 0.01, got {value!r}.")
+    if amount > _MAX_AMOUNT:
+        raise ValueError(f"amount {value!r} is too large.")
+    if amount != amount.quantize(_CENT):
+        raise ValueError(f"amount {value!r} has more than 2 decimal places.")
+    return amount.quantize(_CENT)
+
+
+def build_expense(user_id, raw, lookup):
+    """An unsaved Expense from one parsed row; raises ValueError with the reason."""
+    try:
+        day = date.fromisoformat((raw.get('date') or '').strip())
+    except ValueError:
+        raise ValueError(f"invalid date {raw.get('date')!r}, expected YYYY-MM-DD.")
+    amount = parse_amount(raw.get('amount'))
+    category_id, subcategory_id = lookup.resolve(raw.get('category'), raw.get('subcategory'))
+    description = (raw.get('description') or '').strip()
+    if len(description) > 255:
+        raise ValueError("description is longer than 255 characters.")
+    return Expense(
+        user_id=user_id,
+        date=day,
+        amount=amount,
+        category_id=category_id,
+        subcategory_id=subcategory_id,
+        description=description,
+    )
+
+
+def _stored_fingerprints(user_id, expenses):
+    """The fingerprints among `expenses` already stored for the user (one query)."""
+    fingerprints = [expense.fingerprint for expense in expenses if expense.fingerprint]
+    if not fingerprints:
+        return set()
+    return set(
+        Expense.objects
+        .filter(user_id=user_id, fingerprint__in=fingerprints)
+        .values_list('fingerprint', flat=True)
+    )
+
+
+def _insert(chunk, result, batch_size=BATCH_SIZE):
+    """
+    Insert [(line, expense)] and its rollup deltas in one transaction.
+    Returns False, having written nothing, if some fingerprints were stored
+    by someone else in the meantime; the caller drops those and retries.
+    """
+    expenses = [expense for _, expense in chunk]
+    try:
+        with transaction.atomic():
+            stamped = versions.bump({expense.user_id for expense in expenses})
+            for expense in expenses:
+                expense.sync_version = stamped[expense.user_id]
+            Expense.objects.bulk_create(expenses, batch_size=batch_size)
+            rollups.apply_deltas(rollups.additions(expenses))
+    except IntegrityError as e:
+        if _stored_fingerprints(expenses[0].user_id, expenses):
+            return False
+        # e.g. a category deleted since the lookup map was built
+        for line, _ in chunk:
+            result.add_error(line, f"rejected by the database: {e}")
+        result.valid -= len(chunk)
+        return True
+    result.inserted += len(expenses)
+    return True
+
+
+def import_rows(user, rows, chunk_size=CHUNK_SIZE, batch_size=BATCH_SIZE, dry_run=False,
+                max_errors=MAX_ERRORS):
+    """Validate and insert (line, raw) rows for `user`; returns an ImportResult."""
+    result = ImportResult(dry_run=dry_run, max_errors=max_errors)
+    started = time.perf_counter()
+    lookup = NameLookup(get_taxonomy())
+
+    chunk = []
+    try:
+        for line, raw in rows:
+            result.rows += 1
+            try:
+                expense = build_expense(user.pk, raw, lookup)
+            except ValueError as e:
+                result.add_error(line, str(e))
+                continue
+            result.valid += 1
+            chunk.append((line, expense))
+            if len(chunk) >= chunk_size:
+                if not dry_run:
+                    _insert(chunk, result, batch_size)
+                chunk = []
+    except ValueError as e:
+        result.fatal = str(e)
+    if chunk and not dry_run:
+        _insert(chunk, result, batch_size)
+
+    result.elapsed = time.perf_counter() - started
+    return result
+
+
+def import_csv(user, fileobj, name='', **kwargs):
+    """Import an export-layout CSV (plain or .gz) from a binary file object; kwargs go to import_rows()."""
+    return import_rows(user, read_csv(open_text(fileobj, name)), **kwargs)
+
+
+# --- Bank statements -------------------------------------------------------
+
+def normalize_description(text):
+    return ' '.join(text.split()).casefold()
+
+
+def fingerprint(user_id, day, amount, description, occurrence=1):
+    """
+    Identity of an imported statement row: user, date, amount and normalized
+    description, plus its occurrence number among identical rows of the same
+    statement (two equal coffees on one day stay two expenses).
+    """
+    raw = f"{user_id}|{day.isoformat()}|{amount:.2f}|{normalize_description(description)}|{occurrence}"
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()[:32]
+
+
+def _resolve_statement_category(lookup, category, default):
+    """Map a QIF "Category:Subcategory" to ids, falling back to `default`."""
+    if category:
+        name, _, sub = category.partition(':')
+        try:
+            return lookup.resolve(name, sub)
+        except ValueError:
+            pass
+    return default
+
+
+def _insert_new(user, chunk, result, batch_size, dry_run):
+    """Drop rows whose fingerprint already exists (one query), insert the rest."""
+    while chunk:
+        existing = _stored_fingerprints(user.pk, [expense for _, expense in chunk])
+        fresh = [(line, expense) for line, expense in chunk if expense.fingerprint not in existing]
+        result.skipped += len(chunk) - len(fresh)
+        # _insert() only fails on a conflict, and the next check drops the conflicting rows
+        if dry_run or not fresh or _insert(fresh, result, batch_size):
+            return
+        chunk = fresh
+
+
+def import_statement(user, transactions, category_id=None, subcategory_id=None,
+                     chunk_size=CHUNK_SIZE, batch_size=BATCH_SIZE, dry_run=False, max_errors=MAX_ERRORS):
+    """
+    Import ledger.statements Transactions for `user`. Debits become expenses
+    in their QIF category when it matches the taxonomy, else in
+    (category_id, subcategory_id); credits are counted and ignored.
+    """
+    result = ImportResult(dry_run=dry_run, max_errors=max_errors)
+    started = time.perf_counter()
+    lookup = NameLookup(get_taxonomy())
+    default_category = (category_id, subcategory_id)
+    occurrences = {}
+
+    chunk = []
+    try:
+        for tx in transactions:
+            result.rows += 1
+            if isinstance(tx, statements.ParseError):
+                result.add_error(tx.position, tx.message)
+                continue
+            if tx.amount >= 0:
+                result.ignored += 1
+                continue
+            try:
+                amount = parse_amount(str(-tx.amount))
+            except ValueError as e:
+                result.add_error(tx.position, str(e))
+                continue
+            description = ' '.join(tx.description.split())[:255]
+            key = hashlib.blake2b(
+                f"{tx.date}|{amount}|{normalize_description(description)}".encode('utf-8'), digest_size=16,
+            ).digest()
+            occurrences[key] = occurrence = occurrences.get(key, 0) + 1
+            tx_category_id, tx_subcategory_id = _resolve_statement_category(lookup, tx.category, default_category)
+
+            result.valid += 1
+            chunk.append((tx.position, Expense(
+                user_id=user.pk,
+                date=tx.date,
+                amount=amount,
+                category_id=tx_category_id,
+                subcategory_id=tx_subcategory_id,
+                description=description,
+                fingerprint=fingerprint(user.pk, tx.date, amount, description, occurrence),
+            )))
+            if len(chunk) >= chunk_size:
+                _insert_new(user, chunk, result, batch_size, dry_run)
+                chunk = []
+    except (ValueError, OSError, EOFError) as e:
+        result.fatal = str(e)
+    if chunk:
+        _insert_new(user, chunk, result, batch_size, dry_run)
+
+    result.elapsed = time.perf_counter() - started
+    return result
+
+
+def import_statement_file(user, fileobj, name, day_first=False, **kwargs):
+    """Import an .ofx/.qfx/.qif statement from a binary file object; kwargs go to import_statement()."""
+    return import_statement(user, statements.parse(fileobj, name, day_first=day_first), **kwargs)
@@ -0,0 +1,177 @@
+"""
+Per-request timings: DB, view and template time.
+
+RequestTimingMiddleware gives each request a RequestTimer. While the request
+is handled, the timer is installed as an execute_wrapper on every database
+connection. That counts the queries and their time. The template time is
+measured by TimedDjangoTemplates, the DjangoTemplates backend settings.py
+selects while PERF_INSTRUMENTATION is on: the templates it returns time
+their render() (render(), render_to_string and TemplateResponse all go
+through it). Includes render inside the engine and are part of the outer
+template's time; a render nested in another one is not counted twice.
+
+The numbers go out in a Server-Timing header. They are also kept in
+`stats`, a ring buffer of the last PERF_STATS_SAMPLES requests for each URL
+name. The staff-only perf_stats view reports p50/p95/p99 from it. The
+buffer is per process: each worker reports only what it served itself.
+
+`view` is the time from process_view until the response is back in the
+middleware, so it includes `db` and `tpl` time spent in the view. For
+streaming responses the header can only cover the time before the body
+starts. The sample kept in `stats` is recorded once the body has been sent,
+so it includes the queries run while streaming.
+"""
+import math
+import threading
+from collections import deque, namedtuple
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+from time import perf_counter
+
+from django.conf import settings
+from django.db import connections
+from django.template.backends.django import DjangoTemplates
+
+UNRESOLVED = '<unresolved>'
+
+Sample = namedtuple('Sample', 'total view db queries template')
+
+_current = ContextVar('ledger_request_timer', default=None)
+
+
+def enabled():
+    return getattr(settings, 'PERF_INSTRUMENTATION', True)
+
+
+class RequestTimer:
+    """Accumulates one request's timings; also its own execute_wrapper."""
+
+    def __init__(self):
+        self.started = perf_counter()
+        self.view_started = None
+        self.view_finished = None
+        self.db = 0.0
+        self.queries = 0
+        self.template = 0.0
+        self._template_depth = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db += perf_counter() - start
+            self.queries += 1
+
+    @contextmanager
+    def active(self):
+        """Time queries and template renders on this thread while inside the block."""
+        token = _current.set(self)
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(self))
+                yield self
+        finally:
+            _current.reset(token)
+
+    def view_time(self):
+        if self.view_started is None:
+            return 0.0
+        return (self.view_finished or perf_counter()) - self.view_started
+
+    def sample(self):
+        return Sample(perf_counter() - self.started, self.view_time(), self.db, self.queries, self.template)
+
+    def server_timing(self):
+        """Server-Timing header value, durations in milliseconds."""
+        sample = self.sample()
+        return ', '.join((
+            f'db;dur={sample.db * 1000:.1f};desc="{sample.queries} queries"',
+            f'tpl;dur={sample.template * 1000:.1f}',
+            f'view;dur={sample.view * 1000:.1f}',
+            f'total;dur={sample.total * 1000:.1f}',
+        ))
+
+
+class TimedTemplate:
+    """A backend template whose render() adds its time to the active RequestTimer."""
+
+    def __init__(self, template):
+        self.template = template
+
+    def __getattr__(self, name):
+        return getattr(self.template, name)
+
+    def render(self, context=None, request=None):
+        timer = _current.get()
+        if timer is None or timer._template_depth:
+            return self.template.render(context, request)
+        timer._template_depth += 1
+        start = perf_counter()
+        try:
+            return self.template.render(context, request)
+        finally:
+            timer.template += perf_counter() - start
+            timer._template_depth -= 1
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """DjangoTemplates returning TimedTemplates; costs one ContextVar lookup per render."""
+
+    def from_string(self, template_code):
+        return TimedTemplate(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name))
+
+
+def _percentile(ordered, pct):
+    # Nearest-rank percentile of a sorted, non-empty list
+    return ordered[max(0, math.ceil(pct / 100 * len(ordered)) - 1)]
+
+
+class Stats:
+    """The last `size` samples for each URL name, safe to share between threads."""
+
+    PERCENTILES = (50, 95, 99)
+
+    def __init__(self, size):
+        self.size = size
+        self._samples = {}
+        self._lock = threading.Lock()
+
+    def add(self, name, sample):
+        with self._lock:
+            samples = self._samples.get(name)
+            if samples is None:
+                samples = self._samples[name] = deque(maxlen=self.size)
+            samples.append(sample)
+
+    def clear(self):
+        with self._lock:
+            self._samples.clear()
+
+    def summary(self):
+        """{url name: {'count': n, metric: {'p50': .., 'p95': .., 'p99': ..}}}, times in ms."""
+        with self._lock:
+            snapshot = {name: list(samples) for name, samples in self._samples.items()}
+        summary = {}
+        for name, samples in sorted(snapshot.items()):
+            entry = {'count': len(samples)}
+            for metric in Sample._fields:
+                scale = 1 if metric == 'queries' else 1000
+                ordered = sorted(getattr(s, metric) * scale for s in samples)
+                entry[metric if metric == 'queries' else f'{metric}_ms'] = {
+                    f'p{pct}': round(_percentile(ordered, pct), 2) for pct in self.PERCENTILES
+                }
+            summary[name] = entry
+        return summary
+
+
+stats = Stats(getattr(settings, 'PERF_STATS_SAMPLES', 500))
+
+
+def url_name(request):
+    match = getattr(request, 'resolver_match', None)
+    return match.view_name if match is not None else UNRESOLVED
@@ -0,0 +1,241 @@
+"""
+Background export jobs.
+
+`submit(job)` hands an ExportJob to the configured runner once the creating
+transaction commits, so request workers never do the export themselves:
+
+- 'thread' (default): a process-wide ThreadPoolExecutor with
+  EXPORT_JOB_WORKERS threads; needs no broker.
+- 'celery': the ledger.tasks.run_export_job task (CELERY_BROKER_URL).
+
+`run(job_id)` does the work in either case: it streams export_rows() into a
+file under EXPORT_ROOT, updating `rows_written` every PROGRESS_EVERY rows.
+CSV and NDJSON are gzip-compressed; XLSX and Parquet are already compressed
+and are stored as is.
+
+A running job touches `heartbeat_at` with every progress update. Jobs that
+stay pending or stop beating for EXPORT_JOB_STALE_MINUTES (a worker restart,
+a lost Celery task) are marked failed by `expire_stale()`, so they stop
+counting against EXPORT_JOB_MAX_ACTIVE. `prune()` (the prune_export_jobs
+command, and each new job for its user) deletes finished jobs and their
+artifacts after EXPORT_JOB_RETENTION_HOURS.
+"""
+import gzip
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import exports
+from .models import ExportJob
+
+logger = logging.getLogger(__name__)
+
+PROGRESS_EVERY = 5000
+
+# Formats stored gzip-compressed; the others compress internally
+GZIP_FORMATS = {'csv', 'ndjson'}
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def stale_after():
+    return timedelta(minutes=getattr(settings, 'EXPORT_JOB_STALE_MINUTES', 15))
+
+
+def retention():
+    return timedelta(hours=getattr(settings, 'EXPORT_JOB_RETENTION_HOURS', 24))
+
+
+def export_root():
+    return Path(getattr(settings, 'EXPORT_ROOT', Path(settings.BASE_DIR) / 'exports'))
+
+
+def artifact_path(job):
+    return export_root() / job.file
+
+
+def suffix(fmt):
+    _, ext = exports.FORMATS[fmt]
+    return ext + '.gz' if fmt in GZIP_FORMATS else ext
+
+
+def filename(job):
+    return f"expenses_{job.user_id}_{job.params.get('label', job.pk)}{suffix(job.format)}"
+
+
+def create(user, fmt, start, end, category_id=None, label=''):
+    """Create a pending ExportJob for [start, end) and submit it."""
+    formats = exports.available_formats()
+    if fmt not in formats:
+        raise ValueError(f"format must be one of: {', '.join(formats)}.")
+    prune(user=user)
+    job = ExportJob.objects.create(
+        user=user,
+        format=fmt,
+        params={
+            'start': start.isoformat(),
+            'end': end.isoformat(),
+            'category_id': category_id,
+            'label': label,
+        },
+    )
+    submit(job)
+    return job
+
+
+def submit(job):
+    backend = getattr(settings, 'EXPORT_JOB_BACKEND', 'thread')
+    if backend == 'celery':
+        transaction.on_commit(lambda: _submit_celery(job.pk))
+    elif backend == 'thread':
+        transaction.on_commit(lambda: _get_executor().submit(_run_in_thread, job.pk))
+    else:
+        raise ValueError(f"Unknown EXPORT_JOB_BACKEND: {backend!r}")
+
+
+def _submit_celery(job_id):
+    # Loading the project's Celery app points shared tasks at CELERY_BROKER_URL
+    from Expense_Tracker.celery import app  # noqa: F401
+    from .tasks import run_export_job
+
+    run_export_job.delay(job_id)
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'EXPORT_JOB_WORKERS', 2),
+                thread_name_prefix='export-job',
+            )
+        return _executor
+
+
+def _run_in_thread(job_id):
+    # Worker threads get their own DB connection; don't leave it open
+    close_old_connections()
+    try:
+        run(job_id)
+    finally:
+        close_old_connections()
+
+
+def run(job_id):
+    """Run a pending job to completion; a job already picked up elsewhere is skipped."""
+    now = timezone.now()
+    claimed = ExportJob.objects.filter(pk=job_id, status=ExportJob.STATUS_PENDING).update(
+        status=ExportJob.STATUS_RUNNING, started_at=now, heartbeat_at=now,
+    )
+    if not claimed:
+        return
+    job = ExportJob.objects.get(pk=job_id)
+    relative = Path(str(job.user_id)) / f"{job.pk}{suffix(job.format)}"
+    path = export_root() / relative
+    tmp_path = path.with_name(path.name + '.part')
+
+    try:
+        start = date.fromisoformat(job.params['start'])
+        end = date.fromisoformat(job.params['end'])
+        category_id = job.params.get('category_id')
+
+        rows_total = exports.export_queryset(job.user_id, start, end, category_id).count()
+        ExportJob.objects.filter(pk=job_id).update(rows_total=rows_total, heartbeat_at=timezone.now())
+        rows = exports.export_rows(job.user_id, start, end, category_id)
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        counter = {'written': 0}
+
+        def counted():
+            for row in rows:
+                yield row
+                counter['written'] += 1
+                if counter['written'] % PROGRESS_EVERY == 0:
+                    ExportJob.objects.filter(pk=job_id).update(
+                        rows_written=counter['written'], heartbeat_at=timezone.now(),
+                    )
+
+        with open(tmp_path, 'wb') as raw:
+            if job.format in GZIP_FORMATS:
+                with gzip.GzipFile(fileobj=raw, mode='wb', mtime=0) as fileobj:
+                    fileobj.writelines(exports.stream(job.format, counted()))
+            else:
+                raw.writelines(exports.stream(job.format, counted()))
+        os.replace(tmp_path, path)
+
+        ExportJob.objects.filter(pk=job_id).update(
+            status=ExportJob.STATUS_DONE,
+            rows_written=counter['written'],
+            rows_total=max(rows_total, counter['written']),
+            file=str(relative),
+            size=path.stat().st_size,
+            finished_at=timezone.now(),
+        )
+    except Exception as e:
+        logger.exception("Export job %s failed", job_id)
+        try:
+            tmp_path.unlink()
+        except OSError:
+            pass
+        ExportJob.objects.filter(pk=job_id).update(
+            status=ExportJob.STATUS_FAILED,
+            error=str(e)[:1000] or e.__class__.__name__,
+            finished_at=timezone.now(),
+        )
+
+
+def expire_stale(user=None, now=None):
+    """Mark jobs that stopped making progress as failed; returns how many."""
+    cutoff = (now or timezone.now()) - stale_after()
+    jobs = ExportJob.objects.filter(
+        Q(status=ExportJob.STATUS_PENDING, created_at__lt=cutoff)
+        | Q(status=ExportJob.STATUS_RUNNING, heartbeat_at__lt=cutoff)
+        | Q(status=ExportJob.STATUS_RUNNING, heartbeat_at__isnull=True, started_at__lt=cutoff)
+    )
+    if user is not None:
+        jobs = jobs.filter(user=user)
+    return jobs.update(
+        status=ExportJob.STATUS_FAILED,
+        error="The export stopped making progress; please start it again.",
+        finished_at=now or timezone.now(),
+    )
+
+
+def active_count(user):
+    expire_stale(user=user)
+    return ExportJob.objects.filter(user=user, status__in=ExportJob.ACTIVE_STATUSES).count()
+
+
+def prune(user=None, now=None):
+    """Delete finished jobs past the retention period and their files; returns how many."""
+    now = now or timezone.now()
+    expire_stale(user=user, now=now)
+    jobs = ExportJob.objects.filter(
+        status__in=(ExportJob.STATUS_DONE, ExportJob.STATUS_FAILED), finished_at__lt=now - retention(),
+    )
+    if user is not None:
+        jobs = jobs.filter(user=user)
+    expired = list(jobs.values_list('pk', 'user_id', 'format', 'file'))
+    for pk, user_id, fmt, file in expired:
+        # Failed jobs may have left a partial file behind
+        paths = [export_root() / Path(str(user_id)) / f"{pk}{suffix(fmt)}.part"]
+        if file:
+            paths.append(export_root() / file)
+        for path in paths:
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+            except OSError:
+                logger.warning("Could not delete export artifact %s", path, exc_info=True)
+    ExportJob.objects.filter(pk__in=[pk for pk, *_ in expired]).delete()
+    return len(expired)
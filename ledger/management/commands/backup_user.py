@@ -0,0 +1,74 @@
+import os
+import sys
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from ledger import backups
+
+
+class Command(BaseCommand):
+    help = "Write a gzip-compressed NDJSON backup of a user's expenses, resuming a partial file if asked"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Output file (.ndjson.gz), or '-' for stdout.")
+        parser.add_argument('--user', required=True, help='User id or username to back up.')
+        parser.add_argument('--resume', action='store_true',
+                            help='Continue an interrupted backup in PATH from its last complete page.')
+        parser.add_argument('--page-size', type=int, default=backups.PAGE_SIZE,
+                            help='Expenses per keyset page (and per gzip member).')
+
+    def handle(self, *args, **options):
+        User = get_user_model()
+        ident = options['user']
+        lookup = {'pk': int(ident)} if ident.isdigit() else {'username': ident}
+        try:
+            user = User.objects.get(**lookup)
+        except User.DoesNotExist:
+            raise CommandError(f"No such user: {ident}")
+
+        path = options['path']
+        if path == '-':
+            if options['resume']:
+                raise CommandError("--resume needs a file path.")
+            for member in backups.backup_stream(user, page_size=options['page_size']):
+                sys.stdout.buffer.write(member)
+            return
+
+        after = None
+        mode = 'wb'
+        if options['resume'] and os.path.exists(path):
+            with open(path, 'rb') as existing:
+                offset, token, finished = backups.resume_point(existing)
+            if finished:
+                self.stdout.write(self.style.SUCCESS(f"{path} is already complete."))
+                return
+            if offset:
+                after = backups.parse_cursor(token) if token else None
+                mode = 'r+b'
+                self.stdout.write(f"Resuming after {token or 'the header'}")
+
+        pages = 0
+        try:
+            with open(path, mode) as out:
+                if mode == 'r+b':
+                    out.truncate(offset)
+                    out.seek(offset)
+                    if after is None:
+                        # Only the header made it; start the expenses over
+                        stream = backups.backup_stream(user, page_size=options['page_size'])
+                        next(stream)
+                    else:
+                        stream = backups.backup_stream(user, after=after, page_size=options['page_size'])
+                else:
+                    stream = backups.backup_stream(user, page_size=options['page_size'])
+                for member in stream:
+                    out.write(member)
+                    out.flush()
+                    pages += 1
+        except OSError as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {pages} gzip members to {path} ({os.path.getsize(path):,} bytes)"
+        ))
@@ -0,0 +1,59 @@
+import csv
+import sys
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from ledger import imports
+
+
+class Command(BaseCommand):
+    help = 'Bulk-import expenses for a user from a CSV in the export layout (date, category, subcategory, amount, description)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="CSV file to import (.csv or .csv.gz); '-' reads stdin.")
+        parser.add_argument('--user', required=True, help='User id or username to import for.')
+        parser.add_argument('--chunk-size', type=int, default=imports.CHUNK_SIZE,
+                            help='Rows per transaction.')
+        parser.add_argument('--batch-size', type=int, default=imports.BATCH_SIZE,
+                            help='Rows per INSERT statement.')
+        parser.add_argument('--dry-run', action='store_true', help='Validate every row but write nothing.')
+        parser.add_argument('--errors', metavar='PATH',
+                            help='Write the per-row error report (line, error) to this CSV file.')
+
+    def handle(self, *args, **options):
+        User = get_user_model()
+        ident = options['user']
+        lookup = {'pk': int(ident)} if ident.isdigit() else {'username': ident}
+        try:
+            user = User.objects.get(**lookup)
+        except User.DoesNotExist:
+            raise CommandError(f"No such user: {ident}")
+
+        path = options['path']
+        try:
+            fileobj = sys.stdin.buffer if path == '-' else open(path, 'rb')
+        except OSError as e:
+            raise CommandError(str(e))
+        with fileobj:
+            result = imports.import_csv(
+                user, fileobj, name=path,
+                chunk_size=options['chunk_size'],
+                batch_size=options['batch_size'],
+                dry_run=options['dry_run'],
+                max_errors=None if options['errors'] else imports.MAX_ERRORS,
+            )
+
+        if options['errors']:
+            with open(options['errors'], 'w', newline='', encoding='utf-8') as out:
+                writer = csv.writer(out)
+                writer.writerow(['line', 'error'])
+                writer.writerows(result.errors)
+        else:
+            for line, message in result.errors[:20]:
+                self.stderr.write(f"line {line}: {message}")
+            if result.error_count > 20:
+                self.stderr.write(f"... {result.error_count - 20} more errors (use --errors to save them all)")
+
+        style = self.style.ERROR if result.fatal else self.style.SUCCESS
+        self.stdout.write(style(result.summary()))
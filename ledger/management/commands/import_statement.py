@@ -0,0 +1,69 @@
+import csv
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from ledger import imports, statements
+from ledger.models import Category
+
+
+class Command(BaseCommand):
+    help = 'Import debits from an OFX/QFX/QIF bank statement as expenses, skipping already imported transactions'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Statement file (.ofx, .qfx or .qif).')
+        parser.add_argument('--user', required=True, help='User id or username to import for.')
+        parser.add_argument('--category', help='Category name for rows without a matching QIF category.')
+        parser.add_argument('--day-first', action='store_true', help='QIF dates are DD/MM/YYYY rather than MM/DD/YYYY.')
+        parser.add_argument('--chunk-size', type=int, default=imports.CHUNK_SIZE,
+                            help='Rows per duplicate check and transaction.')
+        parser.add_argument('--dry-run', action='store_true', help='Parse and check duplicates but write nothing.')
+        parser.add_argument('--errors', metavar='PATH',
+                            help='Write the per-entry error report (position, error) to this CSV file.')
+
+    def handle(self, *args, **options):
+        User = get_user_model()
+        ident = options['user']
+        lookup = {'pk': int(ident)} if ident.isdigit() else {'username': ident}
+        try:
+            user = User.objects.get(**lookup)
+        except User.DoesNotExist:
+            raise CommandError(f"No such user: {ident}")
+
+        category_id = None
+        if options['category']:
+            try:
+                category_id = Category.objects.get(name__iexact=options['category']).pk
+            except Category.DoesNotExist:
+                raise CommandError(f"No such category: {options['category']}")
+
+        path = options['path']
+        if not statements.is_statement(path):
+            raise CommandError("Expected an .ofx, .qfx or .qif file.")
+        try:
+            fileobj = open(path, 'rb')
+        except OSError as e:
+            raise CommandError(str(e))
+        with fileobj:
+            result = imports.import_statement_file(
+                user, fileobj, path,
+                day_first=options['day_first'],
+                category_id=category_id,
+                chunk_size=options['chunk_size'],
+                dry_run=options['dry_run'],
+                max_errors=None if options['errors'] else imports.MAX_ERRORS,
+            )
+
+        if options['errors']:
+            with open(options['errors'], 'w', newline='', encoding='utf-8') as out:
+                writer = csv.writer(out)
+                writer.writerow(['position', 'error'])
+                writer.writerows(result.errors)
+        else:
+            for position, message in result.errors[:20]:
+                self.stderr.write(f"entry at {position}: {message}")
+            if result.error_count > 20:
+                self.stderr.write(f"... {result.error_count - 20} more errors (use --errors to save them all)")
+
+        style = self.style.ERROR if result.fatal else self.style.SUCCESS
+        self.stdout.write(style(result.summary()))
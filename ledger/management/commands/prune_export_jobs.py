@@ -0,0 +1,9 @@
+from django.core.management.base import BaseCommand
+from ledger import jobs
+
+class Command(BaseCommand):
+    help = 'Fail stalled export jobs and delete finished ones (and their files) older than EXPORT_JOB_RETENTION_HOURS'
+
+    def handle(self, *args, **options):
+        deleted = jobs.prune()
+        self.stdout.write(self.style.SUCCESS(f'Pruned {deleted} export jobs'))
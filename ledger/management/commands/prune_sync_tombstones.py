@@ -0,0 +1,9 @@
+from django.core.management.base import BaseCommand
+from ledger import sync
+
+class Command(BaseCommand):
+    help = 'Delete expense tombstones older than SYNC_TOMBSTONE_RETENTION_DAYS'
+
+    def handle(self, *args, **options):
+        deleted = sync.prune_tombstones()
+        self.stdout.write(self.style.SUCCESS(f'Pruned {deleted} tombstones'))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from ledger import rollups
+
+class Command(BaseCommand):
+    help = 'Rebuild the daily/monthly expense rollup tables from Expense rows'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, action='append', dest='user_ids',
+                            help='Only rebuild this user id (repeatable). Defaults to all users.')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        daily, monthly = rollups.rebuild(
+            user_ids=options['user_ids'],
+            batch_size=options['batch_size'],
+        )
+        self.stdout.write(
+            self.style.SUCCESS(f'Rebuilt rollups: {daily} daily rows, {monthly} monthly rows')
+        )
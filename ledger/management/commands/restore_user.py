@@ -0,0 +1,61 @@
+import sys
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from ledger import backups
+
+
+class Command(BaseCommand):
+    help = "Restore a backup written by backup_user into a user's account"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Backup file (.ndjson.gz), or '-' for stdin.")
+        parser.add_argument('--user', required=True, help='User id or username to restore into.')
+        parser.add_argument('--after', metavar='CURSOR',
+                            help='Skip expenses up to this cursor, as printed by an interrupted restore.')
+        parser.add_argument('--batch-size', type=int, default=backups.RESTORE_BATCH_SIZE,
+                            help='Expenses per transaction.')
+
+    def handle(self, *args, **options):
+        User = get_user_model()
+        ident = options['user']
+        lookup = {'pk': int(ident)} if ident.isdigit() else {'username': ident}
+        try:
+            user = User.objects.get(**lookup)
+        except User.DoesNotExist:
+            raise CommandError(f"No such user: {ident}")
+
+        after = None
+        if options['after']:
+            try:
+                after = backups.parse_cursor(options['after'])
+            except ValueError as e:
+                raise CommandError(str(e))
+
+        verbosity = options['verbosity']
+        last = {'result': None}
+
+        def progress(result):
+            last['result'] = result
+            if verbosity > 1:
+                self.stdout.write(f"{result.expenses} restored, last cursor {result.cursor}")
+
+        path = options['path']
+        try:
+            fileobj = sys.stdin.buffer if path == '-' else open(path, 'rb')
+        except OSError as e:
+            raise CommandError(str(e))
+        try:
+            with fileobj:
+                result = backups.restore_stream(
+                    user, fileobj, after=after, batch_size=options['batch_size'], progress=progress,
+                )
+        except ValueError as e:
+            message = str(e)
+            result = last['result']
+            if result is not None and result.cursor:
+                message += f"\n{result.summary()}; rerun with --after '{result.cursor}' to continue."
+            raise CommandError(message)
+
+        self.stdout.write(self.style.SUCCESS(result.summary()))
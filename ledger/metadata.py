@@ -0,0 +1,131 @@
+"""
+Per-user expense metadata (ExpenseMetadata).
+
+Keeps the year and category selectors O(1): instead of DISTINCT scans over
+Expense, pages read one row holding the first/last expense date, the years
+with data and the categories used per month. ledger.rollups forwards each
+batch of deltas here after the rollup tables are updated; additions are
+applied directly, removals are confirmed against the monthly rollups. A
+missing row is built lazily on first read; both hold the user's rollup lock
+(versions.lock), so no write is lost in between.
+"""
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Max, Min
+
+from . import periods, versions
+from .models import ExpenseDailyTotal, ExpenseMetadata, ExpenseMonthlyTotal
+
+
+def month_key(day):
+    return f"{day.year:04d}-{day.month:02d}"
+
+
+def _compute(user_id):
+    dates = ExpenseDailyTotal.objects.filter(user_id=user_id).aggregate(first=Min('date'), last=Max('date'))
+    month_categories = defaultdict(set)
+    for month, category_id in (
+        ExpenseMonthlyTotal.objects
+        .filter(user_id=user_id, count__gt=0)
+        .values_list('month', 'category_id')
+    ):
+        categories = month_categories[month_key(month)]
+        if category_id is not None:
+            categories.add(category_id)
+    return {
+        'first_date': dates['first'],
+        'last_date': dates['last'],
+        'years': sorted({int(key[:4]) for key in month_categories}),
+        'month_categories': {key: sorted(ids) for key, ids in sorted(month_categories.items())},
+    }
+
+
+def rebuild(user_id):
+    """Recompute one user's metadata from the rollup tables."""
+    with transaction.atomic():
+        # As in pivots.build(): a rollup write either committed before the
+        # read below or patches the saved row afterwards in apply_deltas()
+        versions.lock([user_id])
+        meta, _ = ExpenseMetadata.objects.update_or_create(user_id=user_id, defaults=_compute(user_id))
+    return meta
+
+
+def invalidate(user_ids=None):
+    """Drop metadata so it is rebuilt lazily (e.g. after a rollup rebuild)."""
+    metas = ExpenseMetadata.objects.all()
+    if user_ids is not None:
+        metas = metas.filter(user_id__in=user_ids)
+    metas.delete()
+
+
+def get_metadata(user_id):
+    meta = ExpenseMetadata.objects.filter(user_id=user_id).first()
+    return meta if meta is not None else rebuild(user_id)
+
+
+def apply_deltas(deltas):
+    """
+    Update existing metadata rows for rollup deltas
+    ({(user_id, date, category_id, subcategory_id): (amount, count)}).
+    Must run after the rollup tables reflect the deltas.
+    """
+    by_user = defaultdict(list)
+    for (user_id, day, category_id, _subcategory_id), (_amount, count) in deltas.items():
+        if count:
+            by_user[user_id].append((day, category_id, count))
+    if not by_user:
+        return
+
+    with transaction.atomic():
+        for user_id, changes in by_user.items():
+            meta = ExpenseMetadata.objects.select_for_update().filter(user_id=user_id).first()
+            if meta is None:
+                continue  # built lazily on first read
+            years = set(meta.years)
+            month_categories = {k: set(v) for k, v in meta.month_categories.items()}
+            recheck_bounds = False
+
+            for day, category_id, count in changes:
+                key = month_key(day)
+                if count > 0:
+                    years.add(day.year)
+                    categories = month_categories.setdefault(key, set())
+                    if category_id is not None:
+                        categories.add(category_id)
+                    meta.first_date = min(meta.first_date or day, day)
+                    meta.last_date = max(meta.last_date or day, day)
+                    continue
+
+                # Removal: keep the month/category/year only if rollups still hold rows for it
+                month_rows = ExpenseMonthlyTotal.objects.filter(
+                    user_id=user_id, month=periods.month_bounds(day.year, day.month)[0], count__gt=0,
+                )
+                if not month_rows.exists():
+                    month_categories.pop(key, None)
+                elif category_id is not None and not month_rows.filter(category_id=category_id).exists():
+                    month_categories.get(key, set()).discard(category_id)
+                if not any(k.startswith(f"{day.year:04d}-") for k in month_categories):
+                    years.discard(day.year)
+                if day in (meta.first_date, meta.last_date):
+                    recheck_bounds = True
+
+            if recheck_bounds:
+                bounds = ExpenseDailyTotal.objects.filter(user_id=user_id).aggregate(first=Min('date'), last=Max('date'))
+                meta.first_date, meta.last_date = bounds['first'], bounds['last']
+
+            meta.years = sorted(years)
+            meta.month_categories = {k: sorted(v) for k, v in sorted(month_categories.items())}
+            meta.save()
+
+
+def year_options(user_id, today, recent=1):
+    """Years with data plus the `recent` most recent calendar years, newest first."""
+    years = set(get_metadata(user_id).years)
+    years.update(range(today.year, today.year - recent, -1))
+    return sorted(years, reverse=True)
+
+
+def categories_for_month(user_id, year, month):
+    """Ids of the categories with expenses in the given month."""
+    return get_metadata(user_id).month_categories.get(f"{year:04d}-{month:02d}", [])
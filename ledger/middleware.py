@@ -1,70 +1,297 @@
 # ledger/middleware.py
-from datetime import datetime, timedelta, timezone
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
 from django.shortcuts import redirect
 from django.urls import reverse
+from django.contrib.sessions.backends.base import UpdateError
+from django.contrib.sessions.exceptions import SessionInterrupted
 from django.contrib.sessions.middleware import SessionMiddleware
-from Expense_Tracker import settings
+from django.utils.cache import patch_vary_headers
+from django.utils.http import http_date
+from django.conf import settings
+from django.db import connection
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import HttpResponse
+
+from . import activity, instrumentation
+
+logger = logging.getLogger(__name__)
+
+
+class ProbeMiddleware:
+    """
+    Answers health probes at the front of the stack.
+
+    Requests for PROBE_PATHS never reach the session, auth, allauth or
+    messages middleware (nor SecurityMiddleware's SSL redirect and host
+    checks, which container probes on 127.0.0.1 would trip). "live" paths
+    return 200 without touching the DB; "ready" paths also check that the
+    database answers, reusing the result for PROBE_READY_TTL seconds so
+    frequent probes cost one SELECT 1 per interval per process.
+    Static files are served by WhiteNoise, which also runs before sessions.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.paths = dict(getattr(settings, 'PROBE_PATHS', {'/healthz': 'live', '/health/': 'live'}))
+        self.ready_ttl = getattr(settings, 'PROBE_READY_TTL', 5)
+        self._ready = (float('-inf'), False)  # (checked at, database reachable)
+        self._lock = threading.Lock()
+
+    def __call__(self, request):
+        kind = self.paths.get(request.path_info)
+        if kind is None or request.method not in ('GET', 'HEAD'):
+            return self.get_response(request)
+        if kind == 'ready' and not self.database_ready():
+            response = HttpResponse("database unavailable", status=503, content_type="text/plain")
+        else:
+            response = HttpResponse("ok", content_type="text/plain")
+        response['Cache-Control'] = 'no-store'
+        return response
+
+    def database_ready(self):
+        checked_at, ok = self._ready
+        if time.monotonic() - checked_at < self.ready_ttl:
+            return ok
+        # One thread re-checks; concurrent probes get the last known result
+        if not self._lock.acquire(blocking=False):
+            return ok
+        try:
+            try:
+                with connection.cursor() as cursor:
+                    cursor.execute("SELECT 1")
+                ok = True
+            except Exception:
+                logger.warning("Readiness probe: database unavailable", exc_info=True)
+                ok = False
+            self._ready = (time.monotonic(), ok)
+        finally:
+            self._lock.release()
+        return ok
+
+
+class RequestTimingMiddleware:
+    """
+    Times DB queries, the view and template rendering for each request
+    (ledger.instrumentation). The result goes out in a Server-Timing header
+    and into the per-URL stats shown by the perf_stats view. It sits just
+    below WhiteNoise, so static files and health probes are not timed, but
+    the session and auth queries are. PERF_INSTRUMENTATION = False removes
+    it from the stack.
+    """
+    def __init__(self, get_response):
+        if not instrumentation.enabled():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timer = request._timer = instrumentation.RequestTimer()
+        with timer.active():
+            response = self.get_response(request)
+        timer.view_finished = time.perf_counter()
+        response['Server-Timing'] = timer.server_timing()
+        if response.streaming and not getattr(response, 'is_async', False):
+            # The body (and its queries) comes after this returns
+            response.streaming_content = self._stream(request, timer, response.streaming_content)
+        else:
+            instrumentation.stats.add(instrumentation.url_name(request), timer.sample())
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request._timer.view_started = time.perf_counter()
+
+    def _stream(self, request, timer, content):
+        iterator = iter(content)
+        try:
+            while True:
+                with timer.active():
+                    try:
+                        chunk = next(iterator)
+                    except StopIteration:
+                        return
+                yield chunk
+        finally:
+            instrumentation.stats.add(instrumentation.url_name(request), timer.sample())
+
 
 class IdleSessionTimeoutMiddleware:
     """
-    Logs out the user if there is no activity for IDLE_TIMEOUT minutes.
-    We store 'last_activity' in the session and update it on each request.
+    Logs out the user if there is no activity for SESSION_IDLE_TIMEOUT seconds.
+
+    'last_activity' (epoch seconds) is stored in the session, but only
+    rewritten once the stored value is SESSION_ACTIVITY_GRANULARITY seconds
+    old, so a burst of page views costs one session write instead of one per
+    request. Every request's own time goes into the signed activity cookie
+    (ledger.activity) instead, which costs no write, and the idle check runs
+    against the later of the two: a user is logged out exactly
+    SESSION_IDLE_TIMEOUT seconds after their last request, not up to the
+    granularity earlier. Without a valid cookie the check falls back to the
+    session value alone.
+
+    The heartbeat view reads the same cookie instead of the session.
+    Heartbeat requests are passed straight through: that view does its own
+    checks.
     """
     def __init__(self, get_response):
         self.get_response = get_response
-        # default 60 minutes; override with env var if needed
-        self.idle_timeout = timedelta(minutes=60)
+        # default 60 minutes; override with SESSION_IDLE_TIMEOUT
+        self.idle_timeout = activity.idle_timeout()
+        self.granularity = activity.granularity()
+        self._exempt_paths = None
+        self._heartbeat_path = None
+
+    @property
+    def exempt_paths(self):
+        # Paths we don't want to trigger redirects (login, logout, keepalive);
+        # resolved on first use, when the URLconf is loaded
+        if self._exempt_paths is None:
+            self._exempt_paths = frozenset((reverse("login"), reverse("logout"), reverse("keepalive")))
+        return self._exempt_paths
+
+    @property
+    def heartbeat_path(self):
+        if self._heartbeat_path is None:
+            self._heartbeat_path = reverse("heartbeat")
+        return self._heartbeat_path
+
+    @staticmethod
+    def last_activity(session):
+        last = session.get("last_activity")
+        if isinstance(last, str):
+            # Sessions written before activity was stored as a timestamp
+            last = datetime.fromisoformat(last).timestamp()
+        return last
+
+    @staticmethod
+    def cookie_activity(request):
+        """The last request time from the activity cookie, if it belongs to this user and session."""
+        state = activity.read(request.COOKIES.get(activity.cookie_name()), request.session.session_key)
+        if state is None or state.user_id != str(request.user.pk):
+            return None
+        return state.last_activity
 
     def __call__(self, request):
-        if request.user.is_authenticated:
-            now = datetime.now(timezone.utc)
-            last = request.session.get("last_activity")
+        if request.path == self.heartbeat_path:
+            return self.get_response(request)
 
-            # Paths we don't want to trigger redirects (login, logout, keepalive, static, admin login)
+        if request.user.is_authenticated:
+            now = time.time()
             path = request.path
-            exempt_paths = {
-                reverse("login"),
-                reverse("logout"),
-                reverse("keepalive"),  # we’ll add this
-            }
-            # Allow admin login page; avoid redirect loops
-            if path.startswith("/admin/login"):
-                exempt_paths.add(path)
-
             try:
-                # Update or check idle time
-                if last:
-                    last_dt = datetime.fromisoformat(last)
-                    if now - last_dt > self.idle_timeout and path not in exempt_paths:
-                        # Clear the session; redirect to login with a message param if you want
-                        for k in ["last_activity"]:
-                            request.session.pop(k, None)
-                        return redirect(f"{reverse('login')}?next={request.path}")
-                # Update activity timestamp on any authenticated request
-                request.session["last_activity"] = now.isoformat()
+                stored = self.last_activity(request.session)
+                last = stored
+                fresher = self.cookie_activity(request)
+                if fresher is not None and (last is None or fresher > last):
+                    last = fresher
+
+                # Allow admin login page; avoid redirect loops
+                exempt = path in self.exempt_paths or path.startswith("/admin/login")
+                if last is not None and now - last > self.idle_timeout and not exempt:
+                    request.session.pop("last_activity", None)
+                    response = redirect(f"{reverse('login')}?next={request.path}")
+                    activity.delete_cookie(response)
+                    return response
+                # Coalesce: only touch the session when the stored value is stale
+                if stored is None or now - stored >= self.granularity:
+                    request.session["last_activity"] = int(now)
             except Exception:
                 # Be defensive: if parsing failed, reset the timestamp
-                request.session["last_activity"] = now.isoformat()
+                request.session["last_activity"] = int(now)
 
         response = self.get_response(request)
+        self.sync_activity_cookie(request, response)
         return response
-    
+
+    def sync_activity_cookie(self, request, response):
+        """Record this request in the activity cookie, with the session's last_activity."""
+        # request.user may have changed in the view (login, logout)
+        token = request.COOKIES.get(activity.cookie_name())
+        if not request.user.is_authenticated:
+            if token:
+                activity.delete_cookie(response)
+            return
+        session = request.session
+        now = int(time.time())
+        try:
+            stored = self.last_activity(session)
+        except ValueError:
+            stored = None
+        if stored is None:
+            # Just signed in (login() cycles the session)
+            stored = now
+            session["last_activity"] = stored
+        if session.session_key is None:
+            return
+        if activity.read(token, session.session_key) != (str(request.user.pk), now, int(stored)):
+            activity.set_cookie(response, activity.issue(request.user.pk, session.session_key, now, stored))
+
 class SeparateSessionMiddleware(SessionMiddleware):
     """
     Separate admin and frontend sessions using different cookie names.
     Admin uses 'admin_sessionid', frontend uses 'sessionid'.
     Inherits from SessionMiddleware to pass Django's admin checks.
+
+    The cookie name is chosen per request (SessionMiddleware itself always
+    uses SESSION_COOKIE_NAME, and one middleware instance serves all
+    threads), and both cookies go through the configured SESSION_ENGINE.
     """
-    def process_request(self, request):
+    ADMIN_COOKIE_NAME = 'admin_sessionid'
+
+    def cookie_name(self, request):
         if request.path.startswith('/admin/'):
-            self.cookie_name = 'admin_sessionid'
-        else:
-            self.cookie_name = 'sessionid'
-        super().process_request(request)
+            return self.ADMIN_COOKIE_NAME
+        return settings.SESSION_COOKIE_NAME
+
+    def process_request(self, request):
+        request.session = self.SessionStore(request.COOKIES.get(self.cookie_name(request)))
 
     def process_response(self, request, response):
-        if request.path.startswith('/admin/'):
-            self.cookie_name = 'admin_sessionid'
-        else:
-            self.cookie_name = 'sessionid'
-        return super().process_response(request, response)
\ No newline at end of file
+        # SessionMiddleware.process_response with the per-request cookie name
+        try:
+            accessed = request.session.accessed
+            modified = request.session.modified
+            empty = request.session.is_empty()
+        except AttributeError:
+            return response
+        cookie_name = self.cookie_name(request)
+        if cookie_name in request.COOKIES and empty:
+            response.delete_cookie(
+                cookie_name,
+                path=settings.SESSION_COOKIE_PATH,
+                domain=settings.SESSION_COOKIE_DOMAIN,
+                samesite=settings.SESSION_COOKIE_SAMESITE,
+            )
+            patch_vary_headers(response, ("Cookie",))
+            return response
+        if accessed:
+            patch_vary_headers(response, ("Cookie",))
+        if (modified or settings.SESSION_SAVE_EVERY_REQUEST) and not empty:
+            if request.session.get_expire_at_browser_close():
+                max_age = None
+                expires = None
+            else:
+                max_age = request.session.get_expiry_age()
+                expires = http_date(time.time() + max_age)
+            # Skip session save for 5xx responses
+            if response.status_code < 500:
+                try:
+                    request.session.save()
+                except UpdateError:
+                    raise SessionInterrupted(
+                        "The request's session was deleted before the "
+                        "request completed. The user may have logged "
+                        "out in a concurrent request, for example."
+                    )
+                response.set_cookie(
+                    cookie_name,
+                    request.session.session_key,
+                    max_age=max_age,
+                    expires=expires,
+                    domain=settings.SESSION_COOKIE_DOMAIN,
+                    path=settings.SESSION_COOKIE_PATH,
+                    secure=settings.SESSION_COOKIE_SECURE or None,
+                    httponly=settings.SESSION_COOKIE_HTTPONLY or None,
+                    samesite=settings.SESSION_COOKIE_SAMESITE,
+                )
+        return response
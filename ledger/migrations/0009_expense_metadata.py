@@ -0,0 +1,27 @@
+# Generated by Django 4.2.20 on 2026-10-18 19:29
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('ledger', '0008_expense_pivot_snapshot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExpenseMetadata',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='expense_metadata', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('first_date', models.DateField(blank=True, null=True)),
+                ('last_date', models.DateField(blank=True, null=True)),
+                ('years', models.JSONField(default=list)),
+                ('month_categories', models.JSONField(default=dict)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.20 on 2026-10-18 19:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ledger', '0010_export_job'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='exportjob',
+            name='format',
+            field=models.CharField(choices=[('csv', 'CSV'), ('xlsx', 'Excel'), ('ndjson', 'NDJSON'), ('parquet', 'Parquet')], default='csv', max_length=10),
+        ),
+    ]
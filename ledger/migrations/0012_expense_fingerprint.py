@@ -0,0 +1,22 @@
+# Generated by Django 4.2.20 on 2026-10-18 19:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ledger', '0011_export_job_parquet'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='expense',
+            name='fingerprint',
+            field=models.CharField(blank=True, default='', editable=False, max_length=32),
+        ),
+        migrations.AddIndex(
+            model_name='expense',
+            index=models.Index(condition=models.Q(('fingerprint', ''), _negated=True), fields=['user', 'fingerprint'], name='expense_user_fp_idx'),
+        ),
+    ]
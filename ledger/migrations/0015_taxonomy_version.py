@@ -0,0 +1,27 @@
+# Generated by Django 4.2.20 on 2026-10-18 20:19
+
+from django.db import migrations, models
+
+
+def create_version_row(apps, schema_editor):
+    # ledger.taxonomy reads and bumps the row with pk=1
+    TaxonomyVersion = apps.get_model('ledger', 'TaxonomyVersion')
+    TaxonomyVersion.objects.get_or_create(pk=1, defaults={'version': 1})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ledger', '0014_user_data_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TaxonomyVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(create_version_row, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 4.2.20 on 2026-10-18 20:38
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def release_duplicate_fingerprints(apps, schema_editor):
+    # Concurrent imports could store one statement row twice; keep both
+    # expenses, but only the oldest keeps the fingerprint
+    Expense = apps.get_model('ledger', 'Expense')
+    duplicates = (
+        Expense.objects.exclude(fingerprint='')
+        .values('user_id', 'fingerprint')
+        .annotate(n=Count('id'), keep=Min('id'))
+        .filter(n__gt=1)
+        .order_by()
+    )
+    for row in duplicates.iterator():
+        (Expense.objects
+         .filter(user_id=row['user_id'], fingerprint=row['fingerprint'])
+         .exclude(pk=row['keep'])
+         .update(fingerprint=''))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ledger', '0017_expense_sync_version'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='expense',
+            name='expense_user_fp_idx',
+        ),
+        migrations.RunPython(release_duplicate_fingerprints, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='expense',
+            constraint=models.UniqueConstraint(condition=models.Q(('fingerprint', ''), _negated=True), fields=('user', 'fingerprint'), name='expense_user_fp_uniq'),
+        ),
+    ]
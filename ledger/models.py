@@ -1,4 +1,4 @@
-from django.db import models
+from django.db import models, transaction
 from django.conf import settings
 from django.core.validators import MinValueValidator
 
@@ -38,10 +38,201 @@ class Expense(models.Model):
     description = models.CharField(max_length=255, blank=True)
     date = models.DateField()
     created_at = models.DateTimeField(auto_now_add=True)
+    # Bumped on every write, including bulk_update (ledger.bulk) and the
+    # subcategory SET_NULL cascade
+    updated_at = models.DateTimeField(auto_now=True)
+    # The owner's UserDataVersion taken by the write that last touched the row;
+    # commit-ordered per user, it drives delta sync (ledger.sync)
+    sync_version = models.BigIntegerField(default=0, editable=False)
+    # Set for rows imported from bank statements (ledger.imports.fingerprint), '' otherwise
+    fingerprint = models.CharField(max_length=32, blank=True, default='', editable=False)
 
     class Meta:
         ordering = ['-date', '-created_at']
+        indexes = [
+            # Range scans for a user's period (dashboard, pivot, export) in display order
+            models.Index(fields=['user', 'date', 'created_at'], name='expense_user_date_idx'),
+            models.Index(fields=['user', 'category', 'date'], name='expense_user_cat_date_idx'),
+            # Delta sync: a user's rows written after a given data version
+            models.Index(fields=['user', 'sync_version'], name='expense_user_sync_idx'),
+        ]
+        constraints = [
+            # Duplicate detection on statement re-import, also between concurrent
+            # imports; only imported rows are indexed
+            models.UniqueConstraint(fields=['user', 'fingerprint'], name='expense_user_fp_uniq',
+                                    condition=~models.Q(fingerprint='')),
+        ]
 
     def __str__(self):
         cat_name = self.subcategory.full_name if self.subcategory else self.category.name
-        return f"{self.date} - ₹{self.amount} ({cat_name})"
\ No newline at end of file
+        return f"{self.date} - ₹{self.amount} ({cat_name})"
+
+    def save(self, *args, **kwargs):
+        # Keep the row and its rollup updates (ledger/signals.py) in one transaction
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            return super().delete(*args, **kwargs)
+
+class ExpenseTombstone(models.Model):
+    """A deleted expense, kept so delta sync (ledger.sync) can report the deletion."""
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    expense_id = models.BigIntegerField()
+    deleted_at = models.DateTimeField(auto_now_add=True)
+    # The owner's UserDataVersion taken by the deleting write (see Expense.sync_version)
+    sync_version = models.BigIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'deleted_at'], name='tombstone_user_deleted_idx'),
+            models.Index(fields=['user', 'sync_version'], name='tombstone_user_sync_idx'),
+        ]
+
+    def __str__(self):
+        return f"Expense {self.expense_id} deleted {self.deleted_at:%Y-%m-%d %H:%M}"
+
+class ExpenseDailyTotal(models.Model):
+    """Running per-day total of a user's expenses, maintained by ledger.rollups."""
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    date = models.DateField()
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, null=True, blank=True)
+    subcategory = models.ForeignKey(Subcategory, on_delete=models.CASCADE, null=True, blank=True)
+    total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ('user', 'date', 'category', 'subcategory')
+
+    def __str__(self):
+        return f"{self.user_id} {self.date} - ₹{self.total}"
+
+class ExpenseMonthlyTotal(models.Model):
+    """Running per-month total of a user's expenses; `month` is the first day of the month."""
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    month = models.DateField()
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, null=True, blank=True)
+    subcategory = models.ForeignKey(Subcategory, on_delete=models.CASCADE, null=True, blank=True)
+    total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ('user', 'month', 'category', 'subcategory')
+
+    def __str__(self):
+        return f"{self.user_id} {self.month:%Y-%m} - ₹{self.total}"
+
+class ExpensePivotSnapshot(models.Model):
+    """
+    A user's expenses for one year as a (category, subcategory) x month matrix,
+    maintained by ledger.pivots. `rows` maps "<category_id>:<subcategory_id>"
+    to 12 monthly totals in paise.
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    year = models.PositiveSmallIntegerField()
+    rows = models.JSONField(default=dict)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('user', 'year')
+
+    def __str__(self):
+        return f"{self.user_id} {self.year} pivot"
+
+class ExpenseMetadata(models.Model):
+    """
+    Per-user index of where expenses exist, maintained by ledger.metadata:
+    first/last expense date, the years with data and the categories used in
+    each month ("YYYY-MM" -> [category ids]).
+    """
+    user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, primary_key=True,
+                                related_name='expense_metadata')
+    first_date = models.DateField(null=True, blank=True)
+    last_date = models.DateField(null=True, blank=True)
+    years = models.JSONField(default=list)
+    month_categories = models.JSONField(default=dict)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.user_id} expense metadata"
+
+class UserDataVersion(models.Model):
+    """
+    Counter bumped by every write to a user's expenses (ledger.versions);
+    with the taxonomy it keys the ETags of the user's pages, and the value a
+    write took is stamped on the rows it touched for delta sync.
+    """
+    user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, primary_key=True,
+                                related_name='data_version')
+    version = models.BigIntegerField(default=0)
+    modified = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.user_id} data version {self.version}"
+
+class TaxonomyVersion(models.Model):
+    """
+    Single-row counter bumped in the same transaction as every Category or
+    Subcategory write (ledger.taxonomy), so all processes agree on it.
+    """
+    version = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"taxonomy version {self.version}"
+
+class ExportJob(models.Model):
+    """
+    A background expense export run by ledger.jobs. `params` holds the
+    resolved filters (start, end exclusive, category_id, label); `file` is the
+    artifact's path relative to settings.EXPORT_ROOT once the job is done.
+    """
+    FORMAT_CHOICES = [
+        ('csv', 'CSV'),
+        ('xlsx', 'Excel'),
+        ('ndjson', 'NDJSON'),
+        ('parquet', 'Parquet'),
+    ]
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_DONE, 'Done'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+    ACTIVE_STATUSES = (STATUS_PENDING, STATUS_RUNNING)
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='export_jobs')
+    format = models.CharField(max_length=10, choices=FORMAT_CHOICES, default='csv')
+    params = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    rows_total = models.PositiveIntegerField(null=True, blank=True)
+    rows_written = models.PositiveIntegerField(default=0)
+    file = models.CharField(max_length=255, blank=True)
+    size = models.PositiveBigIntegerField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', 'status'], name='exportjob_user_status_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} {self.format} export ({self.status})"
+
+    @property
+    def progress(self):
+        """Percent complete, 0-100."""
+        if self.status == self.STATUS_DONE:
+            return 100
+        if not self.rows_total:
+            return 0
+        return min(99, self.rows_written * 100 // self.rows_total)
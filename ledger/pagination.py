@@ -0,0 +1,129 @@
+"""
+Keyset (cursor) pagination for the REST API.
+
+Pages follow Expense's natural order (-date, -created_at, id). The cursor
+holds the (date, created_at, id) of the row at the page edge, and the next
+page is a range condition on that key rather than an OFFSET, so every page
+is one index range scan of page_size + 1 rows no matter how deep it is.
+Cursors are opaque to clients: follow the `next` / `previous` links.
+"""
+import base64
+from datetime import date, datetime
+
+from django.db.models import Q
+from django.utils.encoding import force_str
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+ORDERING = ('-date', '-created_at', 'id')
+REVERSED = ('date', 'created_at', '-id')
+
+
+def _after(position):
+    """Rows after `position` in ORDERING."""
+    day, created_at, pk = position
+    return (
+        Q(date__lt=day)
+        | Q(date=day, created_at__lt=created_at)
+        | Q(date=day, created_at=created_at, id__gt=pk)
+    )
+
+
+def _before(position):
+    """Rows before `position` in ORDERING (i.e. after it in REVERSED)."""
+    day, created_at, pk = position
+    return (
+        Q(date__gt=day)
+        | Q(date=day, created_at__gt=created_at)
+        | Q(date=day, created_at=created_at, id__lt=pk)
+    )
+
+
+class KeysetPagination(BasePagination):
+    page_size = 100
+    max_page_size = 1000
+    page_size_query_param = 'page_size'
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        position, reverse = self.decode_cursor(request)
+
+        if reverse:
+            queryset = queryset.order_by(*REVERSED).filter(_before(position))
+        else:
+            queryset = queryset.order_by(*ORDERING)
+            if position is not None:
+                queryset = queryset.filter(_after(position))
+
+        rows = list(queryset[:self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        del rows[self.page_size:]
+        if reverse:
+            rows.reverse()
+            self.has_previous, self.has_next = has_more, True
+        else:
+            self.has_previous, self.has_next = position is not None, has_more
+        self.page = rows
+        return rows
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(size, 1), self.max_page_size)
+
+    def decode_cursor(self, request):
+        """(position, reverse) from the request; (None, False) for the first page."""
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            raw = force_str(base64.urlsafe_b64decode(encoded.encode('ascii')))
+            direction, day, created_at, pk = raw.split('|')
+            position = (date.fromisoformat(day), datetime.fromisoformat(created_at), int(pk))
+        except (TypeError, ValueError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+        return position, direction == 'p'
+
+    def encode_cursor(self, row, reverse):
+        raw = f"{'p' if reverse else 'n'}|{row.date.isoformat()}|{row.created_at.isoformat()}|{row.pk}"
+        encoded = base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        if not self.page:
+            # An empty page reached backwards: start over from the top
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
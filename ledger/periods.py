@@ -0,0 +1,128 @@
+"""
+Sargable period filters.
+
+`date__year=` / `date__month=` compile to EXTRACT() and cannot use the
+(user, date, ...) indexes on Expense. These helpers turn a year, month, day
+or arbitrary range into half-open [start, end) bounds and the matching
+`__gte` / `__lt` filter kwargs.
+"""
+from datetime import date, timedelta
+
+
+def year_bounds(year):
+    return date(year, 1, 1), date(year + 1, 1, 1)
+
+
+def month_bounds(year, month):
+    start = date(year, month, 1)
+    if month == 12:
+        return start, date(year + 1, 1, 1)
+    return start, date(year, month + 1, 1)
+
+
+def day_bounds(day):
+    return day, day + timedelta(days=1)
+
+
+def range_bounds(start, end):
+    """Bounds for an inclusive [start, end] date range."""
+    return start, end + timedelta(days=1)
+
+
+def date_filter(bounds, field='date'):
+    """Filter kwargs for `bounds` on a DateField, e.g. qs.filter(**date_filter(year_bounds(2025)))."""
+    start, end = bounds
+    return {f'{field}__gte': start, f'{field}__lt': end}
+
+
+def year_filter(year, field='date'):
+    return date_filter(year_bounds(year), field)
+
+
+def month_filter(year, month, field='date'):
+    return date_filter(month_bounds(year, month), field)
+
+
+def day_filter(day, field='date'):
+    return date_filter(day_bounds(day), field)
+
+
+def range_filter(start, end, field='date'):
+    return date_filter(range_bounds(start, end), field)
+
+
+# --- Bucketed ranges -------------------------------------------------------
+
+GRANULARITIES = ('day', 'week', 'month', 'quarter')
+GRANULARITY_LABELS = {'day': 'Daily', 'week': 'Weekly', 'month': 'Monthly', 'quarter': 'Quarterly'}
+
+# Upper bound on columns in a range pivot (a year of days)
+MAX_BUCKETS = 366
+
+
+def bucket_start(day, granularity):
+    """Start of the bucket containing `day`; matches Trunc<granularity> in the DB."""
+    if granularity == 'day':
+        return day
+    if granularity == 'week':
+        return day - timedelta(days=day.weekday())
+    if granularity == 'month':
+        return day.replace(day=1)
+    if granularity == 'quarter':
+        return date(day.year, 3 * ((day.month - 1) // 3) + 1, 1)
+    raise ValueError(f"Unknown granularity: {granularity!r}")
+
+
+def _next_bucket(start, granularity):
+    if granularity == 'day':
+        return start + timedelta(days=1)
+    if granularity == 'week':
+        return start + timedelta(days=7)
+    step = 1 if granularity == 'month' else 3
+    month = start.month - 1 + step
+    return date(start.year + month // 12, month % 12 + 1, 1)
+
+
+def buckets(start, end, granularity):
+    """Bucket start dates covering the inclusive range [start, end]."""
+    result = []
+    current = bucket_start(start, granularity)
+    while current <= end:
+        result.append(current)
+        if len(result) > MAX_BUCKETS:
+            raise ValueError(
+                f"Range too large: more than {MAX_BUCKETS} {granularity} buckets; "
+                f"use a coarser granularity."
+            )
+        current = _next_bucket(current, granularity)
+    return result
+
+
+def bucket_label(start, granularity):
+    if granularity == 'day':
+        return start.strftime('%d %b %Y')
+    if granularity == 'week':
+        return f"Wk {start.strftime('%d %b %Y')}"
+    if granularity == 'month':
+        return start.strftime('%b %Y')
+    return f"Q{(start.month - 1) // 3 + 1} {start.year}"
+
+
+def parse_range(params, default_granularity='month'):
+    """
+    Read `start`, `end` (ISO dates, inclusive) and `granularity` from a
+    QueryDict. Raises ValueError with a user-facing message on bad input.
+    """
+    try:
+        start = date.fromisoformat(params.get('start', ''))
+        end = date.fromisoformat(params.get('end', ''))
+    except ValueError:
+        raise ValueError("start and end must be dates in YYYY-MM-DD format.")
+    if end < start:
+        raise ValueError("end must not be before start.")
+    if end >= date.max:
+        raise ValueError("end is out of range.")
+    granularity = params.get('granularity') or default_granularity
+    if granularity not in GRANULARITIES:
+        raise ValueError(f"granularity must be one of: {', '.join(GRANULARITIES)}.")
+    return start, end, granularity
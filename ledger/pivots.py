@@ -0,0 +1,138 @@
+"""
+Persisted yearly pivot snapshots for the Analysis page.
+
+Each ExpensePivotSnapshot holds one user's year as a matrix of monthly totals
+(in paise) per (category, subcategory). ledger.rollups forwards every expense
+delta here so existing snapshots are patched in place; a missing snapshot is
+built lazily on first read with a vectorized ExpenseFrame pivot. Both hold
+the user's rollup lock (versions.lock), so no write is lost in between.
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import DateField, Sum
+from django.db.models.functions import Trunc
+
+from . import periods, versions
+from .frames import ExpenseFrame
+from .models import Expense, ExpensePivotSnapshot
+
+
+def to_paise(amount):
+    return int((Decimal(amount) * 100).to_integral_value())
+
+
+def from_paise(paise):
+    return Decimal(paise).scaleb(-2)
+
+
+def row_key(category_id, subcategory_id):
+    return f"{category_id or ''}:{subcategory_id or ''}"
+
+
+def parse_row_key(key):
+    category_id, subcategory_id = key.split(':')
+    return int(category_id) if category_id else None, int(subcategory_id) if subcategory_id else None
+
+
+def _patch(rows, changes):
+    for key, months in changes.items():
+        current = rows.get(key) or [0] * 12
+        current = [a + b for a, b in zip(current, months)]
+        if any(current):
+            rows[key] = current
+        else:
+            rows.pop(key, None)
+
+
+def apply_deltas(deltas):
+    """
+    Patch existing snapshots with rollup deltas
+    ({(user_id, date, category_id, subcategory_id): (amount, count)}).
+    Snapshots that do not exist yet are left to be built on read.
+    """
+    changes = defaultdict(lambda: defaultdict(lambda: [0] * 12))
+    for (user_id, day, category_id, subcategory_id), (amount, _count) in deltas.items():
+        if amount:
+            changes[(user_id, day.year)][row_key(category_id, subcategory_id)][day.month - 1] += to_paise(amount)
+    if not changes:
+        return
+
+    with transaction.atomic():
+        for (user_id, year), snapshot_changes in changes.items():
+            snapshot = (
+                ExpensePivotSnapshot.objects
+                .select_for_update()
+                .filter(user_id=user_id, year=year)
+                .first()
+            )
+            if snapshot is None:
+                continue
+            _patch(snapshot.rows, snapshot_changes)
+            snapshot.save(update_fields=['rows', 'updated_at'])
+
+
+def build(user_id, year):
+    """(Re)build a user's snapshot for `year` from the Expense rows."""
+    with transaction.atomic():
+        # Under the user's rollup lock (ledger.versions.lock), an expense write
+        # either committed before the read below or patches the saved snapshot
+        # afterwards in apply_deltas(); none falls between the two
+        versions.lock([user_id])
+        keys, matrix = ExpenseFrame.load(user_id, *periods.year_bounds(year)).month_pivot()
+        rows = {
+            row_key(category_id, subcategory_id): months
+            for (category_id, subcategory_id), months in zip(keys, matrix.tolist())
+            if any(months)
+        }
+        snapshot, _ = ExpensePivotSnapshot.objects.update_or_create(
+            user_id=user_id, year=year, defaults={'rows': rows},
+        )
+    return snapshot
+
+
+def get_snapshot(user_id, year):
+    snapshot = ExpensePivotSnapshot.objects.filter(user_id=user_id, year=year).first()
+    return snapshot if snapshot is not None else build(user_id, year)
+
+
+def invalidate(user_ids=None):
+    """Drop snapshots so they are rebuilt lazily (e.g. after a rollup rebuild)."""
+    snapshots = ExpensePivotSnapshot.objects.all()
+    if user_ids is not None:
+        snapshots = snapshots.filter(user_id__in=user_ids)
+    snapshots.delete()
+
+
+def year_rows(user_id, year):
+    """Snapshot rows as [(category_id, subcategory_id, [12 monthly totals in paise])]."""
+    snapshot = get_snapshot(user_id, year)
+    return [(*parse_row_key(key), months) for key, months in snapshot.rows.items()]
+
+
+def range_pivot(user_id, start, end, granularity):
+    """
+    Pivot an arbitrary inclusive date range into (category, subcategory) x
+    bucket totals with one grouped query, bucketing in the DB via Trunc.
+
+    Returns (bucket_starts, [(category_id, subcategory_id, [paise per bucket])]);
+    empty buckets are filled with zeros. Raises ValueError when the range
+    needs more than periods.MAX_BUCKETS columns.
+    """
+    bucket_starts = periods.buckets(start, end, granularity)
+    index = {b: i for i, b in enumerate(bucket_starts)}
+
+    grouped = (
+        Expense.objects
+        .filter(user_id=user_id, **periods.range_filter(start, end))
+        .annotate(bucket=Trunc('date', granularity, output_field=DateField()))
+        .values('category_id', 'subcategory_id', 'bucket')
+        .annotate(total=Sum('amount'))
+        .order_by()
+    )
+
+    rows = defaultdict(lambda: [0] * len(bucket_starts))
+    for row in grouped:
+        rows[(row['category_id'], row['subcategory_id'])][index[row['bucket']]] += to_paise(row['total'])
+    return bucket_starts, [(cat, sub, values) for (cat, sub), values in rows.items()]
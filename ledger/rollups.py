@@ -0,0 +1,254 @@
+"""
+Incrementally maintained per-user expense rollups.
+
+ExpenseDailyTotal / ExpenseMonthlyTotal hold running sums keyed by
+(user, day|month, category, subcategory). Signals in ledger/signals.py feed
+every Expense create/update/delete through `apply_deltas`, which also patches
+the yearly pivot snapshots (ledger.pivots) and per-user metadata
+(ledger.metadata). The `rebuild_rollups` management command recomputes them
+from scratch. Both hold the users' UserDataVersion row locks
+(versions.lock), so writers of one user's rollups never interleave.
+"""
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, F, Sum
+
+from . import metadata, pivots, versions
+from .models import Expense, ExpenseDailyTotal, ExpenseMonthlyTotal, UserDataVersion
+
+# Delta maps with more keys than this (bulk imports, batch API writes) are
+# applied with bulk reads/writes rather than per-key UPDATEs
+BULK_THRESHOLD = 20
+
+_suspended = threading.local()
+
+
+@contextmanager
+def suspended():
+    """
+    Turn off the per-row Expense signal bookkeeping (rollups, sync
+    tombstones) in this thread, for batch writers that apply one coalesced
+    delta map and write their own tombstones (e.g. around a filtered
+    QuerySet.delete(), which still sends post_delete for every row).
+    """
+    previous = getattr(_suspended, 'active', False)
+    _suspended.active = True
+    try:
+        yield
+    finally:
+        _suspended.active = previous
+
+
+def is_suspended():
+    return getattr(_suspended, 'active', False)
+
+
+def month_start(d):
+    return d.replace(day=1)
+
+
+def expense_key(values):
+    """(user_id, date, category_id, subcategory_id) for an expense-like mapping."""
+    return (values['user_id'], values['date'], values['category_id'], values['subcategory_id'])
+
+
+def snapshot(expense):
+    """Capture the rollup-relevant fields of an Expense instance."""
+    return {
+        'user_id': expense.user_id,
+        'date': expense.date,
+        'category_id': expense.category_id,
+        'subcategory_id': expense.subcategory_id,
+        'amount': Decimal(expense.amount),
+    }
+
+
+def diff(old=None, new=None):
+    """
+    Turn an (old, new) pair of snapshots into rollup deltas.
+    Returns {key: (amount_delta, count_delta)}; unchanged expenses produce {}.
+    """
+    deltas = defaultdict(lambda: [Decimal('0'), 0])
+    if old is not None:
+        d = deltas[expense_key(old)]
+        d[0] -= old['amount']
+        d[1] -= 1
+    if new is not None:
+        d = deltas[expense_key(new)]
+        d[0] += new['amount']
+        d[1] += 1
+    return {k: tuple(v) for k, v in deltas.items() if v[0] or v[1]}
+
+
+def merge(*delta_maps):
+    """Coalesce several delta maps into one, e.g. for a batch of writes."""
+    merged = defaultdict(lambda: [Decimal('0'), 0])
+    for deltas in delta_maps:
+        for key, (amount, count) in deltas.items():
+            merged[key][0] += amount
+            merged[key][1] += count
+    return {k: tuple(v) for k, v in merged.items() if v[0] or v[1]}
+
+
+def additions(expenses):
+    """Coalesced deltas for newly inserted expenses, e.g. after bulk_create (which skips signals)."""
+    deltas = defaultdict(lambda: [Decimal('0'), 0])
+    for expense in expenses:
+        d = deltas[(expense.user_id, expense.date, expense.category_id, expense.subcategory_id)]
+        d[0] += Decimal(expense.amount)
+        d[1] += 1
+    return {k: tuple(v) for k, v in deltas.items()}
+
+
+def _apply(model, period_field, key, amount, count):
+    user_id, period, category_id, subcategory_id = key
+    lookup = {
+        'user_id': user_id,
+        period_field: period,
+        'category_id': category_id,
+        'subcategory_id': subcategory_id,
+    }
+    updated = model.objects.filter(**lookup).update(
+        total=F('total') + amount,
+        count=F('count') + count,
+    )
+    if updated:
+        # Drop rows that no longer represent any expense
+        model.objects.filter(**lookup, count__lte=0).delete()
+        return
+    if count <= 0:
+        # Removal against a missing row (e.g. taxonomy cascade already deleted it)
+        return
+    model.objects.create(total=amount, count=count, **lookup)
+
+
+def _apply_many(model, period_field, deltas):
+    """
+    Apply a large delta map with one locking read and bulk writes, instead of
+    an UPDATE (+ INSERT) per key. Touched rows are replaced (DELETE + bulk
+    INSERT), which is far cheaper than a CASE-per-row bulk UPDATE.
+    """
+    user_ids = {key[0] for key in deltas}
+    period_values = [key[1] for key in deltas]
+    rows = model.objects.select_for_update().filter(
+        user_id__in=user_ids,
+        **{f'{period_field}__gte': min(period_values), f'{period_field}__lte': max(period_values)},
+    ).values_list('pk', 'user_id', period_field, 'category_id', 'subcategory_id', 'total', 'count')
+    existing = {tuple(row[1:5]): (row[0], row[5], row[6]) for row in rows}
+
+    replaced, to_create = [], []
+    for key, (amount, count) in deltas.items():
+        total = amount
+        if key in existing:
+            pk, old_total, old_count = existing[key]
+            replaced.append(pk)
+            total += old_total
+            count += old_count
+        if count > 0:
+            user_id, period, category_id, subcategory_id = key
+            to_create.append(model(
+                user_id=user_id, category_id=category_id, subcategory_id=subcategory_id,
+                total=total, count=count, **{period_field: period},
+            ))
+
+    for start in range(0, len(replaced), 500):
+        model.objects.filter(pk__in=replaced[start:start + 500]).delete()
+    model.objects.bulk_create(to_create, batch_size=500)
+
+
+def _apply_all(model, period_field, deltas):
+    if len(deltas) > BULK_THRESHOLD:
+        _apply_many(model, period_field, deltas)
+        return
+    for key, (amount, count) in deltas.items():
+        _apply(model, period_field, key, amount, count)
+
+
+def apply_deltas(deltas):
+    """Apply {(user_id, date, category_id, subcategory_id): (amount, count)} to both rollup tables."""
+    if not deltas:
+        return
+    monthly = defaultdict(lambda: [Decimal('0'), 0])
+    for (user_id, day, category_id, subcategory_id), (amount, count) in deltas.items():
+        m = monthly[(user_id, month_start(day), category_id, subcategory_id)]
+        m[0] += amount
+        m[1] += count
+    monthly = {k: tuple(v) for k, v in monthly.items() if v[0] or v[1]}
+
+    with transaction.atomic():
+        # One writer per user at a time: concurrent first writes to a key would
+        # otherwise both INSERT (duplicates where category/subcategory is NULL)
+        versions.lock({key[0] for key in deltas})
+        _apply_all(ExpenseDailyTotal, 'date', deltas)
+        _apply_all(ExpenseMonthlyTotal, 'month', monthly)
+        pivots.apply_deltas(deltas)
+        metadata.apply_deltas(deltas)
+
+
+def rebuild(user_ids=None, batch_size=1000):
+    """
+    Recompute both rollup tables from Expense rows.
+    Limited to `user_ids` when given; returns (daily_rows, monthly_rows) written.
+    """
+    expenses = Expense.objects.all()
+    daily = ExpenseDailyTotal.objects.all()
+    monthly = ExpenseMonthlyTotal.objects.all()
+    if user_ids is not None:
+        expenses = expenses.filter(user_id__in=user_ids)
+        daily = daily.filter(user_id__in=user_ids)
+        monthly = monthly.filter(user_id__in=user_ids)
+
+    grouped = (
+        expenses
+        .order_by()
+        .values('user_id', 'date', 'category_id', 'subcategory_id')
+        .annotate(total=Sum('amount'), count=Count('id'))
+    )
+
+    with transaction.atomic():
+        if user_ids is not None:
+            versions.lock(user_ids)
+        else:
+            # Every user with data or a version row; writers of those users
+            # wait until the rebuilt rows are committed
+            versions.lock(
+                set(UserDataVersion.objects.values_list('user_id', flat=True))
+                | set(Expense.objects.order_by().values_list('user_id', flat=True).distinct())
+            )
+        daily.delete()
+        monthly.delete()
+
+        daily_rows = []
+        monthly_acc = defaultdict(lambda: [Decimal('0'), 0])
+        for row in grouped.iterator():
+            daily_rows.append(ExpenseDailyTotal(
+                user_id=row['user_id'],
+                date=row['date'],
+                category_id=row['category_id'],
+                subcategory_id=row['subcategory_id'],
+                total=row['total'],
+                count=row['count'],
+            ))
+            m = monthly_acc[(row['user_id'], month_start(row['date']),
+                             row['category_id'], row['subcategory_id'])]
+            m[0] += row['total']
+            m[1] += row['count']
+        ExpenseDailyTotal.objects.bulk_create(daily_rows, batch_size=batch_size)
+
+        monthly_rows = [
+            ExpenseMonthlyTotal(
+                user_id=user_id, month=month, category_id=category_id,
+                subcategory_id=subcategory_id, total=total, count=count,
+            )
+            for (user_id, month, category_id, subcategory_id), (total, count) in monthly_acc.items()
+        ]
+        ExpenseMonthlyTotal.objects.bulk_create(monthly_rows, batch_size=batch_size)
+        pivots.invalidate(user_ids)
+        metadata.invalidate(user_ids)
+
+    return len(daily_rows), len(monthly_rows)
+
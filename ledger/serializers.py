@@ -0,0 +1,82 @@
+from decimal import Decimal
+
+from rest_framework import serializers
+
+from .models import Category, Expense, Subcategory
+
+
+class CategorySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Category
+        fields = ['id', 'name']
+
+
+class SubcategorySerializer(serializers.ModelSerializer):
+    category_name = serializers.CharField(source='category.name', read_only=True)
+
+    class Meta:
+        model = Subcategory
+        fields = ['id', 'name', 'category', 'category_name']
+
+
+class ExpenseSerializer(serializers.ModelSerializer):
+    """
+    An expense with its category and subcategory names inlined. The view
+    select_related()s both, so a page serializes without extra queries.
+    """
+    # Declared so the minimum is a Decimal (the model validator uses a float)
+    amount = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=Decimal('0.01'))
+    # allow_null: render null rather than dropping the key when there is no (sub)category
+    category_name = serializers.CharField(source='category.name', read_only=True, allow_null=True)
+    subcategory_name = serializers.CharField(source='subcategory.name', read_only=True, allow_null=True)
+
+    class Meta:
+        model = Expense
+        fields = [
+            'id', 'date', 'amount', 'category', 'category_name',
+            'subcategory', 'subcategory_name', 'description', 'created_at', 'updated_at',
+        ]
+        read_only_fields = ['created_at', 'updated_at']
+        extra_kwargs = {
+            'category': {'required': True, 'allow_null': False},
+        }
+
+    def validate(self, attrs):
+        # Same rule as ExpenseForm; on partial updates compare with the stored values
+        category = attrs.get('category', getattr(self.instance, 'category', None))
+        subcategory = attrs.get('subcategory', getattr(self.instance, 'subcategory', None))
+        if category and subcategory and subcategory.category_id != category.pk:
+            raise serializers.ValidationError(
+                {'subcategory': "Subcategory does not belong to the selected category."}
+            )
+        return attrs
+
+
+class BulkExpenseSerializer(serializers.Serializer):
+    """
+    One create/update item of a bulk write. Category and subcategory ids are
+    checked against the cached taxonomy (context['taxonomy']) instead of one
+    query per item; `instance`, when given, is the expense being updated.
+    """
+    date = serializers.DateField()
+    amount = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=Decimal('0.01'))
+    category = serializers.IntegerField()
+    subcategory = serializers.IntegerField(required=False, allow_null=True)
+    description = serializers.CharField(max_length=255, required=False, allow_blank=True)
+
+    def validate(self, attrs):
+        taxonomy = self.context['taxonomy']
+        category = attrs.get('category', getattr(self.instance, 'category_id', None))
+        subcategory = attrs.get('subcategory', getattr(self.instance, 'subcategory_id', None))
+        if 'category' in attrs and category not in taxonomy.category_names:
+            raise serializers.ValidationError({'category': f"Invalid pk \"{category}\" - object does not exist."})
+        if 'subcategory' in attrs and subcategory is not None:
+            if subcategory not in taxonomy.subcategory_names:
+                raise serializers.ValidationError(
+                    {'subcategory': f"Invalid pk \"{subcategory}\" - object does not exist."}
+                )
+        if subcategory is not None and taxonomy.subcategory_category_map.get(subcategory) != category:
+            raise serializers.ValidationError(
+                {'subcategory': "Subcategory does not belong to the selected category."}
+            )
+        return attrs
@@ -0,0 +1,159 @@
+"""
+Two-level cached session engine (SESSION_ENGINE = "ledger.sessions").
+
+L1 is a small per-process LRU of decoded sessions, trusted for
+SESSION_LOCAL_CACHE_TTL seconds; L2 is the shared cache named by
+SESSION_CACHE_ALIAS (Redis in production, locmem in development and tests).
+With SESSION_DB_WRITE_THROUGH every save also goes to the django_session
+table and a cold L2 falls back to it (like Django's cached_db); without it
+sessions live in the cache only (like Django's cache backend).
+
+A session is read from the DB at most once per cache lifetime, so a warm
+request costs no session query at all. Writes, deletes and key rotation
+update both levels in this process; other processes may serve an L1 copy
+for up to the TTL, which is why the TTL is kept short.
+
+Sessions are keyed by session key alone, so the same engine serves both of
+SeparateSessionMiddleware's cookies (sessionid and admin_sessionid).
+"""
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.sessions.backends.base import CreateError
+from django.contrib.sessions.backends.cached_db import SessionStore as CachedDBStore
+
+KEY_PREFIX = 'ledger.sessions.'
+
+
+def write_through():
+    return getattr(settings, 'SESSION_DB_WRITE_THROUGH', True)
+
+
+def _local_ttl():
+    return getattr(settings, 'SESSION_LOCAL_CACHE_TTL', 2)
+
+
+class LocalLRU:
+    """Thread-safe LRU with per-entry expiry; values are deep-copied in and out."""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            deadline, value = entry
+            if deadline < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+        return copy.deepcopy(value)
+
+    def set(self, key, value, ttl):
+        if ttl <= 0 or self.maxsize <= 0:
+            return
+        value = copy.deepcopy(value)
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+local_cache = LocalLRU(getattr(settings, 'SESSION_LOCAL_CACHE_SIZE', 1000))
+
+
+class SessionStore(CachedDBStore):
+    cache_key_prefix = KEY_PREFIX
+
+    def _remember(self, data):
+        # The TTL is far below any session age; L2 and the DB enforce expiry
+        local_cache.set(self.cache_key, data, _local_ttl())
+
+    def load(self):
+        if self.session_key is not None:
+            data = local_cache.get(self.cache_key)
+            if data is not None:
+                return data
+        try:
+            data = self._cache.get(self.cache_key)
+        except Exception:
+            # Some backends raise on invalid keys; treat it as a miss (see Django #17810)
+            data = None
+
+        if data is None:
+            if not write_through():
+                self._session_key = None
+                return {}
+            s = self._get_session_from_db()
+            if not s:
+                return {}
+            data = self.decode(s.session_data)
+            self._cache.set(self.cache_key, data, self.get_expiry_age(expiry=s.expire_date))
+        self._remember(data)
+        return data
+
+    def exists(self, session_key):
+        if write_through():
+            return super().exists(session_key)
+        return bool(session_key) and (self.cache_key_prefix + session_key) in self._cache
+
+    def create(self):
+        if write_through():
+            super().create()
+            return
+        # Cache-only: claim an unused key with cache.add(), as Django's cache backend does
+        for _ in range(10000):
+            self._session_key = self._get_new_session_key()
+            try:
+                self.save(must_create=True)
+            except CreateError:
+                continue
+            self.modified = True
+            return
+        raise RuntimeError("Unable to create a new session key. It is likely that the cache is unavailable.")
+
+    def save(self, must_create=False):
+        if write_through():
+            super().save(must_create)
+        else:
+            if self.session_key is None:
+                return self.create()
+            data = self._get_session(no_load=must_create)
+            if must_create:
+                if not self._cache.add(self.cache_key, data, self.get_expiry_age()):
+                    raise CreateError
+            else:
+                self._cache.set(self.cache_key, data, self.get_expiry_age())
+        self._remember(self._session)
+
+    def delete(self, session_key=None):
+        if session_key is None:
+            if self.session_key is None:
+                return
+            session_key = self.session_key
+        local_cache.delete(self.cache_key_prefix + session_key)
+        if write_through():
+            super().delete(session_key)
+        else:
+            self._cache.delete(self.cache_key_prefix + session_key)
+
+    @classmethod
+    def clear_expired(cls):
+        if write_through():
+            super().clear_expired()
@@ -1,7 +1,12 @@
-from django.db.models.signals import post_migrate
+from django.db import transaction
+from django.utils import timezone
+from django.db.models.signals import post_migrate, pre_save, post_save, pre_delete, post_delete
 from django.dispatch import receiver
 from django.apps import apps
 
+from . import rollups, taxonomy, versions
+from .models import Category, Expense, ExpenseDailyTotal, ExpenseTombstone, Subcategory
+
 # Default categories and subcategories data
 DEFAULT_CATEGORIES = {
     'Food & Dining': [
@@ -121,4 +126,99 @@ def create_default_categories(sender, **kwargs):
                 Subcategory.objects.create(
                     category=main_category,
                     name=subcategory_name,
-                )
\ No newline at end of file
+                )
+
+
+# --- Expense rollups -------------------------------------------------------
+
+@receiver(pre_save, sender=Expense)
+def bump_data_version_on_save(sender, instance, raw=False, **kwargs):
+    """
+    Expire the ETags of the owner's pages (ledger.versions) and stamp the new
+    version on the row for delta sync. Registered ahead of the rollup capture
+    below, so the version lock is taken before the stored row is read.
+    """
+    if raw or rollups.is_suspended():
+        return  # batch writers bump once per batch
+    instance.sync_version = versions.bump([instance.user_id])[instance.user_id]
+
+@receiver(pre_save, sender=Expense)
+def capture_expense_before_save(sender, instance, **kwargs):
+    """Remember the stored version of an expense so post_save can emit a delta."""
+    instance._rollup_old = None
+    if rollups.is_suspended():
+        return
+    if instance.pk and not instance._state.adding:
+        instance._rollup_old = (
+            Expense.objects
+            .filter(pk=instance.pk)
+            .values('user_id', 'date', 'category_id', 'subcategory_id', 'amount')
+            .first()
+        )
+
+@receiver(post_save, sender=Expense)
+def update_rollups_on_save(sender, instance, raw=False, **kwargs):
+    if raw or rollups.is_suspended():
+        return
+    old = getattr(instance, '_rollup_old', None)
+    rollups.apply_deltas(rollups.diff(old=old, new=rollups.snapshot(instance)))
+
+@receiver(post_delete, sender=Expense)
+def update_rollups_on_delete(sender, instance, **kwargs):
+    if rollups.is_suspended():
+        return
+    rollups.apply_deltas(rollups.diff(old=rollups.snapshot(instance)))
+
+@receiver(post_delete, sender=Expense)
+def record_expense_tombstone(sender, instance, **kwargs):
+    """Delta sync (ledger.sync) reports deletions from tombstones."""
+    if rollups.is_suspended():
+        return  # batch writers bulk_create their own tombstones
+    ExpenseTombstone.objects.create(
+        user_id=instance.user_id, expense_id=instance.pk,
+        sync_version=getattr(instance, '_sync_version', 0),
+    )
+
+@receiver(pre_delete, sender=Expense)
+def bump_data_version_on_delete(sender, instance, **kwargs):
+    if rollups.is_suspended():
+        return
+    instance._sync_version = versions.bump([instance.user_id])[instance.user_id]
+
+@receiver(pre_delete, sender=Subcategory)
+def capture_subcategory_rollup_users(sender, instance, **kwargs):
+    """
+    Expense.subcategory is SET_NULL (a bulk UPDATE without signals), so the
+    affected users' rollups are rebuilt once the delete has committed.
+    """
+    instance._rollup_user_ids = list(
+        ExpenseDailyTotal.objects
+        .filter(subcategory=instance)
+        .values_list('user_id', flat=True)
+        .distinct()
+    )
+    # The SET_NULL UPDATE sends no signals; stamp the rows so sync clients see the change
+    affected = Expense.objects.filter(subcategory=instance)
+    now = timezone.now()
+    stamped = versions.bump(affected.values_list('user_id', flat=True).distinct())
+    for user_id, version in stamped.items():
+        affected.filter(user_id=user_id).update(updated_at=now, sync_version=version)
+
+@receiver(post_delete, sender=Subcategory)
+def rebuild_rollups_on_subcategory_delete(sender, instance, **kwargs):
+    user_ids = getattr(instance, '_rollup_user_ids', None)
+    if user_ids:
+        transaction.on_commit(lambda: rollups.rebuild(user_ids=user_ids))
+
+
+# --- Taxonomy cache --------------------------------------------------------
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=Subcategory)
+@receiver(post_delete, sender=Subcategory)
+def invalidate_taxonomy_cache(sender, **kwargs):
+    # The version moves with the write; this process drops its copy after
+    # commit so it never caches the pre-commit taxonomy under the new version
+    taxonomy.bump()
+    transaction.on_commit(taxonomy.invalidate)
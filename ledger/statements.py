@@ -0,0 +1,186 @@
+"""
+Streaming bank statement parsers.
+
+`parse_ofx()` and `parse_qif()` read a binary file incrementally (OFX in
+fixed-size chunks, QIF line by line) and yield one Transaction per statement
+entry, so memory does not depend on the statement's size. Amounts keep the
+bank's sign: debits are negative.
+
+OFX 1.x (SGML, unclosed leaf tags) and OFX 2.x (XML) are both handled by the
+same tag scanner; QFX is OFX.
+"""
+import codecs
+import html
+import re
+from collections import namedtuple
+from datetime import date
+from decimal import Decimal, InvalidOperation
+
+# `category` is a QIF "Category:Subcategory" string, or '' when the format has none
+Transaction = namedtuple('Transaction', 'position date amount description category')
+
+# A statement entry that could not be parsed; parsing goes on with the next one
+ParseError = namedtuple('ParseError', 'position message')
+
+OFX_EXTENSIONS = ('.ofx', '.qfx')
+QIF_EXTENSIONS = ('.qif',)
+
+READ_SIZE = 64 * 1024
+
+_TAG = re.compile(r'<(/?)([A-Za-z0-9.]+)[^>]*>([^<]*)')
+
+
+def _amount(value):
+    try:
+        amount = Decimal(value.strip().replace(',', ''))
+    except InvalidOperation:
+        raise ValueError(f"invalid amount {value!r}.")
+    if not amount.is_finite():
+        raise ValueError(f"invalid amount {value!r}.")
+    return amount
+
+
+# --- OFX -------------------------------------------------------------------
+
+def _ofx_date(value):
+    """DTPOSTED is YYYYMMDD[HHMMSS[.XXX]][[gmt offset:tz name]]; only the day matters."""
+    digits = value.strip()[:8]
+    try:
+        return date(int(digits[:4]), int(digits[4:6]), int(digits[6:8]))
+    except ValueError:
+        raise ValueError(f"invalid date {value!r}.")
+
+
+def _ofx_transaction(position, fields):
+    if 'DTPOSTED' not in fields or 'TRNAMT' not in fields:
+        raise ValueError("transaction without DTPOSTED or TRNAMT.")
+    description = ' '.join(
+        part for part in (fields.get('NAME', ''), fields.get('MEMO', '')) if part
+    ) or fields.get('TRNTYPE', '')
+    return Transaction(position, _ofx_date(fields['DTPOSTED']), _amount(fields['TRNAMT']), description, '')
+
+
+def _ofx_tags(fileobj, read_size=READ_SIZE):
+    """Yield (closing, TAG, text) for each tag, reading `read_size` bytes at a time."""
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    buffer = ''
+    while True:
+        chunk = fileobj.read(read_size)
+        buffer += decoder.decode(chunk or b'', final=not chunk)
+        # Keep a trailing, possibly incomplete tag for the next chunk
+        cut = len(buffer) if not chunk else buffer.rfind('<')
+        if cut > 0:
+            for match in _TAG.finditer(buffer, 0, cut):
+                yield match.group(1) == '/', match.group(2).upper(), html.unescape(match.group(3)).strip()
+            buffer = buffer[cut:]
+        if not chunk:
+            return
+
+
+def parse_ofx(fileobj, read_size=READ_SIZE):
+    """
+    Yield Transactions from an OFX/QFX statement. `position` is the 1-based
+    index of the STMTTRN block; a malformed block is yielded as a ParseError.
+    """
+    fields = None
+    position = 0
+    for closing, tag, text in _ofx_tags(fileobj, read_size):
+        if tag == 'STMTTRN':
+            if not closing:
+                position += 1
+                fields = {}
+            elif fields is not None:
+                try:
+                    yield _ofx_transaction(position, fields)
+                except ValueError as e:
+                    yield ParseError(position, str(e))
+                fields = None
+        elif fields is not None and not closing and text:
+            fields.setdefault(tag, text)
+
+
+# --- QIF -------------------------------------------------------------------
+
+_QIF_DATE = re.compile(r"^\s*(\d{1,4})\s*[/.\-]\s*(\d{1,2})\s*(?:[/.\-]|')\s*(\d{2,4})\s*$")
+
+
+def _qif_date(value, day_first=False):
+    match = _QIF_DATE.match(value.replace(' ', ''))
+    if not match:
+        raise ValueError(f"invalid date {value!r}.")
+    a, b, year = match.groups()
+    if len(a) == 4:  # ISO-ish YYYY-MM-DD
+        year, month, day = a, b, year
+    elif day_first:
+        day, month = a, b
+    else:
+        month, day = a, b
+    year = int(year)
+    if year < 100:
+        # Quicken writes 2000+ years as MM/DD'YY
+        year += 2000 if "'" in value or year < 70 else 1900
+    try:
+        return date(year, int(month), int(day))
+    except ValueError:
+        raise ValueError(f"invalid date {value!r}.")
+
+
+def parse_qif(fileobj, day_first=False):
+    """
+    Yield Transactions from a QIF file, one per `^`-terminated record in the
+    bank/cash/credit-card sections. `position` is the record's first line.
+    Malformed records are yielded as ParseErrors.
+    """
+    record = {}
+    start = None
+    in_transactions = True
+    for number, raw in enumerate(fileobj, start=1):
+        line = raw.decode('utf-8', errors='replace').strip()
+        if not line:
+            continue
+        if line.startswith('!'):
+            header = line.lower()
+            if header.startswith('!type:'):
+                kind = header[6:].strip()
+                in_transactions = kind in ('bank', 'cash', 'ccard', 'oth a', 'oth l')
+            elif header.startswith('!option') or header.startswith('!clear'):
+                pass
+            else:
+                in_transactions = False  # !Account and other list sections
+            record, start = {}, None
+            continue
+        if line == '^':
+            if in_transactions and record:
+                try:
+                    if 'D' not in record or 'T' not in record:
+                        raise ValueError("record without a date (D) or amount (T).")
+                    description = ' '.join(p for p in (record.get('P', ''), record.get('M', '')) if p)
+                    yield Transaction(
+                        start, _qif_date(record['D'], day_first), _amount(record['T']),
+                        description, record.get('L', '').strip('[]'),
+                    )
+                except ValueError as e:
+                    yield ParseError(start, str(e))
+            record, start = {}, None
+            continue
+        if start is None:
+            start = number
+        code, value = line[0], line[1:].strip()
+        if code == 'U':
+            code = 'T'  # U duplicates T in newer exports
+        if code in 'DTPML':
+            record.setdefault(code, value)
+
+
+def parse(fileobj, name, day_first=False):
+    """Pick the parser for a statement file by its name's extension."""
+    name = name.lower()
+    if name.endswith(OFX_EXTENSIONS):
+        return parse_ofx(fileobj)
+    if name.endswith(QIF_EXTENSIONS):
+        return parse_qif(fileobj, day_first=day_first)
+    raise ValueError("unsupported statement type; expected .ofx, .qfx or .qif.")
+
+
+def is_statement(name):
+    return name.lower().endswith(OFX_EXTENSIONS + QIF_EXTENSIONS)
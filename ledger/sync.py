@@ -0,0 +1,146 @@
+"""
+Delta sync for offline clients.
+
+A client keeps an opaque token and asks for what changed since it:
+expenses written (created or edited) after it and the ids of deleted
+expenses (ExpenseTombstone). Without a token it gets every expense once.
+
+Changes are ordered by the user's data version (ledger.versions), not by
+time: every write stamps the version it bumped on the rows and tombstones
+it touched, and a user's versions are handed out under a row lock held to
+commit, so they become visible in order. Each sync pins an upper bound
+`upto` at the user's committed version, so no write at or below it can
+still be in flight however long its transaction ran, and pages through both
+streams with keyset cursors on (sync_version, id) up to that bound. While
+`more` is true the returned token continues the same sync; once it is false
+the token is the client's new starting point.
+
+Tombstones older than SYNC_TOMBSTONE_RETENTION_DAYS are pruned by the
+prune_sync_tombstones command; a token issued before that, or one in an
+older format, raises TokenExpired and the client has to sync from scratch.
+"""
+import base64
+import json
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from . import versions
+from .models import Expense, ExpenseTombstone
+
+PAGE_SIZE = 500
+MAX_PAGE_SIZE = 2000
+
+TOKEN_FORMAT = 2
+
+SyncPage = namedtuple('SyncPage', 'changed deleted token more')
+
+
+class TokenExpired(Exception):
+    pass
+
+
+def retention():
+    return timedelta(days=getattr(settings, 'SYNC_TOMBSTONE_RETENTION_DAYS', 90))
+
+
+def encode_token(state):
+    raw = json.dumps({'f': TOKEN_FORMAT, **state}, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+
+def decode_token(token):
+    """
+    The sync state in `token`; raises ValueError if it is not one of ours and
+    TokenExpired if it predates the current format.
+    """
+    try:
+        state = json.loads(base64.urlsafe_b64decode(token.encode('ascii')))
+        if not isinstance(state, dict):
+            raise ValueError
+        if state.get('f') != TOKEN_FORMAT:
+            if 'since' in state:
+                raise TokenExpired("sync token is from an older release; sync from scratch.")
+            raise ValueError
+        datetime.fromisoformat(state['issued'])
+        for key in ('since', 'upto'):
+            if state.get(key) is not None:
+                int(state[key])
+        for key in ('expenses', 'deleted'):
+            cursor = state.get(key)
+            if cursor is not None:
+                int(cursor[0])
+                int(cursor[1])
+        return state
+    except (TypeError, ValueError, AttributeError, IndexError, KeyError, UnicodeError):
+        raise ValueError("invalid sync token.")
+
+
+def _page(queryset, cursor, page_size):
+    """Up to page_size rows after `cursor` in (sync_version, id) order, and whether more remain."""
+    queryset = queryset.order_by('sync_version', 'id')
+    if cursor is not None:
+        version, pk = cursor
+        queryset = queryset.filter(Q(sync_version__gt=version) | Q(sync_version=version, id__gt=pk))
+    rows = list(queryset[:page_size + 1])
+    return rows[:page_size], len(rows) > page_size
+
+
+def changes(user, token=None, page_size=PAGE_SIZE):
+    """
+    One page of `user`'s changes after `token` (None for a full sync).
+    Returns SyncPage(changed expenses, deleted ids, next token, more).
+    """
+    state = decode_token(token) if token else {'since': None}
+    since = state.get('since')
+    if state.get('upto') is not None:
+        upto, issued = state['upto'], state['issued']
+    else:
+        if since is not None and datetime.fromisoformat(state['issued']) < timezone.now() - retention():
+            raise TokenExpired("sync token is older than the tombstone retention; sync from scratch.")
+        # Read before the rows: every write stamped at or below it has committed
+        upto, issued = versions.get_version(user.pk)[0], timezone.now().isoformat()
+        if since is not None and since >= upto:
+            return SyncPage([], [], encode_token({'since': since, 'issued': issued}), False)
+
+    expenses = Expense.objects.filter(user=user, sync_version__lte=upto).select_related('category', 'subcategory')
+    if since is not None:
+        expenses = expenses.filter(sync_version__gt=since)
+    changed, more_changed = [], False
+    if not state.get('expenses_done'):
+        changed, more_changed = _page(expenses, state.get('expenses'), page_size)
+
+    deleted, more_deleted = [], False
+    if since is not None and not state.get('deleted_done'):
+        tombstones = ExpenseTombstone.objects.filter(user=user, sync_version__gt=since, sync_version__lte=upto)
+        deleted, more_deleted = _page(tombstones, state.get('deleted'), page_size)
+
+    if not (more_changed or more_deleted):
+        return SyncPage(
+            changed, [t.expense_id for t in deleted], encode_token({'since': upto, 'issued': issued}), False,
+        )
+
+    next_state = {
+        'since': since,
+        'upto': upto,
+        'issued': issued,
+        'expenses': state.get('expenses'),
+        'deleted': state.get('deleted'),
+        'expenses_done': not more_changed,
+        'deleted_done': not more_deleted,
+    }
+    if changed:
+        next_state['expenses'] = [changed[-1].sync_version, changed[-1].pk]
+    if deleted:
+        next_state['deleted'] = [deleted[-1].sync_version, deleted[-1].pk]
+    return SyncPage(changed, [t.expense_id for t in deleted], encode_token(next_state), True)
+
+
+def prune_tombstones(now=None):
+    """Delete tombstones past the retention period; returns how many."""
+    cutoff = (now or timezone.now()) - retention()
+    deleted, _ = ExpenseTombstone.objects.filter(deleted_at__lt=cutoff).delete()
+    return deleted
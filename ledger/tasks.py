@@ -0,0 +1,9 @@
+"""Celery tasks, used when EXPORT_JOB_BACKEND = "celery" (see ledger/jobs.py)."""
+from celery import shared_task
+
+from . import jobs
+
+
+@shared_task(ignore_result=True)
+def run_export_job(job_id):
+    jobs.run(job_id)
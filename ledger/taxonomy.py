@@ -0,0 +1,163 @@
+"""
+Versioned cache of the global category/subcategory taxonomy.
+
+The taxonomy is global and rarely changes, so forms build their choices from
+this cache instead of querying Category/Subcategory on every render.
+
+The version lives in the database (TaxonomyVersion): signals in
+ledger/signals.py call `bump()` in the same transaction as every Category or
+Subcategory write, so every process sees the new version as soon as the
+write commits.
+
+Two cache layers below it:
+- a process-local copy, trusted for TAXONOMY_LOCAL_TTL seconds, after which
+  one primary-key lookup checks the version;
+- an optional shared layer in Django's cache (TAXONOMY_CACHE_ALIAS, set it to
+  None to disable) holding the serialized taxonomy per version.
+"""
+import hashlib
+import json
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection
+from django.db.models import F
+
+from .models import Category, Subcategory, TaxonomyVersion
+
+DATA_KEY = 'ledger:taxonomy:data:{version}'
+
+_lock = threading.Lock()
+_local = {'taxonomy': None, 'checked_at': 0.0}
+
+
+def _shared_cache():
+    alias = getattr(settings, 'TAXONOMY_CACHE_ALIAS', 'default')
+    return caches[alias] if alias else None
+
+
+def _cache_timeout():
+    return getattr(settings, 'TAXONOMY_CACHE_TIMEOUT', 300)
+
+
+def _local_ttl():
+    return getattr(settings, 'TAXONOMY_LOCAL_TTL', 5)
+
+
+class Taxonomy:
+    """Immutable snapshot of categories and subcategories at one version."""
+
+    def __init__(self, version, categories, subcategories, loaded_at=None):
+        self.version = version
+        # [(id, name)] ordered by name
+        self.categories = [tuple(c) for c in categories]
+        # [(id, name, category_id)] ordered by category name, name
+        self.subcategories = [tuple(s) for s in subcategories]
+        self.loaded_at = loaded_at if loaded_at is not None else time.time()
+
+        self.category_names = {cid: name for cid, name in self.categories}
+        self.subcategory_names = {sid: name for sid, name, _ in self.subcategories}
+        self.subcategory_category_map = {sid: cid for sid, _, cid in self.subcategories}
+        self._json = None
+        self._etag = None
+
+    def category_choices(self, blank_label='---------'):
+        return [('', blank_label)] + list(self.categories)
+
+    def subcategory_choices(self, blank_label='---------'):
+        return [('', blank_label)] + [(sid, name) for sid, name, _ in self.subcategories]
+
+    def category_subcategory_choices(self, category_id, blank_label='---------'):
+        """Choices for the subcategories of one category (none for None)."""
+        return [('', blank_label)] + [(sid, name) for sid, name, cid in self.subcategories if cid == category_id]
+
+    def as_json(self):
+        """Compact JSON for /api/taxonomy/, serialized once per snapshot."""
+        if self._json is None:
+            self._json = json.dumps({
+                'categories': self.categories,
+                'subcategories': self.subcategories,
+            }, separators=(',', ':'), ensure_ascii=False)
+        return self._json
+
+    @property
+    def etag(self):
+        """Hash of the content (not the version), identical in every process."""
+        if self._etag is None:
+            digest = hashlib.sha1(self.as_json().encode('utf-8')).hexdigest()[:20]
+            self._etag = f'tx-{digest}'
+        return self._etag
+
+    def to_data(self):
+        return {
+            'version': self.version,
+            'categories': self.categories,
+            'subcategories': self.subcategories,
+            'loaded_at': self.loaded_at,
+        }
+
+    @classmethod
+    def from_data(cls, data):
+        return cls(data['version'], data['categories'], data['subcategories'], data['loaded_at'])
+
+
+def _load(version):
+    categories = Category.objects.order_by('name').values_list('id', 'name')
+    subcategories = (
+        Subcategory.objects
+        .order_by('category__name', 'name')
+        .values_list('id', 'name', 'category_id')
+    )
+    return Taxonomy(version, list(categories), list(subcategories))
+
+
+def current_version():
+    """The shared taxonomy version (one primary-key lookup)."""
+    version = TaxonomyVersion.objects.filter(pk=1).values_list('version', flat=True).first()
+    return version if version is not None else 0
+
+
+def bump():
+    """Record a taxonomy write; call inside the writing transaction."""
+    if not TaxonomyVersion.objects.filter(pk=1).update(version=F('version') + 1):
+        TaxonomyVersion.objects.get_or_create(pk=1, defaults={'version': 1})
+
+
+def get_taxonomy():
+    """Return the current Taxonomy, loading it from the DB only on a cache miss."""
+    now = time.time()
+    taxonomy = _local['taxonomy']
+    if taxonomy is not None and now - _local['checked_at'] < _local_ttl():
+        return taxonomy
+
+    if connection.in_atomic_block:
+        # The version and rows read here may be uncommitted; never cache them
+        version = current_version()
+        if taxonomy is not None and taxonomy.version == version:
+            return taxonomy
+        return _load(version)
+
+    with _lock:
+        version = current_version()
+        taxonomy = _local['taxonomy']
+        if taxonomy is None or taxonomy.version != version:
+            shared = _shared_cache()
+            data = shared.get(DATA_KEY.format(version=version)) if shared is not None else None
+            if data is not None:
+                taxonomy = Taxonomy.from_data(data)
+            else:
+                taxonomy = _load(version)
+                if shared is not None:
+                    shared.set(DATA_KEY.format(version=version), taxonomy.to_data(), _cache_timeout())
+            _local['taxonomy'] = taxonomy
+        _local['checked_at'] = now
+        return taxonomy
+
+
+def invalidate():
+    """Drop this process's copy; the next get_taxonomy() re-checks the version."""
+    with _lock:
+        _local['taxonomy'] = None
+        _local['checked_at'] = 0.0
@@ -1,3 +1,666 @@
-from django.test import TestCase
+import base64
+import gzip
+import io
+import json
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.contrib.sessions.models import Session
+from django.core.cache import caches
+from django.db.models import Count, Sum
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from . import backups, bulk, exports, imports, metadata, pivots, rollups, sessions, statements, sync
+from .middleware import SeparateSessionMiddleware
+from .models import (
+    Category, Expense, ExpenseDailyTotal, ExpenseMonthlyTotal, ExpenseTombstone,
+)
+from .pagination import ORDERING
+
+LOCMEM_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'tests-default'},
+    'sessions': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'tests-sessions'},
+}
+
+
+class LocalLRUTests(TestCase):
+    def test_entries_expire_after_ttl(self):
+        lru = sessions.LocalLRU(10)
+        with mock.patch('ledger.sessions.time.monotonic', return_value=100.0):
+            lru.set('a', {'x': 1}, ttl=2)
+            self.assertEqual(lru.get('a'), {'x': 1})
+        with mock.patch('ledger.sessions.time.monotonic', return_value=103.0):
+            self.assertIsNone(lru.get('a'))
+
+    def test_least_recently_used_entry_is_evicted(self):
+        lru = sessions.LocalLRU(2)
+        lru.set('a', 1, ttl=60)
+        lru.set('b', 2, ttl=60)
+        lru.get('a')  # 'b' is now the least recently used
+        lru.set('c', 3, ttl=60)
+        self.assertIsNone(lru.get('b'))
+        self.assertEqual((lru.get('a'), lru.get('c')), (1, 3))
+
+    def test_values_are_copied(self):
+        lru = sessions.LocalLRU(2)
+        value = {'items': [1]}
+        lru.set('a', value, ttl=60)
+        value['items'].append(2)
+        lru.get('a')['items'].append(3)
+        self.assertEqual(lru.get('a'), {'items': [1]})
+
+    def test_zero_ttl_or_size_stores_nothing(self):
+        lru = sessions.LocalLRU(0)
+        lru.set('a', 1, ttl=60)
+        self.assertIsNone(lru.get('a'))
+        lru = sessions.LocalLRU(2)
+        lru.set('a', 1, ttl=0)
+        self.assertIsNone(lru.get('a'))
+
+
+class SessionEngineTestMixin:
+    def setUp(self):
+        super().setUp()
+        sessions.local_cache.clear()
+        caches['sessions'].clear()
+        self.addCleanup(sessions.local_cache.clear)
+        self.addCleanup(caches['sessions'].clear)
+
+    def new_session(self, **data):
+        store = sessions.SessionStore()
+        store.update(data)
+        store.save()
+        return store
+
+    def forget_cached(self):
+        """Drop both cache levels, as after a restart of every process and the cache."""
+        sessions.local_cache.clear()
+        caches['sessions'].clear()
+
+
+@override_settings(CACHES=LOCMEM_CACHES, SESSION_ENGINE='ledger.sessions', SESSION_CACHE_ALIAS='sessions',
+                   SESSION_DB_WRITE_THROUGH=True)
+class CachedDBSessionTests(SessionEngineTestMixin, TestCase):
+    def test_save_writes_through_to_the_database(self):
+        store = self.new_session(answer=42)
+        row = Session.objects.get(session_key=store.session_key)
+        self.assertEqual(row.get_decoded(), {'answer': 42})
+
+    def test_warm_load_costs_no_query(self):
+        store = self.new_session(answer=42)
+        with self.assertNumQueries(0):
+            self.assertEqual(sessions.SessionStore(store.session_key)['answer'], 42)
+
+    def test_cold_cache_falls_back_to_the_database(self):
+        store = self.new_session(answer=42)
+        self.forget_cached()
+        with self.assertNumQueries(1):
+            self.assertEqual(sessions.SessionStore(store.session_key)['answer'], 42)
+        # ... and refills the shared cache
+        sessions.local_cache.clear()
+        with self.assertNumQueries(0):
+            self.assertEqual(sessions.SessionStore(store.session_key)['answer'], 42)
+
+    def test_delete_removes_every_level(self):
+        store = self.new_session(answer=42)
+        key = store.session_key
+        store.delete()
+        self.assertFalse(Session.objects.filter(session_key=key).exists())
+        self.assertEqual(dict(sessions.SessionStore(key).items()), {})
+
+    def test_cycle_key_keeps_data_under_the_new_key(self):
+        store = self.new_session(answer=42)
+        old_key = store.session_key
+        store.cycle_key()
+        self.assertNotEqual(store.session_key, old_key)
+        self.assertEqual(sessions.SessionStore(store.session_key)['answer'], 42)
+        self.assertEqual(dict(sessions.SessionStore(old_key).items()), {})
+
+
+@override_settings(CACHES=LOCMEM_CACHES, SESSION_ENGINE='ledger.sessions', SESSION_CACHE_ALIAS='sessions',
+                   SESSION_DB_WRITE_THROUGH=False)
+class CacheOnlySessionTests(SessionEngineTestMixin, TestCase):
+    def test_sessions_never_touch_the_database(self):
+        with self.assertNumQueries(0):
+            store = self.new_session(answer=42)
+            sessions.local_cache.clear()
+            self.assertEqual(sessions.SessionStore(store.session_key)['answer'], 42)
+        self.assertFalse(Session.objects.exists())
+
+    def test_exists_checks_the_cache(self):
+        store = self.new_session(answer=42)
+        self.assertTrue(store.exists(store.session_key))
+        self.assertFalse(store.exists('missing-key'))
+
+    def test_evicted_session_is_gone(self):
+        store = self.new_session(answer=42)
+        self.forget_cached()
+        reloaded = sessions.SessionStore(store.session_key)
+        self.assertEqual(dict(reloaded.items()), {})
+        self.assertIsNone(reloaded.session_key)
+
+    def test_delete(self):
+        store = self.new_session(answer=42)
+        key = store.session_key
+        store.delete()
+        self.assertFalse(store.exists(key))
+
+
+class SeparateSessionNamespaceTestMixin(SessionEngineTestMixin):
+    """Both of SeparateSessionMiddleware's cookies, through the configured engine."""
+
+    def setUp(self):
+        super().setUp()
+        self.factory = RequestFactory()
+
+    def run_request(self, path, cookies=None, view=None):
+        def get_response(request):
+            if view is not None:
+                view(request)
+            return HttpResponse('ok')
+
+        middleware = SeparateSessionMiddleware(get_response)
+        request = self.factory.get(path)
+        request.COOKIES.update(cookies or {})
+        response = middleware(request)
+        return request, response
+
+    def start_sessions(self):
+        """Save one frontend and one admin session; returns their cookies."""
+        _, front = self.run_request('/', view=lambda r: r.session.__setitem__('side', 'front'))
+        _, admin = self.run_request('/admin/', view=lambda r: r.session.__setitem__('side', 'admin'))
+        front_key = front.cookies['sessionid'].value
+        admin_key = admin.cookies[SeparateSessionMiddleware.ADMIN_COOKIE_NAME].value
+        self.assertNotIn(SeparateSessionMiddleware.ADMIN_COOKIE_NAME, front.cookies)
+        self.assertNotIn('sessionid', admin.cookies)
+        self.assertNotEqual(front_key, admin_key)
+        return {'sessionid': front_key, SeparateSessionMiddleware.ADMIN_COOKIE_NAME: admin_key}
+
+    def test_each_path_loads_its_own_session(self):
+        cookies = self.start_sessions()
+        front, _ = self.run_request('/', cookies)
+        admin, _ = self.run_request('/admin/', cookies)
+        self.assertEqual(front.session['side'], 'front')
+        self.assertEqual(admin.session['side'], 'admin')
+
+    def test_saving_one_leaves_the_other_alone(self):
+        cookies = self.start_sessions()
+        self.run_request('/admin/', cookies, view=lambda r: r.session.__setitem__('side', 'admin-2'))
+        front, _ = self.run_request('/', cookies)
+        admin, _ = self.run_request('/admin/', cookies)
+        self.assertEqual(front.session['side'], 'front')
+        self.assertEqual(admin.session['side'], 'admin-2')
+
+    def test_flushing_one_leaves_the_other_alone(self):
+        cookies = self.start_sessions()
+        _, response = self.run_request('/admin/', cookies, view=lambda r: r.session.flush())
+        self.assertEqual(response.cookies[SeparateSessionMiddleware.ADMIN_COOKIE_NAME].value, '')
+        self.assertNotIn('sessionid', response.cookies)
+        front, _ = self.run_request('/', cookies)
+        admin, _ = self.run_request('/admin/', cookies)
+        self.assertEqual(front.session['side'], 'front')
+        self.assertNotIn('side', admin.session)
+
+
+@override_settings(CACHES=LOCMEM_CACHES, SESSION_ENGINE='ledger.sessions', SESSION_CACHE_ALIAS='sessions',
+                   SESSION_DB_WRITE_THROUGH=True)
+class CachedDBSessionNamespaceTests(SeparateSessionNamespaceTestMixin, TestCase):
+    def test_expiring_one_leaves_the_other_alone(self):
+        cookies = self.start_sessions()
+        Session.objects.filter(session_key=cookies[SeparateSessionMiddleware.ADMIN_COOKIE_NAME]).update(
+            expire_date=timezone.now() - timedelta(seconds=1),
+        )
+        self.forget_cached()
+        front, _ = self.run_request('/', cookies)
+        admin, _ = self.run_request('/admin/', cookies)
+        self.assertEqual(front.session['side'], 'front')
+        self.assertNotIn('side', admin.session)
+
+
+@override_settings(CACHES=LOCMEM_CACHES, SESSION_ENGINE='ledger.sessions', SESSION_CACHE_ALIAS='sessions',
+                   SESSION_DB_WRITE_THROUGH=False, SESSION_LOCAL_CACHE_TTL=0)
+class CacheOnlySessionNamespaceTests(SeparateSessionNamespaceTestMixin, TestCase):
+    def test_expiring_one_leaves_the_other_alone(self):
+        _, front = self.run_request('/', view=lambda r: r.session.__setitem__('side', 'front'))
+
+        def short_admin_session(request):
+            request.session['side'] = 'admin'
+            request.session.set_expiry(60)
+
+        _, admin = self.run_request('/admin/', view=short_admin_session)
+        cookies = {
+            'sessionid': front.cookies['sessionid'].value,
+            SeparateSessionMiddleware.ADMIN_COOKIE_NAME: admin.cookies[SeparateSessionMiddleware.ADMIN_COOKIE_NAME].value,
+        }
+        # Past the admin session's 60 seconds, within the frontend's SESSION_COOKIE_AGE
+        later = time.time() + 120
+        with mock.patch('django.core.cache.backends.locmem.time.time', return_value=later):
+            front_request, _ = self.run_request('/', cookies)
+            admin_request, _ = self.run_request('/admin/', cookies)
+            self.assertEqual(front_request.session['side'], 'front')
+            self.assertNotIn('side', admin_request.session)
+
+
+class LedgerTestMixin:
+    def setUp(self):
+        super().setUp()
+        User = get_user_model()
+        self.user = User.objects.create_user('alice', password='secret')
+        self.other = User.objects.create_user('bob', password='secret')
+        self.food = Category.objects.get(name='Food & Dining')
+        self.groceries = self.food.subcategories.get(name='Groceries')
+        self.travel = Category.objects.get(name='Travel')
+        self.flights = self.travel.subcategories.get(name='Flights')
+
+    def add(self, amount, day, category=None, subcategory=None, user=None, description=''):
+        return Expense.objects.create(
+            user=user or self.user, amount=Decimal(amount), date=day,
+            category=category or self.food, subcategory=subcategory, description=description,
+        )
+
+    def assertRollupsMatch(self):
+        """Both rollup tables, the pivot snapshots and the metadata agree with the Expense rows."""
+        keys = ('user_id', 'date', 'category_id', 'subcategory_id')
+        expected = {
+            tuple(row[k] for k in keys): (row['total'], row['count'])
+            for row in Expense.objects.order_by().values(*keys).annotate(total=Sum('amount'), count=Count('id'))
+        }
+        daily = {
+            tuple(row[k] for k in keys): (row['total'], row['count'])
+            for row in ExpenseDailyTotal.objects.values(*keys, 'total', 'count')
+        }
+        self.assertEqual(daily, expected)
+
+        expected_monthly = {}
+        for (user_id, day, category_id, subcategory_id), (total, count) in expected.items():
+            key = (user_id, rollups.month_start(day), category_id, subcategory_id)
+            old_total, old_count = expected_monthly.get(key, (0, 0))
+            expected_monthly[key] = (old_total + total, old_count + count)
+        monthly = {
+            (row['user_id'], row['month'], row['category_id'], row['subcategory_id']): (row['total'], row['count'])
+            for row in ExpenseMonthlyTotal.objects.values(
+                'user_id', 'month', 'category_id', 'subcategory_id', 'total', 'count',
+            )
+        }
+        self.assertEqual(monthly, expected_monthly)
+
+        for user_id in {key[0] for key in expected} | {self.user.pk, self.other.pk}:
+            for year in {key[1].year for key in expected if key[0] == user_id}:
+                rows = {}
+                for (owner, day, category_id, subcategory_id), (total, _) in expected.items():
+                    if owner == user_id and day.year == year:
+                        months = rows.setdefault(pivots.row_key(category_id, subcategory_id), [0] * 12)
+                        months[day.month - 1] += pivots.to_paise(total)
+                self.assertEqual(pivots.get_snapshot(user_id, year).rows, rows)
+            meta = metadata.get_metadata(user_id)
+            computed = metadata._compute(user_id)
+            self.assertEqual(
+                (meta.first_date, meta.last_date, meta.years, meta.month_categories),
+                (computed['first_date'], computed['last_date'], computed['years'], computed['month_categories']),
+            )
+
+
+class RollupConsistencyTests(LedgerTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        # Build the cached pivot and metadata rows up front, so the tests
+        # check that they are patched rather than recomputed
+        self.add('10.00', date(2024, 1, 5), subcategory=self.groceries)
+        self.add('5.00', date(2024, 3, 1), self.travel, user=self.other)
+        pivots.get_snapshot(self.user.pk, 2024)
+        pivots.get_snapshot(self.other.pk, 2024)
+        metadata.get_metadata(self.user.pk)
+        metadata.get_metadata(self.other.pk)
+
+    def test_create_update_delete(self):
+        expense = self.add('12.50', date(2024, 1, 5), subcategory=self.groceries)
+        self.add('7.25', date(2024, 2, 10))
+        self.assertRollupsMatch()
+
+        expense.amount = Decimal('99.99')
+        expense.date = date(2024, 4, 30)
+        expense.category, expense.subcategory = self.travel, self.flights
+        expense.save()
+        self.assertRollupsMatch()
+
+        expense.delete()
+        self.assertRollupsMatch()
+
+    def test_emptied_keys_are_dropped(self):
+        expense = self.add('3.00', date(2024, 6, 1))
+        expense.delete()
+        self.assertFalse(ExpenseDailyTotal.objects.filter(date=date(2024, 6, 1)).exists())
+        self.assertFalse(ExpenseMonthlyTotal.objects.filter(month=date(2024, 6, 1)).exists())
+        self.assertRollupsMatch()
+
+    def test_bulk_apply(self):
+        first = self.add('1.00', date(2024, 1, 1))
+        second = self.add('2.00', date(2024, 1, 2))
+        operations = [
+            {'op': 'create', 'data': {'date': f'2024-05-{day:02d}', 'amount': f'{day}.50',
+                                      'category': self.food.pk, 'subcategory': self.groceries.pk}}
+            for day in range(1, 26)
+        ]
+        operations += [
+            {'op': 'update', 'id': first.pk, 'data': {'amount': '8.00', 'category': self.travel.pk}},
+            {'op': 'delete', 'id': second.pk},
+        ]
+        result = bulk.apply(self.user, operations)
+        self.assertTrue(result.applied)
+        self.assertEqual(Expense.objects.filter(user=self.user, date__month=5).count(), 25)
+        self.assertFalse(Expense.objects.filter(pk=second.pk).exists())
+        self.assertRollupsMatch()
+
+    def test_invalid_bulk_batch_writes_nothing(self):
+        expense = self.add('1.00', date(2024, 1, 1))
+        before = list(ExpenseDailyTotal.objects.order_by('pk').values())
+        result = bulk.apply(self.user, [
+            {'op': 'update', 'id': expense.pk, 'data': {'amount': '9.00'}},
+            {'op': 'create', 'data': {'date': 'not-a-date', 'amount': '1.00', 'category': self.food.pk}},
+        ])
+        self.assertFalse(result.applied)
+        self.assertTrue(result.has_errors)
+        self.assertEqual(Expense.objects.get(pk=expense.pk).amount, Decimal('1.00'))
+        self.assertEqual(list(ExpenseDailyTotal.objects.order_by('pk').values()), before)
+
+    def test_bulk_cannot_touch_other_users_expenses(self):
+        theirs = Expense.objects.get(user=self.other)
+        result = bulk.apply(self.user, [{'op': 'delete', 'id': theirs.pk}])
+        self.assertFalse(result.applied)
+        self.assertTrue(Expense.objects.filter(pk=theirs.pk).exists())
+
+    def test_csv_import(self):
+        lines = ['date,category,subcategory,amount,description']
+        lines += [f'2024-07-{day:02d},Food & Dining,Groceries,{day}.10,shop {day}' for day in range(1, 31)]
+        lines += ['2024-07-31,Food & Dining,,not-a-number,broken', '2024-08-01,Travel,Flights,120.00,trip']
+        result = imports.import_csv(self.user, io.BytesIO('\n'.join(lines).encode('utf-8')), name='expenses.csv')
+        self.assertEqual(result.inserted, 31)
+        self.assertEqual([line for line, _ in result.errors], [32])
+        self.assertRollupsMatch()
+
+    def test_statement_reimport_skips_duplicates(self):
+        transactions = [
+            statements.Transaction(1, date(2024, 9, 1), Decimal('-20.00'), 'Coffee', ''),
+            statements.Transaction(2, date(2024, 9, 1), Decimal('-20.00'), 'Coffee', ''),
+            statements.Transaction(3, date(2024, 9, 2), Decimal('500.00'), 'Salary', ''),
+            statements.Transaction(4, date(2024, 9, 3), Decimal('-75.40'), 'Train', 'Travel:Flights'),
+        ]
+        first = imports.import_statement(self.user, transactions, self.food.pk, self.groceries.pk)
+        self.assertEqual((first.inserted, first.skipped, first.ignored), (3, 0, 1))
+        again = imports.import_statement(self.user, transactions, self.food.pk, self.groceries.pk)
+        self.assertEqual((again.inserted, again.skipped), (0, 3))
+        self.assertEqual(Expense.objects.filter(user=self.user, date__month=9).count(), 3)
+        self.assertRollupsMatch()
+
+    def test_subcategory_delete(self):
+        self.add('4.00', date(2024, 1, 6), subcategory=self.groceries)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.groceries.delete()
+        self.assertFalse(Expense.objects.filter(subcategory__isnull=False, category=self.food).exists())
+        self.assertRollupsMatch()
+
+    def test_category_delete(self):
+        self.add('4.00', date(2024, 1, 6), self.travel, self.flights)
+        self.add('6.00', date(2024, 2, 6), self.travel)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.travel.delete()
+        self.assertFalse(Expense.objects.filter(category_id=self.travel.pk).exists())
+        self.assertRollupsMatch()
+
+    def test_full_rebuild_matches_incremental_state(self):
+        for day in range(1, 10):
+            self.add(f'{day}.00', date(2024, day, day), subcategory=self.groceries if day % 2 else None)
+        before = set(ExpenseDailyTotal.objects.values_list('user_id', 'date', 'category_id', 'subcategory_id',
+                                                           'total', 'count'))
+        rollups.rebuild()
+        after = set(ExpenseDailyTotal.objects.values_list('user_id', 'date', 'category_id', 'subcategory_id',
+                                                          'total', 'count'))
+        self.assertEqual(before, after)
+        self.assertRollupsMatch()
+
+
+class SyncTests(LedgerTestMixin, TestCase):
+    def sync_all(self, token=None, page_size=sync.PAGE_SIZE):
+        """Follow one sync to its end; returns (changed ids, deleted ids, token)."""
+        changed, deleted = [], []
+        while True:
+            page = sync.changes(self.user, token, page_size)
+            changed += [expense.pk for expense in page.changed]
+            deleted += page.deleted
+            token = page.token
+            if not page.more:
+                return changed, deleted, token
+
+    def test_full_sync_pages_every_expense_once(self):
+        expected = [self.add(f'{n}.00', date(2024, 1, 1 + n % 28)).pk for n in range(1, 24)]
+        self.add('1.00', date(2024, 1, 1), user=self.other)
+        changed, deleted, _ = self.sync_all(page_size=5)
+        self.assertEqual(sorted(changed), sorted(expected))
+        self.assertEqual(len(changed), len(set(changed)))
+        self.assertEqual(deleted, [])
+
+    def test_delta_reports_changes_and_deletions(self):
+        kept = self.add('1.00', date(2024, 1, 1))
+        edited = self.add('2.00', date(2024, 1, 2))
+        removed = self.add('3.00', date(2024, 1, 3))
+        _, _, token = self.sync_all()
+
+        edited.amount = Decimal('20.00')
+        edited.save()
+        removed_id = removed.pk
+        removed.delete()
+        created = self.add('4.00', date(2024, 1, 4))
+        changed, deleted, token = self.sync_all(token, page_size=1)
+        self.assertEqual(sorted(changed), sorted([edited.pk, created.pk]))
+        self.assertEqual(deleted, [removed_id])
+        self.assertNotIn(kept.pk, changed)
+
+        self.assertEqual(self.sync_all(token)[:2], ([], []))
+
+    def test_bulk_writes_are_synced(self):
+        expense = self.add('1.00', date(2024, 1, 1))
+        gone = self.add('2.00', date(2024, 1, 2))
+        _, _, token = self.sync_all()
+        gone_id = gone.pk
+        result = bulk.apply(self.user, [
+            {'op': 'update', 'id': expense.pk, 'data': {'amount': '5.00'}},
+            {'op': 'delete', 'id': gone_id},
+            {'op': 'create', 'data': {'date': '2024-01-03', 'amount': '1.00', 'category': self.food.pk}},
+        ])
+        created = result.results[2]['id']
+        changed, deleted, _ = self.sync_all(token)
+        self.assertEqual(sorted(changed), sorted([expense.pk, created]))
+        self.assertEqual(deleted, [gone_id])
+
+    def test_subcategory_delete_is_synced(self):
+        expense = self.add('1.00', date(2024, 1, 1), subcategory=self.groceries)
+        _, _, token = self.sync_all()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.groceries.delete()
+        self.assertEqual(self.sync_all(token)[0], [expense.pk])
+
+    def test_write_during_a_sync_arrives_in_the_next_one(self):
+        for n in range(6):
+            self.add('1.00', date(2024, 1, 1 + n))
+        page = sync.changes(self.user, None, 2)
+        self.assertTrue(page.more)
+        late = self.add('9.00', date(2024, 2, 1))
+        changed, _, token = self.sync_all(page.token, page_size=2)
+        self.assertNotIn(late.pk, changed)
+        self.assertEqual(self.sync_all(token)[0], [late.pk])
+
+    def test_invalid_token(self):
+        for token in ('garbage', 'e30=', sync.encode_token({'since': 'x', 'issued': timezone.now().isoformat()})):
+            with self.assertRaises(ValueError):
+                sync.changes(self.user, token)
+
+    def test_old_format_token_expires(self):
+        token = base64.urlsafe_b64encode(json.dumps({'since': '2024-01-01T00:00:00'}).encode()).decode()
+        with self.assertRaises(sync.TokenExpired):
+            sync.changes(self.user, token)
+
+    @override_settings(SYNC_TOMBSTONE_RETENTION_DAYS=30)
+    def test_token_older_than_retention_expires(self):
+        self.add('1.00', date(2024, 1, 1))
+        _, _, token = self.sync_all()
+        with mock.patch('ledger.sync.timezone.now', return_value=timezone.now() + timedelta(days=31)):
+            with self.assertRaises(sync.TokenExpired):
+                sync.changes(self.user, token)
+
+    @override_settings(SYNC_TOMBSTONE_RETENTION_DAYS=30)
+    def test_prune_tombstones(self):
+        self.add('1.00', date(2024, 1, 1)).delete()
+        self.add('2.00', date(2024, 1, 2)).delete()
+        ExpenseTombstone.objects.filter(pk=ExpenseTombstone.objects.earliest('pk').pk).update(
+            deleted_at=timezone.now() - timedelta(days=31),
+        )
+        self.assertEqual(sync.prune_tombstones(), 1)
+        self.assertEqual(ExpenseTombstone.objects.count(), 1)
+
+    def test_api(self):
+        self.add('1.00', date(2024, 1, 1))
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.get('/api/v1/sync/', secure=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['changed']), 1)
+        self.assertFalse(response.data['more'])
+        self.assertEqual(client.get('/api/v1/sync/', {'since': 'garbage'}, secure=True).status_code, 400)
+
+
+class BackupRestoreTests(LedgerTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.add('10.00', date(2024, 1, 5), subcategory=self.groceries, description='market')
+        self.add('10.00', date(2024, 1, 5), subcategory=self.groceries, description='market')
+        self.add('99.50', date(2024, 3, 9), self.travel, self.flights, description='flight "home"')
+        self.add('0.01', date(2023, 12, 31), description='')
+        for day in range(1, 8):
+            self.add(f'{day}.25', date(2024, 4, day), description=f'lunch {day}')
+
+    def contents(self, user):
+        return sorted(Expense.objects.filter(user=user).values_list(
+            'date', 'category_id', 'subcategory_id', 'amount', 'description',
+        ))
+
+    def backup(self, **kwargs):
+        return b''.join(backups.backup_stream(self.user, **kwargs))
+
+    def test_round_trip(self):
+        data = self.backup(page_size=3)
+        result = backups.restore_stream(self.other, io.BytesIO(data), batch_size=4)
+        self.assertEqual(result.expenses, 11)
+        self.assertEqual(self.contents(self.other), self.contents(self.user))
+        self.assertRollupsMatch()
+
+    def test_resume_point_of_a_complete_file(self):
+        data = self.backup(page_size=3)
+        offset, cursor, finished = backups.resume_point(io.BytesIO(data))
+        self.assertEqual(offset, len(data))
+        self.assertTrue(finished)
+        self.assertIsNotNone(cursor)
+
+    def test_truncated_download_resumes(self):
+        data = self.backup(page_size=3)
+        offset, cursor, finished = backups.resume_point(io.BytesIO(data[:len(data) // 2]))
+        self.assertFalse(finished)
+        resumed = data[:offset] + self.backup(page_size=3, after=backups.parse_cursor(cursor))
+        backups.restore_stream(self.other, io.BytesIO(resumed))
+        self.assertEqual(self.contents(self.other), self.contents(self.user))
+
+    def test_interrupted_restore_resumes_after_its_cursor(self):
+        data = self.backup(page_size=3)
+        committed = []
+        with self.assertRaises(ValueError):
+            backups.restore_stream(self.other, io.BytesIO(data[:len(data) // 2]), batch_size=2,
+                                   progress=committed.append)
+        partial = committed[-1]
+        self.assertGreater(partial.expenses, 0)
+        self.assertLess(partial.expenses, 11)
+        self.assertEqual(Expense.objects.filter(user=self.other).count(), partial.expenses)
+
+        result = backups.restore_stream(self.other, io.BytesIO(data), after=backups.parse_cursor(partial.cursor))
+        self.assertEqual(result.skipped, partial.expenses)
+        self.assertEqual(self.contents(self.other), self.contents(self.user))
+        self.assertRollupsMatch()
+
+    def test_rejects_foreign_files(self):
+        with self.assertRaises(ValueError):
+            backups.restore_stream(self.other, io.BytesIO(gzip.compress(b'{"type": "header", "format": "x"}\n')))
+
+
+class ExportTests(LedgerTestMixin, TestCase):
+    def test_csv_export_round_trips_through_import(self):
+        self.add('12.30', date(2024, 1, 5), subcategory=self.groceries, description='a, "quoted" note')
+        self.add('4.00', date(2024, 1, 6), self.travel)
+        self.add('1.00', date(2024, 2, 1), description='outside the range')
+        rows = exports.export_rows(self.user.pk, date(2024, 1, 1), date(2024, 1, 31))
+        data = ''.join(exports.csv_stream(rows)).encode('utf-8')
+        self.assertTrue(data.startswith(b'date,category,subcategory,amount,description'))
+
+        result = imports.import_csv(self.other, io.BytesIO(data), name='export.csv')
+        self.assertEqual((result.inserted, result.errors), (2, []))
+        self.assertEqual(
+            sorted(Expense.objects.filter(user=self.other).values_list(
+                'date', 'category_id', 'subcategory_id', 'amount', 'description')),
+            sorted(Expense.objects.filter(user=self.user, date__month=1).values_list(
+                'date', 'category_id', 'subcategory_id', 'amount', 'description')),
+        )
+
+
+class ConditionalPageTests(LedgerTestMixin, TestCase):
+    def test_etag_until_the_data_changes(self):
+        self.client.force_login(self.user)
+        self.add('1.00', date.today())
+        # The CSRF cookie is part of the ETag; a browser has it after its first page
+        self.client.get('/', secure=True)
+        for path in ('/', '/expenses/', '/test/'):
+            with self.subTest(path=path):
+                response = self.client.get(path, secure=True)
+                self.assertEqual(response.status_code, 200)
+                etag = response['ETag']
+                response = self.client.get(path, secure=True, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 304)
+
+                self.add('2.00', date.today())
+                response = self.client.get(path, secure=True, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 200)
+                self.assertNotEqual(response['ETag'], etag)
+
+    def test_etag_is_per_user(self):
+        self.add('1.00', date.today())
+        self.client.force_login(self.user)
+        self.client.get('/', secure=True)
+        etag = self.client.get('/', secure=True)['ETag']
+        self.client.force_login(self.other)
+        self.assertEqual(self.client.get('/', secure=True, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class KeysetPaginationTests(LedgerTestMixin, TestCase):
+    def test_next_links_cover_every_expense_once(self):
+        # Several expenses per day, so the tie-breaking columns matter
+        for n in range(17):
+            self.add(f'{n + 1}.00', date(2024, 1, 1 + n // 4))
+        self.add('1.00', date(2024, 1, 1), user=self.other)
+        client = APIClient()
+        client.force_authenticate(self.user)
+
+        seen, url = [], '/api/v1/expenses/?page_size=5'
+        while url:
+            response = client.get(url, secure=True)
+            self.assertEqual(response.status_code, 200)
+            seen += [item['id'] for item in response.data['results']]
+            url = response.data['next']
+        expected = list(Expense.objects.filter(user=self.user).order_by(*ORDERING).values_list('pk', flat=True))
+        self.assertEqual(seen, expected)
+
+    def test_invalid_cursor(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        self.assertEqual(client.get('/api/v1/expenses/?cursor=bogus', secure=True).status_code, 404)
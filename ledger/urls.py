@@ -1,6 +1,13 @@
 
-from django.urls import path
-from . import views
+from django.urls import include, path, re_path
+from rest_framework.routers import DefaultRouter
+
+from . import api, views
+
+api_router = DefaultRouter()
+api_router.register('expenses', api.ExpenseViewSet, basename='api-expense')
+api_router.register('categories', api.CategoryViewSet, basename='api-category')
+api_router.register('subcategories', api.SubcategoryViewSet, basename='api-subcategory')
 
 # urlpatterns = [
 #     path('', views.dashboard, name='dashboard'),
@@ -23,20 +30,43 @@ urlpatterns = [
     path('expenses/add/', views.ExpenseCreateView.as_view(), name='expense_create'),
     path('expenses/<int:pk>/edit/', views.ExpenseUpdateView.as_view(), name='expense_update'),
     path('expenses/<int:pk>/delete/', views.ExpenseDeleteView.as_view(), name='expense_delete'),
+    path('expenses/import/', views.expense_import, name='expense_import'),
 
     # Subcategories
     path('subcategories/', views.SubcategoryListView.as_view(), name='subcategory_list'),
     path('subcategories/add/', views.subcategory_create, name='subcategory_create'),
 
+    # JSON APIs
+    path('api/taxonomy/', views.taxonomy_api, name='taxonomy_api'),
+    path('api/pivot/', views.pivot_api, name='pivot_api'),
+    path('api/charts/', views.charts_api, name='charts_api'),
+
+    # REST API; the version is part of the path (URLPathVersioning)
+    re_path(r'^api/(?P<version>v1)/sync/$', api.SyncView.as_view(), name='api-sync'),
+    re_path(r'^api/(?P<version>v1)/', include(api_router.urls)),
+
     # Misc
     path('test/', views.test_view, name='test'),
     path('test/download/', views.export_expenses_csv, name='export_expenses'),
 
+    # Background exports
+    path('exports/', views.export_job_create, name='export_job_create'),
+    path('exports/<int:pk>/', views.export_job_status, name='export_job_status'),
+    path('exports/<int:pk>/download/', views.export_job_download, name='export_job_download'),
+
+    # Full-account backup (restore is the restore_user command)
+    path('backup/', views.backup_download, name='backup_download'),
+
     # Health (keep /health for compatibility)
     path('health/', views.health, name='health'),
+
+    # Per-URL request timings for this process (staff only)
+    path('perf/', views.perf_stats, name='perf_stats'),
     
     # Keepalive endpoint for session management
     path('keepalive/', views.keepalive, name='keepalive'),
+    # Idle countdown heartbeat; answered from the signed activity cookie
+    path('heartbeat/', views.heartbeat, name='heartbeat'),
 
     path("auth/google/", views.google_signin, name="google_signin"),
 ]
\ No newline at end of file
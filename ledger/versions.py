@@ -0,0 +1,122 @@
+"""
+Per-user data versions and conditional GETs for HTML pages.
+
+UserDataVersion counts writes to a user's expenses: the Expense signals
+(ledger/signals.py) and the batch writers that bypass them (bulk API,
+imports, restore) call `bump()` inside the writing transaction, so the
+counter moves exactly when the data does.
+
+`conditional_page` wraps a view with django.views.decorators.http.condition:
+the ETag combines that counter with the taxonomy etag and everything else
+a page render depends on (session, CSRF cookie, today's date, release), so
+an If-None-Match hit is answered with 304 after one primary-key lookup and
+before the view runs any query of its own. Responses are marked
+`private, no-cache` so browsers revalidate instead of reusing them blindly.
+"""
+import hashlib
+from datetime import date
+from functools import wraps
+
+from django.conf import settings
+from django.contrib import messages
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.views.decorators.http import condition
+
+from .models import UserDataVersion
+from .taxonomy import get_taxonomy
+
+
+def bump(user_ids):
+    """
+    Record a write to the expenses of `user_ids`; returns {user_id: new version}.
+
+    The rows stay locked until the writing transaction ends, so one user's
+    versions are handed out in commit order: once a version is visible to
+    other transactions, every write stamped with it or a lower one is too
+    (ledger.sync relies on this). Bump before touching the expense rows.
+    """
+    user_ids = sorted(set(user_ids))
+    if not user_ids:
+        return {}
+    with transaction.atomic():
+        lock(user_ids)
+        rows = UserDataVersion.objects.filter(user_id__in=user_ids)
+        rows.update(version=F('version') + 1, modified=timezone.now())
+        return dict(rows.values_list('user_id', 'version'))
+
+
+def lock(user_ids):
+    """
+    Lock the UserDataVersion rows of `user_ids` (creating missing ones) until
+    the end of the current transaction. Writers of a user's rollups and pivot
+    snapshots take this first, so they run one at a time per user.
+    """
+    user_ids = sorted(set(user_ids))
+    if not user_ids:
+        return
+    rows = UserDataVersion.objects.select_for_update().filter(user_id__in=user_ids)
+    missing = set(user_ids) - set(rows.values_list('user_id', flat=True))
+    if missing:
+        now = timezone.now()
+        for user_id in sorted(missing):
+            UserDataVersion.objects.get_or_create(user_id=user_id, defaults={'version': 0, 'modified': now})
+        # Rows another transaction created first still need locking
+        list(rows.filter(user_id__in=missing).values_list('user_id', flat=True))
+
+
+def get_version(user_id):
+    """(version, modified) for a user; (0, None) before their first write."""
+    row = UserDataVersion.objects.filter(user_id=user_id).values_list('version', 'modified').first()
+    return row if row is not None else (0, None)
+
+
+def _state(request):
+    """(etag, last_modified) for the signed-in user's pages, computed once per request."""
+    if not hasattr(request, '_data_version_state'):
+        state = (None, None)
+        user = getattr(request, 'user', None)
+        # Pages showing pending flash messages must render (and consume) them
+        if user is not None and user.is_authenticated and not len(messages.get_messages(request)):
+            version, modified = get_version(user.pk)
+            session = getattr(request, 'session', None)
+            parts = [
+                user.pk, version, modified.timestamp() if modified else 0,
+                get_taxonomy().etag,
+                session.session_key if session is not None else '',
+                request.COOKIES.get(settings.CSRF_COOKIE_NAME, ''),
+                date.today().isoformat(),
+                getattr(settings, 'RELEASE_VERSION', ''),
+            ]
+            digest = hashlib.sha1('|'.join(map(str, parts)).encode('utf-8')).hexdigest()[:20]
+            state = (f'"u{user.pk}-{version}-{digest}"', modified)
+        request._data_version_state = state
+    return request._data_version_state
+
+
+def _etag(request, *args, **kwargs):
+    return _state(request)[0]
+
+
+def _last_modified(request, *args, **kwargs):
+    return _state(request)[1]
+
+
+def conditional_page(view_func):
+    """
+    Answer GET/HEAD with 304 when the user's data, the taxonomy and the
+    session are unchanged since the ETag the browser sent.
+    """
+    conditional = condition(etag_func=_etag, last_modified_func=_last_modified)(view_func)
+
+    @wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        response = conditional(request, *args, **kwargs)
+        if request.method in ('GET', 'HEAD') and response.has_header('ETag'):
+            patch_cache_control(response, private=True, no_cache=True)
+            patch_vary_headers(response, ('Cookie',))
+        return response
+
+    return wrapper
@@ -1,33 +1,44 @@
-from django.shortcuts import render, redirect
+from django.shortcuts import get_object_or_404, render, redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.db.models import Sum, Q
-from django.urls import reverse_lazy
+from django.urls import reverse, reverse_lazy
 from django.views.generic import ListView, CreateView, UpdateView, DeleteView
 from datetime import date
 import calendar
 from collections import defaultdict
-from .models import Expense, Category, Subcategory
-from .forms import ExpenseForm, CategoryForm, SubcategoryForm
-from django.http import HttpResponse,  JsonResponse, HttpResponseBadRequest
+from .models import Expense, Category, ExportJob, Subcategory
+from .forms import ExpenseForm, ExpenseImportForm, CategoryForm, SubcategoryForm
+from . import activity, backups, exports, imports, instrumentation, jobs, metadata, periods, pivots, statements
+from .charts import chart_data
+from .dashboard import dashboard_data
+from .taxonomy import get_taxonomy
+from .versions import conditional_page
+from django.http import FileResponse, Http404, HttpResponse,  JsonResponse, HttpResponseBadRequest, HttpResponseNotModified, StreamingHttpResponse
+from django.utils.cache import patch_cache_control
+from django.utils.http import parse_etags, quote_etag
 from django.utils import timezone
+import hashlib
 import json
+import os
+import time
 
 from django.views.decorators.http import require_http_methods
 from django.views.generic import TemplateView
+from django.utils.decorators import method_decorator
 from django.db.models.functions import ExtractMonth
 from django.http import JsonResponse
 from django.contrib.auth.decorators import login_required
 
 from django.conf import settings
-from django.contrib.auth import get_user_model, login
+from django.core.exceptions import PermissionDenied
+from django.contrib.auth import SESSION_KEY, get_user_model, login
 from django.views.decorators.http import require_POST
 from django.views.decorators.csrf import csrf_protect
 
 from google.oauth2 import id_token
 from google.auth.transport import requests as grequests
 import logging
-import csv
 
 # --------------------------------------------------------------------------------------
 
@@ -113,6 +124,7 @@ import csv
 
 @require_http_methods(["GET", "HEAD", "POST"])   # ✅ HEAD-safe, POST for quick-add
 @login_required
+@conditional_page
 def dashboard(request):
     today = date.today()
 
@@ -125,39 +137,10 @@ def dashboard(request):
     except (ValueError, TypeError):
         selected_year = today.year
         selected_month = today.month
-
-    # ✅ Month queryset: select_related to avoid N+1 in templates
-    month_qs = (
-        Expense.objects
-        .filter(user=request.user, date__year=selected_year, date__month=selected_month)
-        .select_related('category', 'subcategory')  # assumes FK names on Expense
-        .only('id', 'amount', 'description', 'date', 'created_at',
-              'category__id', 'category__name',
-              'subcategory__id', 'subcategory__name')
-    )
-    total_month = month_qs.aggregate(total=Sum('amount'))['total'] or 0
-
-    # Today's expenses only if month/year matches today
-    if selected_year == today.year and selected_month == today.month:
-        today_qs = (
-            Expense.objects
-            .filter(user=request.user, date=today)
-            .select_related('category', 'subcategory')
-            .only('id', 'amount', 'description', 'date', 'created_at',
-                  'category__id', 'category__name',
-                  'subcategory__id', 'subcategory__name')
-        )
-        total_today = today_qs.aggregate(total=Sum('amount'))['total'] or 0
-    else:
-        today_qs = Expense.objects.none()
-        total_today = 0
-
-    # Year total (aggregate only)
-    total_year = (
-        Expense.objects
-        .filter(user=request.user, date__year=selected_year)
-        .aggregate(total=Sum('amount'))['total'] or 0
-    )
+    if not 1 <= selected_month <= 12:
+        selected_month = today.month
+    if not date.min.year < selected_year < date.max.year:
+        selected_year = today.year
 
     # Handle quick-add form
     if request.method == 'POST':
@@ -170,20 +153,18 @@ def dashboard(request):
     else:
         form = ExpenseForm(initial={'date': today}, user=request.user)
 
-    # Year options: current and previous 5
-    year_options = list(range(today.year, today.year - 6, -1))
+    # ✅ Totals (one conditional aggregate over the rollups) and both lists (one fetch)
+    data = dashboard_data(request.user, today, selected_year, selected_month)
+
+    # Year options: current and previous 5, plus any other year with data
+    year_options = metadata.year_options(request.user.pk, today, recent=6)
 
     # Month options
     month_options = [(m, calendar.month_name[m]) for m in range(1, 13)]
     selected_month_name = calendar.month_name[selected_month]
 
     context = {
-        'total_month': total_month,
-        'total_today': total_today,
-        'total_year': total_year,
-        'today_expenses': today_qs,
-        # ✅ Restrict the list to a small recent slice and avoid extra fetches
-        'month_expenses': month_qs.order_by('-date', '-created_at')[:10],
+        **data,
         'form': form,
         'today': today,
         'selected_year': selected_year,
@@ -191,7 +172,7 @@ def dashboard(request):
         'selected_month_name': selected_month_name,
         'year_options': year_options,
         'month_options': month_options,
-        'subcategory_category_map': getattr(form, 'subcategory_category_map', {}),
+        'taxonomy_etag': get_taxonomy().etag,
     }
     return render(request, 'ledger/dashboard.html', context)
 # --------------------------------------------------------------------------------------
@@ -281,7 +262,28 @@ def dashboard(request):
 #         }
 
 
+def _pivot_rows(taxonomy, rows):
+    """Name and sort [(category_id, subcategory_id, [paise...])] pivot rows for display."""
+    final_data = []
+    for category_id, subcategory_id, values in rows:
+        values = [pivots.from_paise(p) for p in values]
+        final_data.append({
+            'category': taxonomy.category_names.get(category_id, 'Uncategorized'),
+            'category_id': category_id,
+            'subcategory': taxonomy.subcategory_names.get(subcategory_id, 'Uncategorized'),
+            'subcategory_id': subcategory_id,
+            'months': values,
+            'total': sum(values),
+        })
+    # Sort rows by category, then subcategory
+    final_data.sort(key=lambda x: (x['category'], x['subcategory']))
+    return final_data
+
+
+@method_decorator(conditional_page, name='dispatch')
 class ExpenseListView(LoginRequiredMixin, TemplateView):
+    """Analysis page: a calendar year by month (default), or any
+    ?start=&end=&granularity= range bucketed by day/week/month/quarter."""
     template_name = 'ledger/expense_pivot.html'
 
     def get_context_data(self, **kwargs):
@@ -294,69 +296,100 @@ class ExpenseListView(LoginRequiredMixin, TemplateView):
             selected_year = int(selected_year)
         except (ValueError, TypeError):
             selected_year = today.year
+        if not date.min.year < selected_year < date.max.year:
+            selected_year = today.year
 
-        # ✅ DB-side aggregation: one query
-        # Produces rows: category_name, subcategory_name, month (1-12), total
-        qs = (
-            Expense.objects
-            .filter(user=self.request.user, date__year=selected_year)
-            .values('category__name', 'subcategory__name')
-            .annotate(month=ExtractMonth('date'))
-            .values('category__name', 'subcategory__name', 'month')
-            .annotate(total=Sum('amount'))
-            .order_by('category__name', 'subcategory__name', 'month')
-        )
+        taxonomy = get_taxonomy()
+        pivot_data = {
+            'selected_year': selected_year,
+            'year_options': metadata.year_options(self.request.user.pk, today, recent=6),
+            'granularities': periods.GRANULARITIES,
+            'range_error': None,
+        }
 
-        # Build pivot rows
-        month_names = [calendar.month_name[m] for m in range(1, 13)]
-        # {(cat, subcat): [12 monthly totals]}
-        from collections import defaultdict
-        grid = defaultdict(lambda: [0.0] * 12)
-
-        for row in qs:
-            cat = row['category__name'] or 'Uncategorized'
-            sub = row['subcategory__name'] or 'Uncategorized'
-            m = row['month'] or 0
-            if 1 <= m <= 12:
-                grid[(cat, sub)][m - 1] += float(row['total'] or 0)
-
-        final_data = []
-        for (cat, sub), months in grid.items():
-            final_data.append({
-                'category': cat,
-                'subcategory': sub,
-                'months': months,
-                'total': sum(months),
+        range_rows = None
+        if self.request.GET.get('start') or self.request.GET.get('end'):
+            try:
+                start, end, granularity = periods.parse_range(self.request.GET)
+                bucket_starts, range_rows = pivots.range_pivot(self.request.user.pk, start, end, granularity)
+            except ValueError as e:
+                pivot_data['range_error'] = str(e)
+
+        if range_rows is not None:
+            # ✅ Arbitrary range: one grouped query bucketed in the DB
+            final_data = _pivot_rows(taxonomy, range_rows)
+            labels = [periods.bucket_label(b, granularity) for b in bucket_starts]
+            pivot_data.update({
+                'range_mode': True,
+                'start': start,
+                'end': end,
+                'granularity': granularity,
+                'granularity_label': periods.GRANULARITY_LABELS[granularity],
+                'month_names': labels,
+                'column_labels': labels,
+                'period_label': f"{start:%d %b %Y} – {end:%d %b %Y}",
+            })
+        else:
+            # ✅ Read the persisted yearly pivot snapshot (built lazily if missing)
+            final_data = _pivot_rows(taxonomy, pivots.year_rows(self.request.user.pk, selected_year))
+            month_names = [calendar.month_name[m] for m in range(1, 13)]
+            pivot_data.update({
+                'range_mode': False,
+                'granularity': 'month',
+                'granularity_label': periods.GRANULARITY_LABELS['month'],
+                'month_names': month_names,
+                'column_labels': [m[:3] for m in month_names],
+                'period_label': f"Year {selected_year}",
             })
 
-        # Sort rows by category, then subcategory
-        final_data.sort(key=lambda x: (x['category'], x['subcategory']))
-
-        overall_total = sum(r['total'] for r in final_data)
-        total_categories = len({r['category'] for r in final_data})
-        total_subcategories = len(final_data)
-        year_options = list(range(today.year, today.year - 6, -1))
-
-        context.update({
+        pivot_data.update({
             'data': final_data,
-            'month_names': month_names,
-            'selected_year': selected_year,
-            'year_options': year_options,
-            'overall_total': overall_total,
-            'total_categories': total_categories,
-            'total_subcategories': total_subcategories,
+            'overall_total': sum(r['total'] for r in final_data),
+            'total_categories': len({r['category'] for r in final_data}),
+            'total_subcategories': len(final_data),
         })
-# Add `pivot_data` for your template
-        context['pivot_data'] = {
-            'data': final_data,
-            'month_names': month_names,
-            'selected_year': selected_year,
-            'year_options': year_options,
-            'overall_total': overall_total,
-            'total_categories': total_categories,
-            'total_subcategories': total_subcategories,
-        }
+        context.update(pivot_data)
+        # `pivot_data` is what the template reads
+        context['pivot_data'] = pivot_data
         return context
+
+
+@require_http_methods(["GET", "HEAD"])
+@login_required
+def pivot_api(request):
+    """JSON counterpart of the Analysis page for ?start=&end=&granularity= ranges."""
+    try:
+        start, end, granularity = periods.parse_range(request.GET)
+        bucket_starts, rows = pivots.range_pivot(request.user.pk, start, end, granularity)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    taxonomy = get_taxonomy()
+    data = _pivot_rows(taxonomy, rows)
+    bucket_totals = [0] * len(bucket_starts)
+    for _, _, values in rows:
+        bucket_totals = [a + b for a, b in zip(bucket_totals, values)]
+
+    return JsonResponse({
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'granularity': granularity,
+        'buckets': [b.isoformat() for b in bucket_starts],
+        'labels': [periods.bucket_label(b, granularity) for b in bucket_starts],
+        'rows': [
+            {
+                'category': r['category'],
+                'category_id': r['category_id'],
+                'subcategory': r['subcategory'],
+                'subcategory_id': r['subcategory_id'],
+                'values': [float(v) for v in r['months']],
+                'total': float(r['total']),
+            }
+            for r in data
+        ],
+        'totals': [float(pivots.from_paise(t)) for t in bucket_totals],
+        'total': float(pivots.from_paise(sum(bucket_totals))),
+    })
 # --------------------------------------------------------------------------------------
 
 class ExpenseCreateView(LoginRequiredMixin, CreateView):
@@ -372,7 +405,7 @@ class ExpenseCreateView(LoginRequiredMixin, CreateView):
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['subcategory_category_map'] = getattr(context['form'], 'subcategory_category_map', {})
+        context['taxonomy_etag'] = get_taxonomy().etag
         return context
     
     def form_valid(self, form):
@@ -392,7 +425,7 @@ class ExpenseUpdateView(LoginRequiredMixin, UpdateView):
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['subcategory_category_map'] = getattr(context['form'], 'subcategory_category_map', {})
+        context['taxonomy_etag'] = get_taxonomy().etag
         return context
     
     def get_queryset(self):
@@ -426,6 +459,35 @@ class ExpenseDeleteView(LoginRequiredMixin, DeleteView):
 #         form = CategoryForm()
 #     return render(request, 'ledger/category_form.html', {'form': form})
 
+@login_required
+def expense_import(request):
+    """
+    Upload a CSV in the export layout or an OFX/QFX/QIF bank statement;
+    validates everything and imports valid rows unless dry run.
+    """
+    result = None
+    if request.method == 'POST':
+        form = ExpenseImportForm(request.POST, request.FILES)
+        if form.is_valid():
+            upload = form.cleaned_data['file']
+            if statements.is_statement(upload.name):
+                result = imports.import_statement_file(
+                    request.user, upload.file, upload.name,
+                    day_first=form.cleaned_data['day_first'],
+                    category_id=form.cleaned_data['category'],
+                    dry_run=form.cleaned_data['dry_run'],
+                )
+            else:
+                result = imports.import_csv(
+                    request.user, upload.file, name=upload.name.lower(),
+                    dry_run=form.cleaned_data['dry_run'],
+                )
+            logger.info("Import for user %s: %s", request.user.pk, result.summary())
+    else:
+        form = ExpenseImportForm()
+    return render(request, 'ledger/expense_import.html', {'form': form, 'result': result})
+
+@method_decorator(conditional_page, name='dispatch')
 class SubcategoryListView(LoginRequiredMixin, ListView):
     model = Subcategory
     template_name = 'ledger/subcategory_list.html'
@@ -451,6 +513,22 @@ def subcategory_create(request):
 # def test_view(request):
 #     return render(request, 'ledger/test.html')
 
+def _chart_filters(params, today):
+    """(year, month, category) for the Visualize page; category is 'all' or an id string."""
+    try:
+        year = int(params.get("year", today.year))
+        month = int(params.get("month", today.month))
+    except (TypeError, ValueError):
+        year, month = today.year, today.month
+    if not 1 <= month <= 12:
+        month = today.month
+    if not date.min.year < year < date.max.year:
+        year = today.year
+    category = params.get("category", "all") or "all"
+    if category != "all" and not category.isdigit():
+        category = "all"
+    return year, month, category
+
 @login_required
 # def test_view(request):
 
@@ -529,43 +607,22 @@ def subcategory_create(request):
 #     }
 #     return render(request, 'ledger/test.html', context)
 
+@conditional_page
 def test_view(request):
+    """Visualize page shell; chart data is loaded asynchronously from /api/charts/."""
     today = date.today()
-    current_year = today.year
-    current_month = today.month
-
-    if request.method == "POST":
-        selected_year = int(request.POST.get("year", current_year))
-        selected_month = int(request.POST.get("month", current_month))
-        selected_category = request.POST.get("category", "all")
-    else:
-        selected_year = current_year
-        selected_month = current_month
-        selected_category = "all"
-
-    years_qs = Expense.objects.filter(user=request.user).dates("date", "year")
-    available_years = sorted({d.year for d in years_qs} | {current_year}, reverse=True)
-
-    expenses = Expense.objects.filter(
-        user=request.user,
-        date__year=selected_year,
-        date__month=selected_month
+    params = request.POST if request.method == "POST" else request.GET
+    selected_year, selected_month, selected_category = _chart_filters(params, today)
+
+    # ✅ Selectors come from the per-user metadata row, not DISTINCT scans
+    available_years = metadata.year_options(request.user.pk, today)
+    taxonomy = get_taxonomy()
+    categories = sorted(
+        ({"id": cat_id, "name": taxonomy.category_names.get(cat_id, "Uncategorized")}
+         for cat_id in metadata.categories_for_month(request.user.pk, selected_year, selected_month)),
+        key=lambda c: c["name"],
     )
 
-    category_ids = expenses.values_list("category_id", flat=True).distinct()
-    categories = Category.objects.filter(id__in=category_ids)
-
-    if selected_category != "all":
-        expenses = expenses.filter(category_id=int(selected_category))
-
-    subcat_data = expenses.values("subcategory__name").annotate(total=Sum("amount"))
-    labels = [r["subcategory__name"] or "No Subcategory" for r in subcat_data]
-    values = [float(r["total"]) for r in subcat_data]
-
-    cat_data = expenses.values("category__name").annotate(total=Sum("amount"))
-    cat_labels = [r["category__name"] or "Uncategorized" for r in cat_data]
-    cat_values = [float(r["total"]) for r in cat_data]
-
     month_choices = [(i, calendar.month_name[i]) for i in range(1, 13)]
 
     context = {
@@ -575,81 +632,236 @@ def test_view(request):
         "selected_year": selected_year,
         "selected_month": selected_month,
         "selected_category": selected_category,
-
-        # ✅ JSON STRINGS (VALID JS)
-        "labels_json": json.dumps(labels),
-        "values_json": json.dumps(values),
-        "category_labels_json": json.dumps(cat_labels),
-        "category_values_json": json.dumps(cat_values),
+        "parquet_available": exports.parquet_available(),
     }
 
     return render(request, "ledger/test.html", context)
 
+@require_http_methods(["GET", "HEAD"])
+@login_required
+def charts_api(request):
+    """Subcategory and category breakdowns for the Visualize page as JSON.
+
+    Accepts year, month and category ('all' or an id). Responses carry an
+    ETag so unchanged data is answered with 304.
+    """
+    selected_year, selected_month, selected_category = _chart_filters(request.GET, date.today())
+    data = chart_data(
+        request.user.pk,
+        get_taxonomy(),
+        *periods.month_bounds(selected_year, selected_month),
+        category_id=None if selected_category == "all" else int(selected_category),
+    )
+    data.update({
+        "year": selected_year,
+        "month": selected_month,
+        "category": selected_category,
+    })
+
+    body = json.dumps(data, separators=(",", ":"))
+    etag = quote_etag(hashlib.sha1(body.encode("utf-8")).hexdigest()[:20])
+    if etag in parse_etags(request.headers.get("If-None-Match", "")):
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(body, content_type="application/json")
+    response["ETag"] = etag
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+# Browser cache lifetime for /api/taxonomy/?v=<current content ETag>
+TAXONOMY_MAX_AGE = 24 * 60 * 60
+
+@require_http_methods(["GET", "HEAD"])
+@login_required
+def taxonomy_api(request):
+    """Global categories/subcategories as compact JSON with a strong ETag.
+
+    Pages link to it with ?v=<content ETag>, so a URL always names the same
+    content and a matching one can be cached by the browser; anything else
+    must revalidate with If-None-Match.
+    """
+    taxonomy = get_taxonomy()
+    etag = quote_etag(taxonomy.etag)
+    max_age = TAXONOMY_MAX_AGE if request.GET.get('v') == taxonomy.etag else 0
+
+    if etag in parse_etags(request.headers.get('If-None-Match', '')):
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(taxonomy.as_json(), content_type='application/json')
+    response['ETag'] = etag
+    patch_cache_control(response, private=True, max_age=max_age)
+    return response
+
 def health(request):
     # Must be super lightweight; no DB, no cache misses, no auth
     return HttpResponse("ok", content_type="text/plain")
 
+@login_required
+def perf_stats(request):
+    """
+    p50/p95/p99 of the timings RequestTimingMiddleware recorded in this
+    process, per URL name (see ledger.instrumentation). Staff only.
+    """
+    if not request.user.is_staff:
+        raise PermissionDenied
+    response = JsonResponse({
+        'pid': os.getpid(),
+        'samples_per_url': instrumentation.stats.size,
+        'urls': instrumentation.stats.summary(),
+    })
+    response['Cache-Control'] = 'no-store'
+    return response
+
 # Set up logging
 logger = logging.getLogger(__name__)
 
 @login_required
 def export_expenses_csv(request):
-    """Export filtered expenses as CSV with columns: date, category, subcategory, amount, description.
+    """Stream filtered expenses with columns: date, category, subcategory, amount, description.
 
-    Accepts GET params: year, month, category (category id or 'all').
+    Accepts GET params: year with month (1-12 or 'all'), or start/end
+    (inclusive YYYY-MM-DD, may span years), plus category (id or 'all') and
+    format (csv, the default, ndjson, xlsx or parquet).
     """
-    today = date.today()
+    fmt = request.GET.get('format', 'csv')
+    formats = exports.available_formats()
+    if fmt not in formats:
+        return HttpResponseBadRequest(f"format must be one of: {', '.join(formats)}.")
     try:
-        year = int(request.GET.get('year', today.year))
-    except (TypeError, ValueError):
-        year = today.year
-
-    try:
-        month = int(request.GET.get('month', today.month))
-    except (TypeError, ValueError):
-        month = today.month
-
-    category = request.GET.get('category', 'all')
-
-    qs = Expense.objects.filter(user=request.user, date__year=year, date__month=month).order_by('date')
-    if category and category != 'all':
-        try:
-            cat_id = int(category)
-            qs = qs.filter(category_id=cat_id)
-        except ValueError:
-            pass
-
-    # Build CSV response
-    filename = f"expenses_{request.user.id}_{year}_{month}.csv"
-    response = HttpResponse(content_type='text/csv')
+        start, end, category_id, label = exports.parse_export_params(request.GET, date.today())
+    except ValueError as e:
+        return HttpResponseBadRequest(str(e))
+
+    rows = exports.export_rows(request.user.pk, start, end, category_id)
+    content_type, ext = exports.FORMATS[fmt]
+    filename = f"expenses_{request.user.id}_{label}{ext}"
+    response = StreamingHttpResponse(exports.stream(fmt, rows), content_type=content_type)
     response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
 
-    writer = csv.writer(response)
-    writer.writerow(['date', 'category', 'subcategory', 'amount', 'description'])
+def _export_job_json(job):
+    data = {
+        'id': job.pk,
+        'format': job.format,
+        'status': job.status,
+        'progress': job.progress,
+        'rows_total': job.rows_total,
+        'rows_written': job.rows_written,
+        'created_at': job.created_at.isoformat(),
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+        'status_url': reverse('export_job_status', args=[job.pk]),
+    }
+    if job.status == ExportJob.STATUS_DONE:
+        data['download_url'] = reverse('export_job_download', args=[job.pk])
+        data['size'] = job.size
+    if job.status == ExportJob.STATUS_FAILED:
+        data['error'] = job.error
+    return data
 
-    for e in qs:
-        category_name = e.category.name if e.category else ''
-        subcategory_name = e.subcategory.name if e.subcategory else ''
-        writer.writerow([
-            e.date.isoformat(),
-            category_name,
-            subcategory_name,
-            str(e.amount),
-            e.description or '',
-        ])
+@login_required
+@require_POST
+def export_job_create(request):
+    """Queue a background export. Accepts the same filters as export_expenses_csv plus `format`."""
+    fmt = request.POST.get('format', 'csv')
+    formats = exports.available_formats()
+    if fmt not in formats:
+        return HttpResponseBadRequest(f"format must be one of: {', '.join(formats)}.")
+    try:
+        start, end, category_id, label = exports.parse_export_params(request.POST, date.today())
+    except ValueError as e:
+        return HttpResponseBadRequest(str(e))
+    if jobs.active_count(request.user) >= getattr(settings, 'EXPORT_JOB_MAX_ACTIVE', 3):
+        return JsonResponse({'error': 'Too many exports in progress; wait for one to finish.'}, status=429)
 
+    job = jobs.create(request.user, fmt, start, end, category_id, label)
+    return JsonResponse(_export_job_json(job), status=202)
+
+@login_required
+def export_job_status(request, pk):
+    job = get_object_or_404(ExportJob, pk=pk, user=request.user)
+    response = JsonResponse(_export_job_json(job))
+    patch_cache_control(response, private=True, no_cache=True)
     return response
-    return response
+
+@login_required
+def export_job_download(request, pk):
+    job = get_object_or_404(ExportJob, pk=pk, user=request.user, status=ExportJob.STATUS_DONE)
+    try:
+        fileobj = open(jobs.artifact_path(job), 'rb')
+    except FileNotFoundError:
+        raise Http404("Export file is no longer available.")
+    return FileResponse(fileobj, as_attachment=True, filename=jobs.filename(job))
 
 # Set up logging
 logger = logging.getLogger(__name__)
 
+@require_http_methods(["GET", "HEAD"])
+@login_required
+def backup_download(request):
+    """Stream the user's full backup (gzip NDJSON, see ledger.backups).
+
+    `after` (a cursor from the last complete page received) continues an
+    interrupted download; append the response to the partial file.
+    """
+    after = request.GET.get('after')
+    if after:
+        try:
+            after = backups.parse_cursor(after)
+        except ValueError as e:
+            return HttpResponseBadRequest(str(e))
+    else:
+        after = None
+    response = StreamingHttpResponse(
+        backups.backup_stream(request.user, after=after), content_type='application/gzip',
+    )
+    filename = f"expenses_backup_{request.user.id}_{date.today().isoformat()}.ndjson.gz"
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response['Cache-Control'] = 'no-store'
+    return response
+
 @login_required
 def keepalive(request):
     # Simply touch the session; Idle middleware will update last_activity
     # Return remaining time if you want to show a countdown
     return JsonResponse({"status": "ok"})
 
+@require_http_methods(["GET", "POST"])
+def heartbeat(request):
+    """
+    Idle-time heartbeat for the base.html countdown, answered from the signed
+    activity cookie (see ledger.activity) without loading the user.
+
+    GET reports the seconds of idle time left. POST records activity in the
+    cookie; like IdleSessionTimeoutMiddleware, it only loads and extends the
+    session once the session's value is SESSION_ACTIVITY_GRANULARITY seconds
+    old. 401 means the session has ended or timed out.
+    """
+    now = time.time()
+    token = request.COOKIES.get(activity.cookie_name())
+    # session_key comes from the cookie; reading it does not load the session
+    state = activity.read(token, request.session.session_key)
+    if state is not None and request.method == "POST" and activity.remaining(state.last_activity, now):
+        stored = state.stored
+        if now - stored >= activity.granularity():
+            if str(request.session.get(SESSION_KEY)) != state.user_id:
+                state = None
+            else:
+                stored = request.session["last_activity"] = int(now)
+        if state is not None:
+            state = state._replace(last_activity=int(now), stored=stored)
+            token = activity.issue(state.user_id, request.session.session_key, now, stored)
+
+    if state is None or not activity.remaining(state.last_activity, now):
+        response = JsonResponse({"status": "expired", "remaining": 0}, status=401)
+        if token:
+            activity.delete_cookie(response)
+    else:
+        response = JsonResponse({"status": "ok", "remaining": activity.remaining(state.last_activity, now)})
+        if token != request.COOKIES.get(activity.cookie_name()):
+            activity.set_cookie(response, token)
+    response['Cache-Control'] = 'no-store'
+    return response
+
 User = get_user_model()
 
 @require_POST
@@ -0,0 +1,230 @@
+"""
+Write-only, streaming .xlsx writer.
+
+An .xlsx file is a zip of XML parts. `stream_xlsx()` deflates the worksheet
+row by row into a zip written to a non-seekable sink (entries use data
+descriptors and ZIP64 sizes, so a sheet may pass 4 GiB), yielding compressed
+bytes as they are produced, and writes the small fixed parts last. Strings
+are stored inline rather than in a shared string table, so nothing grows
+with the row count: memory stays bounded and the response can start before
+the last row is read. Rows beyond Excel's MAX_ROWS per sheet continue on
+another sheet with the same header.
+"""
+import re
+import zipfile
+from itertools import chain, islice
+from datetime import date, datetime
+from decimal import Decimal
+from xml.sax.saxutils import escape
+
+_EXCEL_EPOCH = date(1899, 12, 30)
+
+# Rows per worksheet Excel will open, header included
+MAX_ROWS = 1_048_576
+
+# Characters XML 1.0 does not allow, even escaped
+_ILLEGAL_XML = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+# Cell style indexes into cellXfs in _STYLES
+_STYLE_DATE = 1
+_STYLE_AMOUNT = 2
+
+_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '{sheets}'
+    '<Override PartName="/xl/styles.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+    '</Types>'
+)
+
+_SHEET_CONTENT_TYPE = (
+    '<Override PartName="/xl/worksheets/sheet{number}.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+)
+
+_ROOT_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+    'Target="xl/workbook.xml"/>'
+    '</Relationships>'
+)
+
+_WORKBOOK = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+    '<sheets>{sheets}</sheets>'
+    '</workbook>'
+)
+
+_WORKBOOK_SHEET = '<sheet name="{name}" sheetId="{number}" r:id="rId{number}"/>'
+
+_WORKBOOK_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '{sheets}'
+    '<Relationship Id="rId{styles}" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" '
+    'Target="styles.xml"/>'
+    '</Relationships>'
+)
+
+_SHEET_REL = (
+    '<Relationship Id="rId{number}" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+    'Target="worksheets/sheet{number}.xml"/>'
+)
+
+# Default style, then built-in number formats 14 (short date) and 4 (#,##0.00)
+_STYLES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+    '<fonts count="2"><font><sz val="11"/><name val="Calibri"/></font>'
+    '<font><b/><sz val="11"/><name val="Calibri"/></font></fonts>'
+    '<fills count="2"><fill><patternFill patternType="none"/></fill>'
+    '<fill><patternFill patternType="gray125"/></fill></fills>'
+    '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+    '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+    '<cellXfs count="4">'
+    '<xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+    '<xf numFmtId="14" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/>'
+    '<xf numFmtId="4" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/>'
+    '<xf numFmtId="0" fontId="1" fillId="0" borderId="0" xfId="0" applyFont="1"/>'
+    '</cellXfs>'
+    '<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>'
+    '</styleSheet>'
+)
+_STYLE_HEADER = 3
+
+_SHEET_HEAD = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+    '<sheetViews><sheetView workbookViewId="0">'
+    '<pane ySplit="1" topLeftCell="A2" activePane="bottomLeft" state="frozen"/>'
+    '</sheetView></sheetViews>'
+    '<sheetData>'
+)
+_SHEET_TAIL = '</sheetData></worksheet>'
+
+
+class StreamSink:
+    """
+    Write-only file object that collects bytes until drained.
+
+    It reports tell() but cannot seek, so zipfile and pyarrow write
+    sequentially into it and callers hand the output on chunk by chunk.
+    """
+
+    closed = False
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _column(index):
+    letters = ''
+    index += 1
+    while index:
+        index, rem = divmod(index - 1, 26)
+        letters = chr(65 + rem) + letters
+    return letters
+
+
+def _cell(ref, value, style=0):
+    if value is None or value == '':
+        return ''
+    if isinstance(value, datetime):
+        value = value.date()
+    if isinstance(value, date):
+        return f'<c r="{ref}" s="{_STYLE_DATE}"><v>{(value - _EXCEL_EPOCH).days}</v></c>'
+    if isinstance(value, bool):
+        return f'<c r="{ref}" t="b"><v>{int(value)}</v></c>'
+    if isinstance(value, Decimal):
+        return f'<c r="{ref}" s="{_STYLE_AMOUNT}"><v>{value}</v></c>'
+    if isinstance(value, (int, float)):
+        return f'<c r="{ref}"><v>{value!r}</v></c>'
+    text = escape(_ILLEGAL_XML.sub('', str(value)))
+    style_attr = f' s="{style}"' if style else ''
+    return f'<c r="{ref}" t="inlineStr"{style_attr}><is><t xml:space="preserve">{text}</t></is></c>'
+
+
+def _row(number, values, columns, style=0):
+    cells = ''.join(_cell(f'{col}{number}', value, style) for col, value in zip(columns, values))
+    return f'<row r="{number}">{cells}</row>'
+
+
+def _sheet_name(base, number):
+    if number == 1:
+        return base[:31]
+    suffix = f' ({number})'
+    return base[:31 - len(suffix)] + suffix
+
+
+def stream_xlsx(header, rows, sheet_name='Sheet1', flush_every=500, max_rows=MAX_ROWS):
+    """
+    Yield the bytes of a workbook with a bold, frozen `header` row followed
+    by `rows` (sequences of str/date/Decimal/int/float/None). Every
+    `max_rows - 1` rows start a new sheet, named "<sheet_name> (2)" and so on.
+    """
+    columns = [_column(i) for i in range(len(header))]
+    sink = StreamSink()
+    rows = iter(rows)
+    sheet_rows = islice(rows, max_rows - 1)
+    sheets = 0
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        while True:
+            sheets += 1
+            # Size unknown up front: ZIP64 headers so it may grow past 4 GiB
+            with archive.open(f'xl/worksheets/sheet{sheets}.xml', 'w', force_zip64=True) as sheet:
+                pending = [_SHEET_HEAD, _row(1, header, columns, _STYLE_HEADER)]
+                for number, values in enumerate(sheet_rows, start=2):
+                    pending.append(_row(number, values, columns))
+                    if len(pending) >= flush_every:
+                        sheet.write(''.join(pending).encode('utf-8'))
+                        pending.clear()
+                        yield sink.drain()
+                pending.append(_SHEET_TAIL)
+                sheet.write(''.join(pending).encode('utf-8'))
+            yield sink.drain()
+            following = next(rows, None)
+            if following is None:
+                break
+            sheet_rows = chain([following], islice(rows, max_rows - 2))
+
+        numbers = range(1, sheets + 1)
+        archive.writestr('[Content_Types].xml', _CONTENT_TYPES.format(
+            sheets=''.join(_SHEET_CONTENT_TYPE.format(number=n) for n in numbers),
+        ))
+        archive.writestr('_rels/.rels', _ROOT_RELS)
+        archive.writestr('xl/workbook.xml', _WORKBOOK.format(sheets=''.join(
+            _WORKBOOK_SHEET.format(name=escape(_sheet_name(sheet_name, n)), number=n) for n in numbers
+        )))
+        archive.writestr('xl/_rels/workbook.xml.rels', _WORKBOOK_RELS.format(
+            sheets=''.join(_SHEET_REL.format(number=n) for n in numbers), styles=sheets + 1,
+        ))
+        archive.writestr('xl/styles.xml', _STYLES)
+    yield sink.drain()